@@ -4,7 +4,10 @@ import pandas as pd
 from urllib.parse import urlparse
 
 import dashboard_utils
+import export
+import jobs
 import utils
+import zipped_csv
 from init import clear_defaults
 import openpolicedata as opd
 
@@ -12,13 +15,22 @@ load_failure = False
 selection = {}
 
 # These datasets cause Streamlit Cloud to throw an error and for the app to crash and need to be rebooted. Do not downloads for these and display message.
+# Zipped CSV files are extracted to disk but st.download_button still reads the whole file into memory to serve it.
 too_big_datasets = ['https://stacks.stanford.edu/file/druid:yg821jf8611/yg821jf8611_fl_statewide_2020_04_01.csv.zip']
 
 logger = st.session_state['logger']
 
+def set_csv_text_output(data):
+    # Previously loaded data that is served from a file is closed so that its dataset cache entry can be evicted
+    prev = st.session_state.get('csv_text_output')
+    if hasattr(prev, 'close'):
+        prev.close()
+    st.session_state['csv_text_output'] = data
+
 now = datetime.now()
 
 data_catalog = st.session_state['data_catalog']
+index = st.session_state['catalog_index']
 
 st.subheader('Selected Dataset Details')
 
@@ -28,7 +40,7 @@ defaults = st.session_state['default']['download']
 with st.sidebar:
     st.header('Dataset Filters')
 
-    states = data_catalog['State'].unique()
+    states = index.options()
     default_state = dashboard_utils.get_default('state', states, defaults)
     selectbox_states = st.selectbox('States', states, 
                                     index=default_state,
@@ -36,9 +48,8 @@ with st.sidebar:
                                     args=['download', 'state'],
                                     help="Select a state to filter by. MULTIPLE indicates datasets that contain more than 1 state's data")
     logger.debug(f"Selected State: {selectbox_states}")
-    selected_rows = data_catalog[data_catalog['State']==selectbox_states]
 
-    sources = selected_rows['SourceName'].unique()
+    sources = index.options(selectbox_states)
     default_source = dashboard_utils.get_default('source', sources, defaults)
     selectbox_sources = st.selectbox('Sources', sources, 
                                      index=default_source,
@@ -48,10 +59,7 @@ with st.sidebar:
                                      "or a state (if data is for all agencies in a state))")
     logger.debug(f"Selected Source: {selectbox_sources}")
 
-    selected_rows = selected_rows[selected_rows['SourceName']==selectbox_sources]
-
-    table_types = selected_rows['TableType'].unique()
-    table_type_general, table_type_general_sort, table_types_sub = utils.split_tables(table_types)
+    table_type_general_sort = sorted(index.options(selectbox_states, selectbox_sources))
 
     default_table_type_general = dashboard_utils.get_default('table_type_general', table_type_general_sort, defaults)
     selectbox_table_types = st.selectbox('Table Types', table_type_general_sort, 
@@ -64,13 +72,9 @@ with st.sidebar:
                                          "An incident ID could appear in both tables allowing the user to identify all persons involved in a particular incident.")
     logger.debug(f"Selected table type: {selectbox_table_types}")
 
-    # Reduces lists based on selection
-    m = [x==selectbox_table_types for x in table_type_general]  # Matches
-    table_types = [x for k,x in enumerate(table_types) if m[k]]
-    table_type_general = [x for k,x in enumerate(table_type_general) if m[k]]
-    table_types_sub = [x for k,x in enumerate(table_types_sub) if m[k]]
-
-    selected_rows = selected_rows[selected_rows['TableType'].isin(table_types)]
+    # Sub-tables of selected table type. None if table type is not split into sub-tables
+    table_types_sub = index.options(selectbox_states, selectbox_sources, selectbox_table_types)
+    table_types = [utils.join_tables(selectbox_table_types, x) for x in table_types_sub]
 
     related_tables = None
     if all([x is not None for x in table_types_sub]):
@@ -81,17 +85,18 @@ with st.sidebar:
                                 index=default_table_type_sub,
                                 on_change=clear_defaults,
                                 args=['download', 'table_type_sub'],
-                                help=f'The {table_type_general[0]} dataset is split into the following tables that all may be of interest: '+
+                                help=f'The {selectbox_table_types} dataset is split into the following tables that all may be of interest: '+
                                 f'{table_types_sub}. They likely use unique IDs to enable finding related data across tables.')
         logger.debug(f"Selected table subtype: {selectbox_subtype}")
 
-        selection['table'] = [x for x,y in zip(table_types, table_types_sub) if y==selectbox_subtype][0]
+        selection['table'] = utils.join_tables(selectbox_table_types, selectbox_subtype)
         related_tables = [x for x,y in zip(table_types, table_types_sub) if y!=selectbox_subtype]
-        selected_rows = selected_rows[selected_rows['TableType']==selection['table']]
+        table_path = [selectbox_states, selectbox_sources, selectbox_table_types, selectbox_subtype]
     else:
         selection['table'] = table_types[0]
+        table_path = [selectbox_states, selectbox_sources, selectbox_table_types, utils.ALL]
 
-    all_agencies_for_source = selected_rows['Agency'].unique()
+    all_agencies_for_source = index.options(*table_path)
     if len(all_agencies_for_source)>1:
         # The data source table contains multiple agency options for this source
         # Usually, this occurs for counties where there is data for the county agency, 
@@ -102,16 +107,20 @@ with st.sidebar:
                                     on_change=clear_defaults,
                                     args=['download', 'agency'],
                                     help='Select an agency (MULTIPLE indicates multiple agencies within the limits of the source location)')
-        selected_rows = selected_rows[selected_rows['Agency'].isin(
-            [selected_agency])]
     else:
         selected_agency = all_agencies_for_source[0]
-
-    try:
-        years = dashboard_utils.get_years(selectbox_sources, selectbox_states, selection['table'], selected_agency)
-    except:
-        logger.exception(f"Failed to get years for {selectbox_sources=}, {selectbox_states=}, {selection['table']=}, {selected_agency=}")
-        load_failure = True
+    agency_path = [*table_path, selected_agency]
+    selected_rows = index.select(data_catalog, *agency_path)
+
+    # Years of datasets that are each for a single year are in the catalog. Other years require a request to the dataset.
+    years = dashboard_utils.get_catalog_years(selected_rows)
+    if years is None:
+        try:
+            years = dashboard_utils.get_years(selectbox_sources, selectbox_states, selection['table'], selected_agency,
+                                              catalog_version=data_catalog.attrs.get('version'))
+        except:
+            logger.exception(f"Failed to get years for {selectbox_sources=}, {selectbox_states=}, {selection['table']=}, {selected_agency=}")
+            load_failure = True
 
     if not load_failure:
         load_file =  len(selected_rows) == 1 and selected_rows.iloc[0]["DataType"] not in utils.API_DATA_TYPES and \
@@ -136,10 +145,9 @@ with st.sidebar:
         selectbox_coverage = None
         selection['year'] = selectbox_years if selectbox_years!=utils.NA_DISPLAY_VALUE else opd.defs.NA  # Revert NA_DISPLAY_VALUE to NA if applicable
         selection['year'] = int(selection['year']) if selection['year'].isdigit() else selection['year']
-        matches = selected_rows['Year'] == selection['year']
-        if matches.any():
+        if selection['year'] in index.options(*agency_path):
             # Year is a single year or NA
-            selected_rows = selected_rows[matches]
+            selected_rows = index.select(data_catalog, *agency_path, selection['year'])
         else:
             # Year is multi
             if load_file:
@@ -147,7 +155,7 @@ with st.sidebar:
                 orig_year = selection['year']
                 selection['year'] = opd.defs.MULTI
                 
-            selected_rows = selected_rows[selected_rows['Year']==opd.defs.MULTI]
+            selected_rows = index.select(data_catalog, *agency_path, opd.defs.MULTI)
             if len(selected_rows)>1:
                 logger.debug("More than one datasets with Year=MULTIPLE")
 
@@ -193,7 +201,8 @@ with st.sidebar:
         if selected_rows.iloc[0]["Agency"]==opd.defs.MULTI and selected_rows.iloc[0]["DataType"] in utils.API_DATA_TYPES:
             try:
                 agencies = dashboard_utils.get_agencies(selectbox_sources, selectbox_states, selection['table'], selected_rows.iloc[0]["Year"], selected_agency,
-                                        selected_rows.iloc[0]["URL"], selected_rows.iloc[0]["dataset_id"])
+                                        selected_rows.iloc[0]["URL"], selected_rows.iloc[0]["dataset_id"],
+                                        catalog_version=data_catalog.attrs.get('version'))
             except:
                 logger.exception('')
                 load_failure = True
@@ -245,9 +254,11 @@ else:
     if st.session_state['last_selection'] != new_selection:
         # New selection. Delete previously downloaded data
         logger.debug("Resetting download button")
-        st.session_state['csv_text_output'] = None
+        set_csv_text_output(None)
         st.session_state['preview'] = []
         st.session_state['last_selection'] = new_selection
+        # Stop loading data for the previous selection
+        jobs.cancel(st.session_state['jobs'])
 
     selection['agency'] = None
     agency_name = selected_rows.iloc[0]["Agency"]
@@ -272,6 +283,8 @@ else:
         can_load_partial = utils.test_partial_load(selected_rows)
         if not can_load_partial:
             st.caption('Partial load of this dataset is not possible so previewing data will load entire dataset. User may want to just download the data to view contents.')
+        elif selected_rows.iloc[0]['URL'].endswith('.zip') and zipped_csv.supports_ranges(selected_rows.iloc[0]['URL']) is None:
+            st.caption('Partial load of this dataset may not be possible. If the source website does not support it, previewing data will load entire dataset.')
 
         col0, col3 = st.columns(2, width=500, vertical_alignment='center', gap='large')
         st.markdown("**NOTE**: Download from source website may be slow. User can continue using the dashboard while data downloads in background.")
@@ -282,11 +295,32 @@ else:
         with col1:
             nrows = st.number_input('Preview Rows', min_value=1, value=20, format="%d")
 
+        scheduler = jobs.get_scheduler()
+        session_jobs = st.session_state['jobs']
         if col2.button('Preview', disabled=prev_disabled):
-            with st.empty(): # This is used to replace the spinner after it is no longer needed
-                st.session_state['csv_text_output'], st.session_state['preview'], load_failure = dashboard_utils.load(selected_rows, selection, nrows)
+            if jobs.PREVIEW in session_jobs:
+                session_jobs[jobs.PREVIEW].cancel()
+            session_jobs[jobs.PREVIEW] = scheduler.submit(
+                lambda job: dashboard_utils.load(selected_rows, selection, nrows, logger=logger, use_streamlit=False, progress=job.update),
+                kind=jobs.PREVIEW)
+
+        if jobs.PREVIEW in session_jobs:
+            # Preview is loaded in the background so that it continues if the page is rerun (i.e. if the user
+            # changes a widget while waiting). Poll the job until it finishes.
+            job = session_jobs[jobs.PREVIEW]
+            with st.empty(): # This is used to replace the progress bar after it is no longer needed
+                while not job.wait(0.25):
+                    st.progress(job.fraction(), text=job.status())
+                st.empty()
+
+                del session_jobs[jobs.PREVIEW]
+                if job.state==jobs.DONE:
+                    csv_text_output, st.session_state['preview'], load_failure = job.result
+                    set_csv_text_output(csv_text_output)
+                else:
+                    load_failure = True
 
-                # Log and replace spinner
+                # Log and replace progress bar
                 if load_failure:
                     st.error(failure_msg)
                 elif len(st.session_state['preview'])>0:
@@ -298,21 +332,72 @@ else:
         csv_filename = opd.data.get_csv_filename(selected_rows.iloc[0]["State"], selected_rows.iloc[0]["SourceName"], 
                                                     agency_name , selected_rows.iloc[0]["TableType"], orig_year if load_file else selection['year'])
         
+        fmt = col3.selectbox('Format', export.FORMATS.keys(), 
+                             help='Compressed CSV files (gzip or zstd) are smaller and faster to download. '+
+                             'Parquet and Feather files are compressed and keep column data types. They can be loaded with pandas (read_parquet or read_feather).')
+        
+        def load_download(job):
+            # Stream API data to a file batch-by-batch to limit memory usage
+            data, _, load_failure = dashboard_utils.load(selected_rows, selection, logger=logger, use_streamlit=False, stream=True, fmt=fmt,
+                                                         progress=job.update)
+            if load_failure:
+                raise ValueError(failure_msg)
+            # Files are kept open so that they are not removed from the dataset cache before they are downloaded.
+            # They are closed when the job is cancelled.
+            logger.info('Download complete!!!!!')
+            return data
+
         csv_text_output = st.session_state['csv_text_output']
-        def download():
-            if not csv_text_output:
-                csv_data, _, load_failure = dashboard_utils.load(selected_rows, selection, logger=logger, use_streamlit=False)
-                if load_failure:
-                    raise ValueError(failure_msg)
-            else:
-                csv_data = csv_text_output
+        download_job = session_jobs.get(jobs.DOWNLOAD)
+        if csv_text_output and fmt=='CSV':
+            # Previewed data is the full dataset
+            def download():
                 logger.info(f"Downloading previewed data : {selected_rows.iloc[0]['URL']}, {selected_rows.iloc[0]['dataset_id']}, "+\
                             f'{selected_rows.iloc[0]["SourceName"]}, {selected_rows.iloc[0]["State"]}, {selected_rows.iloc[0]["Agency"]}')
-
-            logger.info('Download complete!!!!!')
-            return csv_data
-        
-        col3.download_button('Download CSV', data=download , file_name=csv_filename, mime='text/csv')
+                logger.info('Download complete!!!!!')
+                return csv_text_output
+            
+            col3.download_button(f'Download {fmt}', data=download, file_name=export.get_filename(csv_filename, fmt), mime=export.FORMATS[fmt]['mime'])
+        else:
+            # Year and agency can change without changing the URL
+            download_key = (fmt, selection['year'], selection['agency'])
+            if download_job is not None and download_job.key!=download_key:
+                # Format or selection changed so data loaded for the previous format or selection is not needed
+                download_job.cancel()
+                del session_jobs[jobs.DOWNLOAD]
+                download_job = None
+
+            # Data is loaded in the background and the download button is enabled once it has been loaded
+            if download_job is None or download_job.state in [jobs.FAILED, jobs.CANCELLED]:
+                if col3.button(f'Load {fmt}', help='Load the full dataset for download. You can keep using the dashboard while it loads.'):
+                    download_job = session_jobs[jobs.DOWNLOAD] = scheduler.submit(load_download, kind=jobs.DOWNLOAD, key=download_key)
+
+            job_result = download_job.result if download_job is not None and download_job.state==jobs.DONE else None
+            def download():
+                if not isinstance(job_result, bytes):
+                    # Data is served from the file loaded by the job
+                    job_result.seek(0)
+                return job_result
+
+            col3.download_button(f'Download {fmt}', data=download, file_name=export.get_filename(csv_filename, fmt), mime=export.FORMATS[fmt]['mime'],
+                                 disabled=job_result is None)
+
+        is_downloading = download_job is not None and not download_job.done
+        @st.fragment(run_every=1 if is_downloading else None)
+        def show_download_progress():
+            # Reruns every second while a download is in progress so that the user can keep using the page
+            if download_job is None:
+                return
+            if not download_job.done:
+                st.progress(download_job.fraction(), text=download_job.status())
+            elif is_downloading:
+                # Rerun page to stop polling and enable the download button
+                st.rerun()
+            elif download_job.state==jobs.FAILED:
+                st.error(failure_msg)
+
+        with col3:
+            show_download_progress()
 
     if len(st.session_state['preview'])>0:
         st.divider()
@@ -1,22 +1,27 @@
 import openpolicedata as opd
 import streamlit as st
-import requests
 import pandas as pd
 
 import utils
 from init import clear_defaults
 import dashboard_utils
+import npi
 
 st.html('<b>Filter for Dataset</b> <span style="color:red">⇨</span> <b>Click Row Checkbox</b> <span style="color:red">⇨</span> <b>Go to Selected Dataset</b>')
 
 data_catalog = st.session_state["data_catalog"]
-selection = data_catalog
+index = st.session_state["catalog_index"]
+search = st.session_state["catalog_search"]
+display_catalog = st.session_state["display_catalog"]
 
 defaults = st.session_state['default']['datasets']
 
 with st.sidebar:
     st.header('Dataset Filters')
-    options = data_catalog['State'].unique()
+    search_query = st.text_input('Search', key='search_datasets', placeholder='e.g. Fairfax use of force',
+                                 help='Search sources, agencies, states, table types, and descriptions. Results are sorted by relevance.')
+
+    options = index.options()
     options_all = [utils.ALL]
     options_all.extend(options)
     default_state = dashboard_utils.get_default('state', options_all, defaults)
@@ -25,11 +30,8 @@ with st.sidebar:
                                     on_change=clear_defaults,
                                     args=['datasets', 'state'],
                                     help="Select a state to filter by. MULTIPLE indicates datasets that contain more than 1 state's data")
-    
-    if selectbox_states!=utils.ALL:
-        selection = selection[selection['State']==selectbox_states]
 
-    options = selection['SourceName'].unique()
+    options = index.options(selectbox_states)
     options_all = [utils.ALL]
     options_all.extend(options)
     default_source = dashboard_utils.get_default('source', options_all, defaults)
@@ -39,12 +41,8 @@ with st.sidebar:
                                      args=['datasets', 'source'],
                                      help="Select a source (typically a police department, sheriff's office, "
                                      "or a state (if data is for all agencies in a state))")
-    
-    if selectbox_sources!=utils.ALL:
-        selection = selection[selection['SourceName']==selectbox_sources]
 
-    table_types = selection['TableType'].unique()
-    table_type_general, table_type_general_sort, _ = utils.split_tables(table_types)
+    table_type_general_sort = sorted(index.options(selectbox_states, selectbox_sources))
 
     options_all = [utils.ALL]
     options_all.extend(table_type_general_sort)
@@ -54,19 +52,16 @@ with st.sidebar:
                                          on_change=clear_defaults,
                                          args=['datasets', 'table'],
                                          help='Select a table type (such as TRAFFIC STOPS or USE OF FORCE)')
-    
-    if selectbox_table_types!=utils.ALL:
-        m = [x==selectbox_table_types for x in table_type_general]
-        table_types = [x for k,x in enumerate(table_types) if m[k]]
-        selection = selection[selection['TableType'].isin(table_types)]
 
-st.subheader('Filtered Datasets')
+    rows = index.rows(selectbox_states, selectbox_sources, selectbox_table_types)
+    if search_query.strip():
+        rows = search.rows(search_query, rows)
+    selection = data_catalog.iloc[rows]
 
-# Prevent pyarrow errors when Streamlit displays table
-selection.loc[:, 'Year'] = selection['Year'].astype(str)
-selection.loc[:, 'dataset_id'] = selection['dataset_id'].astype(str)
+st.subheader('Filtered Datasets')
 
-event = st.dataframe(data=selection,
+# Display table is converted to Arrow once per catalog version (see opd_download_page.py) so only the selected rows are taken here
+event = st.dataframe(data=display_catalog.take(rows),
                      on_select="rerun",
                      selection_mode='single-row',
                      hide_index=True,
@@ -87,38 +82,34 @@ if st.button(label, disabled=disabled):
 
         st.switch_page("1_Download_Data.py")
 
-npi_url = 'https://national.cpdp.co/'
+# Link to National Police Index for the selected state or agency if it has data
+npi_state = None
+npi_agency = None
 if selectbox_sources==utils.ALL:
     if selectbox_states!=utils.ALL and selectbox_states!=opd.defs.MULTI:
-        test_url = npi_url + 'states/' + selectbox_states.replace(' ','-')
-        r = requests.get(test_url, timeout=3)
-        try:
-            r.raise_for_status()
-            if 'placeholder="Search Data"' in r.text:
-                npi_url = test_url  # URL contains placeholders for data because data exists
-        except:
-            pass
+        npi_state = selectbox_states
 elif len(selection)>0:
     if selection['State'].nunique()==1 and selection['State'].iloc[0]!=opd.defs.MULTI and \
         selection['Agency'].nunique()==1 and selection['Agency'].iloc[0]!=opd.defs.MULTI and \
         pd.notnull(selection['AgencyFull'].iloc[0]) and len(selection['AgencyFull'].iloc[0])>0:
-        
-        test_url = npi_url + 'states/' + selection['State'].iloc[0].replace(' ','-') + '?'
-
-        # Test if state URL exists
-        r = requests.get(test_url, timeout=3)
-        try:
-            r.raise_for_status()
-            if 'placeholder="Search Data"' in r.text:
-                # There currently is no way to tell if agency URL exists. If it does not, it will go to the state URL and show no results
-                test_url += 'agency=' + selection['AgencyFull'].iloc[0].replace(' ','+')
-                npi_url = test_url  # URL contains placeholders for data because data exists
-        except:
-            pass
+        npi_state = selection['State'].iloc[0]
+        npi_agency = selection['AgencyFull'].iloc[0]
+
+_, npi_pending = npi.get_url(npi_state, npi_agency)
 
 st.subheader('Other Data Sources')
 st.markdown('[OpenPoliceData](https://openpolicedata.readthedocs.io/) recommends these additional police data sources:')
-st.markdown(f'**National Police Index** (Police Employment History): '+npi_url)
+
+@st.fragment(run_every=0.5 if npi_pending else None)
+def show_npi_url():
+    # The generic link is shown until the NPI has been checked for the state. Reruns while the check is pending.
+    url, pending = npi.get_url(npi_state, npi_agency)
+    st.markdown(f'**National Police Index** (Police Employment History): '+url)
+    if npi_pending and not pending:
+        # Rerun page to stop polling
+        st.rerun()
+
+show_npi_url()
 st.markdown('**Police Data Access Point**: https://pdap.io/')
 st.markdown('**Stanford Open Policing Project**: https://openpolicing.stanford.edu/')
 st.markdown('**Mapping Police Violence**: https://mappingpoliceviolence.us/')
@@ -0,0 +1,94 @@
+import pandas as pd
+
+import utils
+
+# Levels of the index. TableType is split into its general type and subcategory (see utils.split_tables)
+LEVELS = ['State', 'SourceName', 'TableTypeGeneral', 'TableTypeSub', 'Agency', 'Year']
+
+class _Node:
+    __slots__ = ('children', 'rows')
+    def __init__(self):
+        self.children = {}  # Insertion order is the order of the catalog
+        self.rows = []  # Positions of all catalog rows below this node
+
+
+def _dataset_key(url, dataset_id):
+    # dataset_id can be a dict or missing. Deep links contain it as a string.
+    return (url, None if not isinstance(dataset_id, (dict, list)) and pd.isnull(dataset_id) else str(dataset_id))
+
+
+class CatalogIndex:
+    '''Nested index of the data catalog (State -> Source -> Table Type -> Table Subcategory -> Agency -> Year)
+
+    Built once when the catalog is loaded so that filter options and the rows matching a selection
+    can be found with dictionary lookups instead of filtering the entire catalog.
+
+    Methods input a path of values for the levels in LEVELS starting with State. utils.ALL matches all values at a level.
+    Rows can also be found directly from their URL and dataset ID with find.
+    '''
+    def __init__(self, df):
+        table_types = df['TableType'].unique()
+        general, _, sub = utils.split_tables(list(table_types))
+        split = dict(zip(table_types, zip(general, sub)))
+
+        self._root = _Node()
+        columns = [df[c].tolist() for c in ['State', 'SourceName', 'TableType', 'Agency', 'Year']]
+        for k, (state, source, table_type, agency, year) in enumerate(zip(*columns)):
+            node = self._root
+            node.rows.append(k)
+            for key in (state, source, *split[table_type], agency, year):
+                if key not in node.children:
+                    node.children[key] = _Node()
+                node = node.children[key]
+                node.rows.append(k)
+
+        self._datasets = {}  # (URL, dataset ID) -> positions of catalog rows
+        self._urls = {}  # URL -> positions of catalog rows
+        for k, (url, dataset_id) in enumerate(zip(df['URL'].tolist(), df['dataset_id'].tolist())):
+            self._datasets.setdefault(_dataset_key(url, dataset_id), []).append(k)
+            self._urls.setdefault(url, []).append(k)
+
+
+    def _nodes(self, path):
+        nodes = [self._root]
+        for key in path:
+            if key==utils.ALL:
+                nodes = [c for n in nodes for c in n.children.values()]
+            else:
+                nodes = [n.children[key] for n in nodes if key in n.children]
+        return nodes
+
+
+    def options(self, *path):
+        '''Returns values of the level below path in catalog order'''
+        nodes = self._nodes(path)
+        if len(nodes)==1:
+            return list(nodes[0].children.keys())
+        return list(dict.fromkeys(k for n in nodes for k in n.children))
+
+
+    def rows(self, *path):
+        '''Returns positions of catalog rows matching path'''
+        # Trailing ALL values do not need to be searched since each node contains all rows below it
+        path = list(path)
+        while path and path[-1]==utils.ALL:
+            path.pop()
+
+        nodes = self._nodes(path)
+        if len(nodes)==1:
+            return nodes[0].rows
+        return sorted(r for n in nodes for r in n.rows)
+
+
+    def select(self, df, *path):
+        '''Returns rows of the catalog df matching path'''
+        return df.iloc[self.rows(*path)]
+
+
+    def find(self, url, dataset_id=None):
+        '''Returns positions of catalog rows with URL url and dataset ID dataset_id. If dataset_id is None and no rows
+        without a dataset ID have URL url, all rows with URL url are returned.'''
+        rows = self._datasets.get(_dataset_key(url, dataset_id))
+        if rows is None and dataset_id is None:
+            rows = self._urls.get(url)
+        return rows if rows else []
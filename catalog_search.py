@@ -0,0 +1,117 @@
+from collections import Counter, defaultdict
+import re
+
+import pandas as pd
+
+# Searched columns and the weight of a match in each column
+FIELDS = {
+    'SourceName':3.0,
+    'AgencyFull':2.0,
+    'State':3.0,
+    'TableType':2.0,
+    'Description':1.0,
+}
+MIN_SIMILARITY = 0.4  # Minimum trigram similarity for a word to match a misspelled query word
+PREFIX_SCORE = 0.9  # Score of a word that starts with a query word
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+def _words(text):
+    return _WORD.findall(text.lower())
+
+
+def _trigrams(word):
+    # Padding gives extra weight to the start of words, where typos are less common
+    word = f'  {word} '
+    return {word[k:k+3] for k in range(len(word)-2)}
+
+
+class CatalogSearch:
+    '''Trigram index of the data catalog for typo-tolerant search
+
+    Each word of the searched fields (see FIELDS) is indexed by its trigrams. Query words are matched to the
+    indexed words that they are equal to, a prefix of, or similar to (trigram similarity of at least MIN_SIMILARITY).
+    Rows are ranked by the sum of the best match for each query word weighted by the field the match was in.
+
+    Built once per catalog version. Results are positions of rows in the catalog.
+    '''
+    def __init__(self, df):
+        self._postings = defaultdict(dict)  # word -> {row position: field weight}
+        for field, weight in FIELDS.items():
+            if field not in df:
+                continue
+            for k, text in enumerate(df[field].tolist()):
+                if pd.isnull(text):
+                    continue
+                for word in _words(str(text)):
+                    if self._postings[word].get(k, 0) < weight:
+                        self._postings[word][k] = weight
+
+        self._trigram_index = defaultdict(list)  # trigram -> words containing it
+        self._ntrigrams = {}
+        for word in self._postings:
+            trigrams = _trigrams(word)
+            self._ntrigrams[word] = len(trigrams)
+            for t in trigrams:
+                self._trigram_index[t].append(word)
+
+
+    def _matches(self, word):
+        # Returns indexed words matching a query word and their similarity
+        trigrams = _trigrams(word)
+        shared = Counter(w for t in trigrams for w in self._trigram_index.get(t, []))
+        matches = {}
+        for w, n in shared.items():
+            if w==word:
+                matches[w] = 1.0
+            elif w.startswith(word):
+                matches[w] = PREFIX_SCORE
+            else:
+                similarity = n / (len(trigrams) + self._ntrigrams[w] - n)
+                if similarity>=MIN_SIMILARITY:
+                    matches[w] = similarity
+        return matches
+
+
+    def search(self, query, limit=None):
+        '''Returns positions of matching rows and their scores in order of decreasing score
+
+        Query words that do not match any word in the catalog are ignored. Rows must match all other query words.
+        '''
+        scores = None
+        for word in dict.fromkeys(_words(query)):
+            word_scores = {}
+            for match, similarity in self._matches(word).items():
+                for k, weight in self._postings[match].items():
+                    score = similarity*weight
+                    if score > word_scores.get(k, 0):
+                        word_scores[k] = score
+
+            if len(word_scores)==0:
+                continue
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {k:v+word_scores[k] for k,v in scores.items() if k in word_scores}
+
+        if scores is None:
+            return [], []
+
+        # Ties are kept in catalog order
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))[:limit]
+        return [k for k,_ in ranked], [v for _,v in ranked]
+
+
+    def rows(self, query, rows=None):
+        '''Returns positions of catalog rows matching query in order of relevance. If rows is provided, only
+        positions in rows are returned.'''
+        positions, _ = self.search(query)
+        if rows is not None:
+            rows = set(rows)
+            positions = [k for k in positions if k in rows]
+        return positions
+
+
+    def select(self, df, query, rows=None):
+        '''Returns rows of the catalog df matching query in order of relevance (see rows)'''
+        return df.iloc[self.rows(query, rows)]
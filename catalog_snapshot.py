@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import metadata_cache
+
+# Location of the snapshot of the most recently loaded catalog. Can be overridden with an environment variable
+SNAPSHOT_PATH = os.environ.get('OPD_EXPLORER_CATALOG_SNAPSHOT', os.path.join(tempfile.gettempdir(), 'opd_explorer_catalog.parquet'))
+REFRESH_INTERVAL = 24*60*60  # 1 day
+RETRY_INTERVAL = 5*60  # Time to wait before retrying a failed refresh
+
+# Columns that identify a row of the catalog when comparing catalogs
+KEY_COLUMNS = ['URL', 'dataset_id', 'TableType', 'Year', 'Agency']
+
+_VERSION_KEY = b'opd_explorer_version'
+_JSON_KEY = b'opd_explorer_json_columns'
+
+def _to_json(x):
+    if not isinstance(x, (dict, list)) and pd.isnull(x):
+        return None
+    return json.dumps(x, default=str)
+
+
+def save(df, path=SNAPSHOT_PATH):
+    '''Save catalog to a Parquet file. The file is written to a temporary file and then renamed so that
+    readers (including other processes) never see a partial file.
+
+    Columns that cannot be stored in Parquet (such as Year, which contains both years and strings) or that contain
+    dicts or lists are stored as JSON.
+    '''
+    df = df.reset_index(drop=True)
+    json_columns = []
+    arrays = []
+    for c in df.columns:
+        try:
+            arr = pa.Array.from_pandas(df[c])
+            # Nested values (such as dicts in dataset_id) do not keep their types when converted back to pandas
+            use_json = pa.types.is_nested(arr.type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            use_json = True
+
+        if use_json:
+            json_columns.append(c)
+            arr = pa.array([_to_json(x) for x in df[c]], type=pa.string())
+        arrays.append(arr)
+
+    tbl = pa.Table.from_arrays(arrays, names=list(df.columns))
+    tbl = tbl.replace_schema_metadata({_VERSION_KEY: str(df.attrs.get('version')), _JSON_KEY: json.dumps(json_columns)})
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory if directory else None, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pq.write_table(tbl, f)
+        os.replace(tmp, path)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def load(path=SNAPSHOT_PATH):
+    '''Load catalog saved with save. Raises OSError if the snapshot does not exist'''
+    tbl = pq.read_table(path)
+    meta = tbl.schema.metadata
+    df = tbl.to_pandas()
+    for c in json.loads(meta[_JSON_KEY]):
+        df[c] = [json.loads(x) if x is not None else None for x in df[c]]
+
+    df.attrs['version'] = meta[_VERSION_KEY].decode()
+    return df
+
+
+def _normalize(x):
+    # Missing values are stored as None or NaN depending on whether the catalog came from a snapshot
+    if not isinstance(x, (dict, list)) and pd.isnull(x):
+        return None
+    return x
+
+
+class CatalogDiff:
+    '''Row-level differences between 2 versions of the catalog. Rows are matched using KEY_COLUMNS.
+
+    added and removed are the rows that are only in the new and old catalog, respectively. modified is
+    the new version of rows whose other columns changed. datasets is the metadata_cache.dataset_key of
+    each dataset with an added, removed, or modified row.
+    '''
+    def __init__(self, old, new):
+        old_rows = self._rows(old)
+        new_rows = self._rows(new)
+
+        added = [k for key, rows in new_rows.items() if key not in old_rows for _, k in rows]
+        removed = [k for key, rows in old_rows.items() if key not in new_rows for _, k in rows]
+        modified_new = []
+        modified_old = []
+        for key in new_rows.keys() & old_rows.keys():
+            if sorted(x for x,_ in new_rows[key])!=sorted(x for x,_ in old_rows[key]):
+                modified_new.extend(k for _,k in new_rows[key])
+                modified_old.extend(k for _,k in old_rows[key])
+
+        self.added = new.iloc[sorted(added)]
+        self.removed = old.iloc[sorted(removed)]
+        self.modified = new.iloc[sorted(modified_new)]
+        self.datasets = {metadata_cache.dataset_key(*x) for df in [self.added, self.removed, self.modified, old.iloc[modified_old]]
+                         for x in zip(df['SourceName'], df['State'], df['TableType'], df['Agency'])}
+
+
+    @staticmethod
+    def _rows(df):
+        # Returns the row contents and positions of each key
+        columns = list(df.columns)
+        key_index = [columns.index(c) for c in KEY_COLUMNS]
+        rows = {}
+        for k, values in enumerate(zip(*[df[c].tolist() for c in columns])):
+            values = tuple(_normalize(x) for x in values)
+            key = repr(tuple(values[j] for j in key_index))
+            rows.setdefault(key, []).append((repr(values), k))
+        return rows
+
+
+    def __len__(self):
+        return len(self.added) + len(self.removed) + len(self.modified)
+
+
+    def __str__(self):
+        return f"{len(self.added)} rows added, {len(self.removed)} rows removed, {len(self.modified)} rows modified, " + \
+            f"{len(self.datasets)} datasets changed"
+
+
+class CatalogStore:
+    '''Provides the data catalog without blocking on the catalog host
+
+    The 1st request is served from the snapshot saved by the last load if it exists. The catalog is then
+    refreshed in a background thread and swapped in once it has loaded. If there is no snapshot, the catalog
+    is loaded before returning.
+
+    load_catalog is a function that returns the catalog. It inputs whether the catalog should be reloaded from
+    its host (it is False for the 1st load since openpolicedata loads the catalog when it is imported).
+    on_change is called with the old catalog, the new catalog, and their CatalogDiff when a refresh changes
+    the catalog version.
+    '''
+    def __init__(self, load_catalog, path=SNAPSHOT_PATH, refresh_interval=REFRESH_INTERVAL, on_change=None, logger=None):
+        self.load_catalog = load_catalog
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.on_change = on_change
+        self.logger = logger if logger else logging.getLogger('opd-app')
+        self._df = None
+        self._loaded_at = 0  # Time of last load from the catalog host
+        self._nloads = 0  # Number of attempted loads from the catalog host
+        self._refresh_thread = None
+        self._lock = threading.Lock()
+
+
+    def get(self):
+        with self._lock:
+            if self._df is None:
+                try:
+                    self._df = load(self.path)
+                    self.logger.info(f"Loaded catalog snapshot (version {self._df.attrs['version']})")
+                except Exception as e:
+                    self.logger.info(f"Unable to load catalog snapshot. Loading catalog: {e}")
+                    self._df = self._load()
+
+            if time.time() - self._loaded_at > self.refresh_interval and \
+                (self._refresh_thread is None or not self._refresh_thread.is_alive()):
+                self._refresh_thread = threading.Thread(target=self.refresh, daemon=True, name='catalog_refresh')
+                self._refresh_thread.start()
+
+            return self._df
+
+
+    def _load(self):
+        # Load catalog from host and save snapshot
+        reload = self._nloads>0
+        self._nloads+=1
+        df = self.load_catalog(reload)
+        self._loaded_at = time.time()
+        try:
+            save(df, self.path)
+        except Exception as e:
+            self.logger.exception('Unable to save catalog snapshot', exc_info=e)
+        return df
+
+
+    def refresh(self):
+        '''Load the catalog from its host and replace the current catalog'''
+        try:
+            df = self._load()
+        except Exception as e:
+            self.logger.exception('Catalog refresh failed', exc_info=e)
+            with self._lock:
+                # Retry later
+                self._loaded_at = time.time() - self.refresh_interval + RETRY_INTERVAL
+            return
+
+        with self._lock:
+            old = self._df
+            self._df = df
+
+        if old is not None and old.attrs.get('version')!=df.attrs.get('version'):
+            changes = CatalogDiff(old, df)
+            self.logger.info(f"Catalog updated from version {old.attrs.get('version')} to {df.attrs.get('version')}: {changes}")
+            if self.on_change:
+                self.on_change(old, df, changes)
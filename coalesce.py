@@ -0,0 +1,127 @@
+from contextlib import nullcontext
+import threading
+
+class _Caller:
+    # Caller of an in-flight call. stopped is set when the call finishes or the caller's progress function raises an exception
+    def __init__(self, progress):
+        self.progress = progress
+        self.result = None
+        self.error = None
+        self.stopped = threading.Event()
+
+
+class _Call:
+    # In-flight call of a SingleFlight
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.callers = []
+        self.nactive = 0  # Number of callers that have not stopped
+        self.stopped = False  # True once all callers have stopped. Stopped calls are not joined by new callers.
+        self._lock = threading.Lock()
+
+
+    def add_caller(self, progress):
+        caller = _Caller(progress)
+        with self._lock:
+            self.callers.append(caller)
+            self.nactive+=1
+        return caller
+
+
+    def progress(self, *args):
+        # Progress is reported to every caller. Callers whose progress function raises an exception (such as
+        # cancelled jobs) stop receiving progress and stop waiting. The call is only stopped once all callers have stopped.
+        with self._lock:
+            callers = [x for x in self.callers if x.progress and x.error is None]
+        for caller in callers:
+            try:
+                caller.progress(*args)
+            except Exception as e:
+                with self._lock:
+                    caller.error = e
+                    self.nactive-=1
+                    self.stopped = self.nactive==0
+                caller.stopped.set()
+
+        with self._lock:
+            if self.stopped:
+                raise next(x.error for x in self.callers if x.error)
+
+
+    def finish(self):
+        self.done.set()
+        for caller in self.callers:
+            caller.stopped.set()
+
+
+class SingleFlight:
+    '''Coalesces concurrent calls with the same key so that only one call runs
+
+    The first caller for a key runs the function. Callers with the same key that arrive while it is running
+    wait for it to finish and receive the same result (or exception). A caller whose progress function raises an
+    exception (such as a cancelled job) stops waiting and receives that exception. The call is only stopped once
+    all of its callers have stopped.
+
+    Callers wait inside the waiting context manager (such as jobs.waiting so that waiting jobs do not use a worker).
+    '''
+    def __init__(self, waiting=nullcontext):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._waiting = waiting
+        self.deduplicated = 0  # Number of calls that shared the result of another call
+
+
+    def do(self, key, fcn, progress=None, share=None):
+        '''Run fcn or wait for the in-flight call with the same key
+
+        fcn is called with a progress function that reports progress to the progress function of each caller.
+        share is called with the result of fcn and the number of callers and returns a result for each caller (such as
+        a separate file for each caller). By default, all callers receive the same result.
+
+        Returns the result of fcn and whether the result was shared with another caller
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None or call.stopped
+            if is_leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.deduplicated+=1
+            caller = call.add_caller(progress)
+
+        if not is_leader:
+            with self._waiting():
+                caller.stopped.wait()
+            if caller.error:
+                raise caller.error
+            elif call.error:
+                raise call.error
+            return caller.result, True
+
+        try:
+            result = fcn(call.progress)
+            # Callers cannot join once the call is removed so every caller receives a result
+            self._remove(key, call)
+            callers = [x for x in call.callers if x.error is None]
+            results = share(result, len(callers)) if share else [result]*len(callers)
+            for x, r in zip(callers, results):
+                x.result = r
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            self._remove(key, call)
+            call.finish()
+
+        if caller.error:
+            # Leader stopped but the call continued for other callers
+            raise caller.error
+        return caller.result, len(call.callers)>1
+
+
+    def _remove(self, key, call):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
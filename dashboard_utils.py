@@ -1,35 +1,208 @@
 from contextlib import nullcontext
+import io
 from io import BytesIO
-import math
+from itertools import chain
+import numbers
+import os
 import openpolicedata as opd
-from openpolicedata import data_loaders
 import pandas as pd
 import streamlit as st
+
+import coalesce
+import dataset_cache
+import export
+import fetch
+import jobs
+import metadata_cache
+import tracing
 import utils
+import zipped_csv
+
+# Inputs of the cached functions below that identify their dataset in the catalog. Cached results are kept when
+# the catalog changes unless the catalog rows of their dataset changed (see metadata_cache.cached)
+DATASET_INPUTS = ('source_name', 'state', 'table_type', 'agency')
+
+# Results are cached in memory and in the persistent metadata cache so that they are kept after restarts.
+# catalog_version (see metadata_cache.cached) ensures that results are recomputed when their catalog rows change
+@st.cache_data(show_spinner="Loading year information...", ttl=metadata_cache.TTLS['years'])
+def get_years(selectbox_sources, selectbox_states, selectbox_table_types, selected_agency, catalog_version=None):
+    with tracing.span('get_years', source=selectbox_sources, state=selectbox_states, table=selectbox_table_types, agency=selected_agency) as s:
+        years = load_years(selectbox_sources, selectbox_states, selectbox_table_types, selected_agency, catalog_version=catalog_version)
+        s.set(nyears=len(years))
+    return years
+
+
+@st.cache_data(show_spinner="Loading agency information...", ttl=metadata_cache.TTLS['agencies'])
+def get_agencies(selectbox_sources, selectbox_states, selectbox_table_types, year, selected_agency,
+                 url_contains, id_contains, catalog_version=None):
+    with tracing.span('get_agencies', source=selectbox_sources, state=selectbox_states, table=selectbox_table_types, year=year, url=url_contains) as s:
+        agencies = load_agencies(selectbox_sources, selectbox_states, selectbox_table_types, year, selected_agency,
+                                 url_contains, id_contains, catalog_version=catalog_version)
+        s.set(nagencies=len(agencies))
+    return agencies
+
+
+def get_catalog_years(selected_rows):
+    '''Returns years of the selected catalog rows in the same format as get_years if they can be determined from
+    the catalog (i.e. all rows are for a single year) and None otherwise. Avoids a metadata lookup.'''
+    years = selected_rows['Year'].tolist()
+    if len(years)==0 or not all(isinstance(x, numbers.Number) for x in years):
+        # Rows for multiple years require requests to the dataset
+        return None
+    return [str(x) for x in sorted(set(years), reverse=True)]
+
 
-@st.cache_data(show_spinner="Loading year information...")
-def get_years(selectbox_sources, selectbox_states, selectbox_table_types, selected_agency):
-    src = opd.Source(selectbox_sources, state=selectbox_states, agency=selected_agency)
-    years = src.get_years(table_type=selectbox_table_types, force=False)
+# Persistently cached metadata lookups. These do not use Streamlit so they can be called from background threads (see warm_cache.py)
+@metadata_cache.cached('years', dataset=DATASET_INPUTS)
+def load_years(source_name, state, table_type, agency):
+    src = opd.Source(source_name, state=state, agency=agency)
+    with tracing.span('get_years.request'):
+        years = src.get_years(table_type=table_type, force=False)
     years.sort(reverse=True)
     return [str(x) if x!=opd.defs.NA else utils.NA_DISPLAY_VALUE for x in years]
 
 
-@st.cache_data(show_spinner="Loading agency information...")
-def get_agencies(selectbox_sources, selectbox_states, selectbox_table_types, year, selected_agency,
-                 url_contains, id_contains):
-    src = opd.Source(selectbox_sources, state=selectbox_states, agency=selected_agency)
-    agencies = src.get_agencies(table_type=selectbox_table_types, year=year, url=url_contains, id=id_contains)
+@metadata_cache.cached('agencies', dataset=DATASET_INPUTS)
+def load_agencies(source_name, state, table_type, year, agency, url_contains, id_contains):
+    src = opd.Source(source_name, state=state, agency=agency)
+    with tracing.span('get_agencies.request'):
+        agencies = src.get_agencies(table_type=table_type, year=year, url=url_contains, id=id_contains)
     agencies.sort()
     agencies.insert(0, utils.ALL)
     return agencies
 
 
+def get_count(source_name, state, agency, year, table_type, agency_filter, url, dataset_id):
+    # Not cached since full loads stop at the count and rows added to the dataset after a cached count would be dropped
+    src = opd.Source(source_name=source_name, state=state, agency=agency)
+    return src.get_count(year=year, table_type=table_type, agency=agency_filter, url=url, id=dataset_id)
+
+
+def get_cache_key(ds, selection, catalog_version=None):
+    # Uniquely identifies the full data requested for a dataset
+    return (ds['URL'], ds['dataset_id'], selection['year'], selection['table'], selection['agency'], catalog_version)
+
+
+def get_format_cache_key(cache_key, fmt):
+    # Identifies the full data converted to a format other than CSV
+    return cache_key if fmt=='CSV' else cache_key + (fmt,)
 
-def load(selected_row, selection, prev_rows=None, logger=None, use_streamlit=True):
+
+def iter_file(path, block_size=2**20):
+    with open(path, 'rb') as f:
+        while (data:=f.read(block_size)):
+            yield data
+
+
+def convert_csv_file(cache, csv_file, key, fmt, chunksize=100000):
+    # Convert a cached CSV file to another format chunk-by-chunk and cache the result
+    if export.is_csv(fmt):
+        # Data only needs to be compressed
+        chunks = export.compress(iter_file(csv_file), fmt)
+    else:
+        chunks = export.iter_chunks(pd.read_csv(csv_file, encoding_errors='surrogateescape', chunksize=chunksize), fmt)
+    return cache.put(key, chunks)
+
+
+def get_partial_cache_key(cache_key):
+    # Identifies the first rows of a dataset that have been loaded for a preview
+    return cache_key + ('partial',)
+
+
+def read_partial(cache, cache_key):
+    # Returns the CSV data and number of rows of the previously loaded first rows of a dataset
+    path, meta = cache.get_entry(get_partial_cache_key(cache_key))
+    if path is None:
+        return None, 0
+    try:
+        with open(path, 'rb') as f:
+            return f.read(), meta['nrows']
+    except OSError:
+        # Entry was removed
+        return None, 0
+
+
+def load_api_preview(src, ds, selection, nrows, cache, cache_key):
+    # Load the first nrows rows of an API dataset. Rows are saved in the cache so that they are
+    # not loaded again by later previews or the full download
+    partial_data, nrows_saved = read_partial(cache, cache_key)
+    if nrows_saved >= nrows:
+        return pd.read_csv(BytesIO(partial_data), encoding_errors='surrogateescape', nrows=nrows)
+
+    df = src.load(year=selection['year'], table_type=selection['table'], agency=selection['agency'],
+                    url=ds["URL"], 
+                    id=ds["dataset_id"],
+                    verbose=False,
+                    nrows=nrows-nrows_saved,
+                    offset=nrows_saved).table
+    
+    if partial_data:
+        columns = pd.read_csv(BytesIO(partial_data), nrows=0).columns
+        data = partial_data + next(export.iter_csv([df], columns))
+    else:
+        data = next(export.iter_csv([df]))
+
+    nrows_total = nrows_saved + len(df)
+    if nrows_total==0:
+        return []
+    elif len(df) < nrows-nrows_saved:
+        # All rows have been loaded
+        cache.put(cache_key, data, nrows=nrows_total)
+        cache.remove(get_partial_cache_key(cache_key))
+    else:
+        cache.put(get_partial_cache_key(cache_key), data, nrows=nrows_total)
+
+    return df.head(nrows) if nrows_saved==0 else pd.read_csv(BytesIO(data), encoding_errors='surrogateescape', nrows=nrows)
+
+
+# Identical loads that are requested at the same time (i.e. by multiple sessions) share a single load. Jobs waiting
+# for a shared load do not use a job worker.
+inflight_loads = coalesce.SingleFlight(waiting=jobs.waiting)
+
+def share_data(data, ncallers):
+    # Each caller sharing a load receives its own file. Files are opened before the load's file is closed so
+    # that the cache entry cannot be evicted in between.
+    if not isinstance(data, io.BufferedReader):
+        return [data]*ncallers
+    elif ncallers==0:
+        data.close()
+        return []
+    return [data] + [dataset_cache.get_cache().open(data.name) for _ in range(ncallers-1)]
+
+
+def load(selected_row, selection, prev_rows=None, logger=None, use_streamlit=True, stream=False, fmt=export.DEFAULT_FORMAT,
+         progress=None):
+    # If stream is True, full loads of API datasets are converted to the output format batch-by-batch and 
+    # written to a file, which is returned instead of bytes. Returned files must be closed. The dataset cache entry of
+    # a returned file is not evicted until the file is closed.
+    # fmt is the output format of full loads (see export.FORMATS). Previews always return CSV data.
+    # progress is called with the number of batches loaded, the total number of batches, and the number of bytes 
+    # written during full loads of API datasets (such as jobs.Job.update). Exceptions raised by progress stop the load.
     if not logger:
         logger = st.session_state['logger']
 
+    ds = selected_row.iloc[0]
+    cache_key = get_cache_key(ds, selection, selected_row.attrs.get('version'))
+    key = (cache_key, prev_rows, stream, fmt)
+    trace = tracing.span('load', url=ds['URL'], data_type=ds['DataType'], year=selection['year'], preview=prev_rows!=None, fmt=fmt)
+
+    def run(progress):
+        return _load(selected_row, selection, prev_rows, logger, use_streamlit, stream, fmt, progress)
+    
+    def share(result, ncallers):
+        data, df_prev, load_failure = result
+        return [(x, df_prev, load_failure) for x in share_data(data, ncallers)]
+
+    with trace:
+        (data, df_prev, load_failure), shared = inflight_loads.do(key, run, progress, share)
+        trace.set(shared=shared, failed=load_failure)
+    if shared:
+        logger.info(f"Load shared with an identical load (deduplicated loads: {inflight_loads.deduplicated})")
+
+    return data, df_prev, load_failure
+
+
+def _load(selected_row, selection, prev_rows, logger, use_streamlit, stream, fmt, progress):
     load_failure = False
 
     ds = selected_row.iloc[0]
@@ -41,45 +214,162 @@ def load(selected_row, selection, prev_rows=None, logger=None, use_streamlit=Tru
     logger.info(f"Loading {'preview ' if prev_rows else ''}data for {selection['year']}, {selection['table']}, {selection['agency']}, "+\
                                     f'{ds["URL"]}, {ds["dataset_id"]}, {ds["SourceName"]}, {ds["State"]}, {ds["Agency"]}')
 
-    src = opd.Source(source_name=ds['SourceName'], state=ds['State'], agency=ds['Agency'])
-
     is_preview = prev_rows != None
-    if not is_preview and ds["DataType"] in utils.API_DATA_TYPES:
-        spinner = st.spinner if use_streamlit else nullcontext
-        with spinner("Retrieving record count..."):
-            try:
-                nrows = src.get_count(year=selection['year'], table_type=selection['table'], agency=selection['agency'],
-                                                url=ds["URL"], 
-                                                id=ds["dataset_id"])
-                logger.info(f"record_count: {nrows}")
-            except Exception as e:
-                logger.exception('Exception encountered during get_count', exc_info=e)
-                load_failure = True
+    is_streamed = False
+    is_converted = False  # True if data has already been converted to its output format
 
-        if not load_failure:
-            df_list = []
-            batch_size = 5000
-            nbatches = math.ceil(nrows / batch_size)
+    # Full datasets are cached on disk and shared across sessions
+    cache = dataset_cache.get_cache()
+    cache_key = get_cache_key(ds, selection, selected_row.attrs.get('version'))
+    out_key = cache_key if is_preview else get_format_cache_key(cache_key, fmt)
+    with tracing.span('load.cache_lookup') as s:
+        cached_file = cache.get(out_key)
+        s.set(hit=cached_file is not None)
+    if not cached_file and out_key!=cache_key and (export.is_csv(fmt) or (is_csv and is_zipped)) and (csv_file:=cache.get(cache_key)):
+        # Convert previously loaded CSV data instead of loading data again. Column types cannot be determined from
+        # CSV data so Parquet and Feather data is loaded from the source unless the source is a CSV file.
+        logger.info(f"Converting cached CSV data to {fmt}")
+        with tracing.span('load.convert', fmt=fmt) as s:
+            cached_file = convert_csv_file(cache, csv_file, out_key, fmt)
+            s.set(bytes=os.path.getsize(cached_file))
+    logger.info(f"Dataset cache {'hit' if cached_file else 'miss'} (hits: {cache.hits}, misses: {cache.misses})")
+
+    if cached_file:
+        nrows = prev_rows
+        isempty = False
+        is_converted = True
+        # Data is served from the file
+        data_from_url = cache.open(cached_file) if not is_preview or load_all else None
+        if is_preview:
+            df_prev = pd.read_csv(cached_file, encoding_errors='surrogateescape', nrows=nrows)
+    elif not is_preview and ds["DataType"] in utils.API_DATA_TYPES:
+        # Each request uses its own Source since requests are made from multiple threads
+        def new_source():
+            return opd.Source(source_name=ds['SourceName'], state=ds['State'], agency=ds['Agency'])
+        
+        # Count and pages are requested from other threads
+        parent_span = tracing.current()
+        record_count = None
+        def get_record_count():
+            nonlocal record_count
+            with tracing.span('load.count', parent=parent_span) as s:
+                record_count = get_count(ds['SourceName'], ds['State'], ds['Agency'], selection['year'], selection['table'], selection['agency'],
+                                         ds["URL"], ds["dataset_id"])
+                s.set(rows=record_count)
+            return record_count
+        
+        def load_page(offset, nrows):
+            with tracing.span('load.page', parent=parent_span, offset=offset) as s:
+                df = new_source().load(year=selection['year'], table_type=selection['table'], agency=selection['agency'],
+                                            url=ds["URL"], 
+                                            id=ds["dataset_id"],
+                                            pbar=False,
+                                            verbose=False,
+                                            nrows=nrows,
+                                            offset=offset).table
+                s.set(rows=len(df))
+            return df
+
+        # Rows already loaded for a preview do not need to be loaded again. Previews are saved as CSV
+        # and are only reused for CSV output so that other formats keep the data types of the loaded data
+        partial_data, nrows_partial = read_partial(cache, cache_key) if stream and export.is_csv(fmt) else (None, 0)
+        if nrows_partial>0:
+            logger.info(f"Resuming load after {nrows_partial} previously loaded rows")
+
+        if use_streamlit:
+            pbar = st.progress(0, text="Retrieving Data...")
+        nbytes = 0
+        pages = (0, 0)
+        def page_loaded(done, total):
+            nonlocal pages
+            pages = (done, total)
             if use_streamlit:
-                pbar = st.progress(0, text="Retrieving Data...")
-            iter = 0
+                pbar.progress(done / total, text="Retrieving Data...")
+            if progress:
+                progress(done, total, nbytes)
+
+        nrows_loaded = nrows_partial
+        def iter_batches():
+            nonlocal nrows_loaded
+            # Count is logged from this thread (the thread that logged the start of the load) so that log_analytics
+            # can match it to the load
+            count_logged = False
+            for df in fetch.iter_pages(get_record_count, load_page, ds["URL"], batch_size=5000, start=nrows_partial, progress=page_loaded):
+                if not count_logged:
+                    logger.info(f"record_count: {record_count}")
+                    count_logged = True
+                nrows_loaded+=len(df)
+                yield df
+            if not count_logged and record_count is not None:
+                logger.info(f"record_count: {record_count}")
+
+        def iter_chunks():
+            nonlocal nbytes
+            if partial_data:
+                columns = pd.read_csv(BytesIO(partial_data), nrows=0).columns
+                chunks = export.compress(chain([partial_data], export.iter_csv(iter_batches(), columns)), fmt)
+            else:
+                chunks = export.iter_chunks(iter_batches(), fmt)
+            for c in chunks:
+                nbytes+=len(c)
+                yield c
+
+        try:
+            if stream:
+                # Pages are loaded, converted, and written to the cache as they arrive
+                with tracing.span('load.stream', fmt=fmt) as s:
+                    cached_file = cache.put(out_key, iter_chunks())
+                    s.set(rows=nrows_loaded, bytes=nbytes)
+                is_streamed = True
+                is_converted = True
+                if progress:
+                    # Report total bytes written
+                    progress(*pages, nbytes)
+            else:
+                with tracing.span('load.fetch') as s:
+                    df_list = list(iter_batches())
+                    s.set(rows=nrows_loaded)
+        except jobs.JobCancelled:
+            # Not a failure. Only raised once every caller sharing this load has cancelled (see coalesce.SingleFlight)
+            raise
+        except Exception as e:
+            logger.exception('Load failure occurred', exc_info=e)
+            load_failure = True
+            
+        isempty = True
+        if not load_failure:
+            if is_streamed:
+                isempty = nrows_loaded==0
+                if isempty:
+                    cache.remove(out_key)
+                else:
+                    data_from_url = cache.open(cached_file)
+                    cache.remove(get_partial_cache_key(cache_key))
+            elif len(df_list)>0:
+                with tracing.span('load.concat', pages=len(df_list)) as s:
+                    data_from_url = pd.concat(df_list)
+                    s.set(rows=len(data_from_url))
+                isempty = len(data_from_url)==0
+    elif ds["DataType"] in utils.API_DATA_TYPES:
+        src = opd.Source(source_name=ds['SourceName'], state=ds['State'], agency=ds['Agency'])
+        nrows = prev_rows
+        spinner = st.spinner if use_streamlit else nullcontext
+        with spinner(f"Retrieving up to {nrows} rows..."):
             try:
-                for tbl in src.load_iter(year=selection['year'], table_type=selection['table'], nbatch=batch_size, agency=selection['agency'],
-                                            url_contains=ds["URL"], 
-                                            id_contains=ds["dataset_id"]):
-                    iter+=1
-                    df_list.append(tbl.table)
-                    if use_streamlit:
-                        pbar.progress(iter / nbatches, text="Retrieving Data...")
+                with tracing.span('load.api_preview') as s:
+                    df_prev = load_api_preview(src, ds, selection, nrows, cache, cache_key)
+                    s.set(rows=len(df_prev))
+                isempty = len(df_prev)==0
+                # Rows are saved in the cache instead of being returned
+                data_from_url = None
+                is_converted = True
+            except jobs.JobCancelled:
+                raise
             except Exception as e:
                 logger.exception('Load failure occurred', exc_info=e)
                 load_failure = True
-                
-            isempty = True
-            if not load_failure and len(df_list)>0:
-                data_from_url = pd.concat(df_list)
-                isempty = len(data_from_url)==0
     else:
+        src = opd.Source(source_name=ds['SourceName'], state=ds['State'], agency=ds['Agency'])
         nrows = prev_rows
 
         if load_all:
@@ -90,39 +380,85 @@ def load(selected_row, selection, prev_rows=None, logger=None, use_streamlit=Tru
         spinner = st.spinner if use_streamlit else nullcontext
         with spinner(wait_msg):
             try:
-                if is_csv and is_zipped:
+                df_prev = None
+                if is_preview and is_csv and is_zipped:
+                    # Only download the parts of the zip file needed for the preview if possible
+                    try:
+                        with tracing.span('load.zip_preview'):
+                            df_prev = zipped_csv.read_preview(ds["URL"], nrows)
+                        logger.debug("Preview loaded with HTTP range requests")
+                    except Exception as e:
+                        logger.info(f"Unable to load preview with HTTP range requests. Loading entire file: {e}")
+
+                if df_prev is not None:
+                    # Preview was loaded with range requests. Full data will be loaded if downloaded.
+                    isempty = len(df_prev)==0
+                    data_from_url = None
+                    is_converted = True
+                elif is_csv and is_zipped:
                     # For large datasets on Streamlit cloud, OPD Explorer fails when converting the entire file to a DataFrame
-                    # Instead, just download data and only convert enough rows to a DataFrame to create the preview
-                    is_csv = True
-                    data_from_url = data_loaders.data_loader.download_zip_and_extract(ds["URL"], block_size=2**20, pbar=True)
-                    nrows_load = data_loaders.csv_class.count_csv_rows(data_from_url)
+                    # or holding the extracted file in memory. Instead, extract the data to a file and 
+                    # only convert enough rows to a DataFrame to create the preview
+                    with tracing.span('load.zip_download') as s:
+                        with zipped_csv.download(ds["URL"]) as zip_file:
+                            cached_file = cache.put(cache_key, zipped_csv.iter_member(zip_file))
+                        s.set(bytes=os.path.getsize(cached_file))
+                    with tracing.span('load.count_rows') as s:
+                        nrows_load = zipped_csv.count_csv_rows(cached_file)
+                        s.set(rows=nrows_load)
                     isempty = nrows_load==0
+                    if isempty:
+                        cache.remove(cache_key)
+                    else:
+                        if is_preview:
+                            df_prev = pd.read_csv(cached_file, encoding_errors='surrogateescape', nrows=nrows)
+                        elif out_key!=cache_key:
+                            cached_file = convert_csv_file(cache, cached_file, out_key, fmt)
+                        # Data is served from the file
+                        data_from_url = cache.open(cached_file)
+                    is_converted = True
                 else:
                     nrows_load = None if load_all else nrows
-                    data_from_url = src.load(year=selection['year'], table_type=selection['table'], agency=selection['agency'],
-                                                url=ds["URL"], 
-                                                id=ds["dataset_id"],
-                                                verbose=False,
-                                                nrows=nrows_load).table
+                    with tracing.span('load.file') as s:
+                        data_from_url = src.load(year=selection['year'], table_type=selection['table'], agency=selection['agency'],
+                                                    url=ds["URL"], 
+                                                    id=ds["dataset_id"],
+                                                    verbose=False,
+                                                    nrows=nrows_load).table
+                        s.set(rows=len(data_from_url))
                     isempty = len(data_from_url)==0
+            except jobs.JobCancelled:
+                raise
             except Exception as e:
                 logger.exception('Load failure occurred', exc_info=e)
                 load_failure = True
 
-    df_prev = []
-    if not load_failure and not isempty:
-        if is_csv and is_zipped:
-            if is_preview:
-                df_prev = pd.read_csv(BytesIO(data_from_url), encoding_errors='surrogateescape', skiprows=0, nrows=nrows)
-        else:
-            if is_preview:
-                df_prev = data_from_url.head(nrows)
+    if is_converted:
+        if is_streamed and not isempty:
+            logger.info(f"Streamed {nrows_loaded} rows to file")
+    elif not load_failure and not isempty:
+        df_prev = []
+        if is_preview:
+            df_prev = data_from_url.head(nrows)
 
-            if not is_preview or load_all:
-                data_from_url = data_from_url.to_csv(index=False).encode('utf-8', 'surrogateescape')
-            else:
-                data_from_url = None
+        if not is_preview or load_all:
+            # Full dataset was loaded
+            df = data_from_url
+            with tracing.span('load.to_csv', rows=len(df)):
+                csv_text = df.to_csv(index=False)
+            with tracing.span('load.encode') as s:
+                data_from_url = csv_text.encode('utf-8', 'surrogateescape')
+                s.set(bytes=len(data_from_url))
+            cache.put(cache_key, data_from_url)
+            if out_key!=cache_key:
+                with tracing.span('load.convert', fmt=fmt) as s:
+                    out_file = cache.put(out_key, export.iter_chunks([df], fmt))
+                    s.set(bytes=os.path.getsize(out_file))
+                data_from_url = cache.open(out_file)
+        else:
+            data_from_url = None
 
+    if not load_failure and not isempty:
         if is_preview:
             pd.set_option('future.no_silent_downcasting', True)
             try:
@@ -132,8 +468,11 @@ def load(selected_row, selection, prev_rows=None, logger=None, use_streamlit=Tru
                 pass
 
             pd.reset_option('future.no_silent_downcasting')
+        else:
+            df_prev = []
     else:
         data_from_url = None
+        df_prev = []
 
     return data_from_url, df_prev, load_failure
 
@@ -155,7 +494,13 @@ def set_defaults_to_go_to_dataset(selected_ds):
     st.session_state['default']['download']['source'] = selected_ds['SourceName']
     st.session_state['default']['download']['table_type_general'], _, st.session_state['default']['download']['table_type_sub'] = utils.split_tables(selected_ds['TableType'])
     st.session_state['default']['download']['agency'] = selected_ds['Agency']
-    years = get_years(selected_ds['SourceName'], selected_ds['State'], selected_ds['TableType'], selected_ds['Agency'])
-    st.session_state['default']['download']['year'] = years[0]
+    # Years are loaded by the Download page. The 1st year is the default unless the dataset is for a single year.
+    year = selected_ds['Year']
+    if isinstance(year, numbers.Number):
+        st.session_state['default']['download']['year'] = str(year)
+    elif year==opd.defs.NA:
+        st.session_state['default']['download']['year'] = utils.NA_DISPLAY_VALUE
+    else:
+        st.session_state['default']['download']['year'] = 0
     st.session_state['default']['download']['url'] = selected_ds['URL']
     st.session_state['default']['download']['id'] = selected_ds['dataset_id']
\ No newline at end of file
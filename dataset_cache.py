@@ -0,0 +1,206 @@
+import collections
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Location and limits of the shared dataset cache. Can be overridden with environment variables
+CACHE_DIR = os.environ.get('OPD_EXPLORER_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'opd_explorer_cache'))
+MAX_BYTES = int(os.environ.get('OPD_EXPLORER_CACHE_MAX_BYTES', 2**30))  # 1 GB
+TTL = float(os.environ.get('OPD_EXPLORER_CACHE_TTL', 24*60*60))  # 1 day. Matches TTL of data catalog
+
+_DATA_EXT = '.csv'
+_META_EXT = '.json'
+
+class _CachedFile(io.BufferedReader):
+    # File opened with DatasetCache.open. Its entry is not evicted until the file is closed
+    def __init__(self, cache, path):
+        super().__init__(io.FileIO(path, 'rb'))
+        self._cache = cache
+
+
+    def close(self):
+        if not self.closed:
+            self._cache._release(self.name)
+        super().close()
+
+
+class DatasetCache:
+    '''Disk cache of downloaded datasets shared by all sessions in a process
+
+    Entries are keyed by a tuple (such as URL, dataset ID, year, table type, agency, and catalog version)
+    and stored as files. Writes are atomic (data is written to a temporary file and then renamed) so
+    readers never see a partial file. Entries expire after ttl seconds and the least recently used entries
+    are removed when the total size exceeds max_bytes. Entries with files opened with open are not removed
+    by eviction so the total size can exceed max_bytes while they are open.
+    '''
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES, ttl=TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._open = collections.Counter()  # Number of open files of each entry (see open)
+        os.makedirs(self.directory, exist_ok=True)
+
+
+    def _path(self, key):
+        name = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name)
+
+
+    def get(self, key):
+        '''Returns path to cached file or None if key is not in cache'''
+        return self.get_entry(key)[0]
+
+
+    def get_entry(self, key):
+        '''Returns path to cached file and its metadata or None, None if key is not in cache'''
+        path = self._path(key)
+        with self._lock:
+            try:
+                with open(path+_META_EXT, 'r') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                self.misses+=1
+                return None, None
+
+            if time.time() - meta['created'] > self.ttl or not os.path.exists(path+_DATA_EXT):
+                self._remove(path)
+                self.misses+=1
+                return None, None
+
+            # Update modification time to track which entries were least recently used
+            try:
+                os.utime(path+_DATA_EXT)
+            except OSError:
+                self.misses+=1
+                return None, None
+
+            self.hits+=1
+            return path+_DATA_EXT, meta
+
+
+    def put(self, key, chunks, nrows=None):
+        '''Write data to the cache and return the path of the cached file
+
+        chunks can be bytes or an iterable of bytes. nrows is the number of rows of data, which is saved in the metadata
+        '''
+        if isinstance(chunks, bytes):
+            chunks = [chunks]
+
+        path = self._path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        tmp_meta = None
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for c in chunks:
+                    f.write(c)
+                nbytes = f.tell()
+
+            meta = {'key':[str(x) for x in key], 'created':time.time(), 'nbytes':nbytes, 'nrows':nrows}
+            fd_meta, tmp_meta = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd_meta, 'w') as f:
+                json.dump(meta, f)
+
+            with self._lock:
+                # Data is moved before metadata so that metadata never points to a missing or partial file
+                os.replace(tmp, path+_DATA_EXT)
+                os.replace(tmp_meta, path+_META_EXT)
+                # The new entry is kept even if it alone exceeds the budget because the caller is about to read it
+                self._evict(keep=path)
+        except:
+            for f in [tmp, tmp_meta]:
+                if f and os.path.exists(f):
+                    os.remove(f)
+            raise
+
+        return path+_DATA_EXT
+
+
+    def open(self, path):
+        '''Open a cached file (a path returned by get or put) for reading. The entry is not evicted while the file is
+        open so the file can be read even if other entries are added. Each call returns a separate file.'''
+        with self._lock:
+            self._open[path]+=1
+        try:
+            return _CachedFile(self, path)
+        except:
+            self._release(path)
+            raise
+
+
+    def _release(self, path):
+        with self._lock:
+            self._open[path]-=1
+            if self._open[path]<=0:
+                del self._open[path]
+
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(self._path(key))
+
+
+    def stats(self):
+        with self._lock:
+            entries = self._entries()
+        return {'hits':self.hits, 'misses':self.misses, 'entries':len(entries), 'bytes':sum(x[2] for x in entries)}
+
+
+    def clear(self):
+        with self._lock:
+            for path,_,_ in self._entries():
+                self._remove(path)
+
+
+    def _entries(self):
+        # Returns (path without extension, last used time, size) of each entry
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(_DATA_EXT):
+                path = os.path.join(self.directory, name[:-len(_DATA_EXT)])
+                try:
+                    st = os.stat(path+_DATA_EXT)
+                except OSError:
+                    continue
+                entries.append((path, st.st_mtime, st.st_size))
+
+        return entries
+
+
+    def _evict(self, keep=None):
+        entries = self._entries()
+        total = sum(x[2] for x in entries)
+        # Entries with open files are counted but not removed
+        entries = [x for x in entries if x[0]!=keep and x[0]+_DATA_EXT not in self._open]
+        entries.sort(key=lambda x: x[1])  # Least recently used first
+        for path, _, nbytes in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total-=nbytes
+
+
+    def _remove(self, path):
+        for ext in [_META_EXT, _DATA_EXT]:
+            try:
+                os.remove(path+ext)
+            except OSError:
+                pass
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    '''Returns cache shared by all sessions in this process'''
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DatasetCache()
+    return _cache
@@ -0,0 +1,205 @@
+import io
+import os
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Output formats available for download. ext replaces the extension of the CSV filename from OpenPoliceData.
+# compression is the codec used to compress CSV output
+FORMATS = {
+    'CSV': {'ext':'.csv', 'mime':'text/csv', 'compression':None},
+    'CSV (gzip)': {'ext':'.csv.gz', 'mime':'application/gzip', 'compression':'gzip'},
+    'CSV (zstd)': {'ext':'.csv.zst', 'mime':'application/zstd', 'compression':'zstd'},
+    'Parquet': {'ext':'.parquet', 'mime':'application/vnd.apache.parquet', 'compression':None},
+    'Feather': {'ext':'.feather', 'mime':'application/vnd.apache.arrow.file', 'compression':None},
+}
+DEFAULT_FORMAT = 'CSV'
+
+def is_csv(fmt):
+    # Returns True if format is CSV or compressed CSV
+    return fmt=='CSV' or FORMATS[fmt]['compression'] is not None
+
+def get_filename(csv_filename, fmt):
+    # Convert the CSV filename from opd.data.get_csv_filename to a filename for the requested format
+    base = csv_filename[:-4] if csv_filename.lower().endswith('.csv') else csv_filename
+    return base + FORMATS[fmt]['ext']
+
+
+def iter_csv(tables, columns=None):
+    # Convert each table to encoded CSV text. Only the first chunk contains the header.
+    # If columns is set, the header has already been written and tables are written with these columns
+    for df in tables:
+        if columns is None:
+            columns = df.columns
+            header = True
+        else:
+            # Later batches must match the header of the 1st batch
+            df = df.reindex(columns=columns)
+            header = False
+        yield df.to_csv(index=False, header=header).encode('utf-8', 'surrogateescape')
+
+
+class _ChunkSink(io.RawIOBase):
+    # Output stream that stores written bytes until they are drained. Allows file formats that are written
+    # to a file to be generated chunk-by-chunk
+    def __init__(self):
+        self.chunks = []
+        self.pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        self.pos+=len(b)
+        return len(b)
+
+    def tell(self):
+        return self.pos
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _prepare(df, columns=None):
+    # Arrow requires all values in a column to have the same type. Object columns can contain mixed types
+    # (such as strings and numbers) so their values are converted to strings
+    if columns is not None:
+        df = df.reindex(columns=columns)
+    df = df.copy()
+    for c in df.columns:
+        if df[c].dtype==object:
+            df[c] = df[c].apply(lambda x: x if pd.isnull(x) or isinstance(x, str) else str(x))
+    return df
+
+
+def _unify(schemas):
+    # Schema that all tables can be converted to. Integers are widened to floats if tables contain both, columns
+    # with types that cannot be combined are written as strings, and columns that are all null are assumed to be strings.
+    fields = []
+    for f in schemas[0]:
+        try:
+            field_type = pa.unify_schemas([pa.schema([s.field(f.name)]) for s in schemas],
+                                          promote_options='permissive').field(f.name).type
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            field_type = pa.string()
+        fields.append(pa.field(f.name, pa.string() if pa.types.is_null(field_type) else field_type))
+    return pa.schema(fields, metadata=schemas[0].metadata)
+
+
+def _read(path):
+    # Read a table written by _iter_arrow. The file is memory mapped so the table is not read into memory
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def _iter_arrow(tables):
+    # Convert tables to Arrow tables with the same schema. The schema of a file cannot change once it has been
+    # written and columns can contain different types later in a dataset (such as ZIP codes that are integers until
+    # one contains a dash) so tables are spooled to disk until the schema can be determined from all of them.
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        schemas = []
+        columns = None
+        for df in tables:
+            df = _prepare(df, columns)
+            columns = df.columns
+            tbl = pa.Table.from_pandas(df, preserve_index=False)
+            paths.append(os.path.join(directory, f'{len(paths)}.arrow'))
+            with pa.OSFile(paths[-1], 'wb') as sink, pa.ipc.new_file(sink, tbl.schema) as writer:
+                writer.write_table(tbl)
+            schemas.append(tbl.schema)
+
+        if not paths:
+            return
+
+        schema = _unify(schemas)
+        for path, tbl_schema in zip(paths, schemas):
+            for k, f in enumerate(schema):
+                if tbl_schema.field(k).type!=f.type and not pa.types.is_string(f.type):
+                    try:
+                        _read(path).column(k).cast(f.type)
+                    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+                        # Values would be changed (such as integers that are too large to be exact floats)
+                        schema = schema.set(k, pa.field(f.name, pa.string()))
+
+        for path in paths:
+            yield _read(path).cast(schema)
+
+
+def iter_parquet(tables, compression='zstd'):
+    # Write each table as a row group of a Parquet file
+    sink = _ChunkSink()
+    writer = None
+    for tbl in _iter_arrow(tables):
+        if writer is None:
+            writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), tbl.schema, compression=compression)
+        writer.write_table(tbl)
+        yield sink.drain()
+
+    if writer:
+        writer.close()
+        yield sink.drain()
+
+
+def iter_feather(tables):
+    # Write each table as record batches of an Arrow IPC (Feather V2) file
+    sink = _ChunkSink()
+    writer = None
+    for tbl in _iter_arrow(tables):
+        if writer is None:
+            writer = pa.ipc.new_file(pa.PythonFile(sink, mode='w'), tbl.schema)
+        writer.write_table(tbl)
+        yield sink.drain()
+
+    if writer:
+        writer.close()
+        yield sink.drain()
+
+
+def compress(chunks, fmt):
+    '''Compress chunks of CSV data with the compression of the requested format. Compressed data is 
+    output as it is generated so only a small amount of data is buffered.
+    '''
+    codec = FORMATS[fmt]['compression']
+    if codec is None:
+        yield from chunks
+        return
+
+    sink = _ChunkSink()
+    with pa.CompressedOutputStream(pa.PythonFile(sink, mode='w'), codec) as stream:
+        for c in chunks:
+            stream.write(c)
+            if (data:=sink.drain()):
+                yield data
+
+    yield sink.drain()
+
+
+def iter_chunks(tables, fmt=DEFAULT_FORMAT):
+    '''Convert an iterable of DataFrames to bytes in the requested format without holding all data in memory
+
+    Parameters
+    ----------
+    tables : iterable of pd.DataFrame
+        Tables of data in order. Tables after the 1st are converted to have the same columns as the 1st table
+    fmt : str
+        Output format. Must be a key of FORMATS
+
+    Yields
+    ------
+    bytes
+        Chunks of the output file
+    '''
+    if is_csv(fmt):
+        return compress(iter_csv(tables), fmt)
+    elif fmt=='Parquet':
+        return iter_parquet(tables)
+    elif fmt=='Feather':
+        return iter_feather(tables)
+    else:
+        raise ValueError(f"Unknown format {fmt}")
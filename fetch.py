@@ -0,0 +1,87 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from urllib.parse import urlparse
+
+MAX_WORKERS = 4  # Maximum number of pages requested at once by a single load
+MAX_PER_HOST = 6  # Maximum number of simultaneous requests to a single host across all loads
+
+_host_semaphores = {}
+_host_lock = threading.Lock()
+
+def _get_host_semaphore(url):
+    o = urlparse(url)
+    if o.hostname==None:
+        o = urlparse('https://'+url)
+    host = o.hostname
+    with _host_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(MAX_PER_HOST)
+        return _host_semaphores[host]
+
+
+def iter_pages(get_count, load_page, url, batch_size=5000, start=0, max_workers=MAX_WORKERS, progress=None):
+    '''Load pages of a dataset in parallel and yield them in order
+
+    The 1st page is requested while the record count is being retrieved. Once the count is known,
+    the remaining pages are requested on a thread pool. At most 2*max_workers pages are requested
+    ahead of the page being yielded to bound the memory used by pages received out of order.
+
+    Parameters
+    ----------
+    get_count : callable
+        Function with no inputs that returns the number of records
+    load_page : callable
+        Function that inputs offset and nrows and returns a DataFrame with the requested records
+    url : str
+        URL of dataset. Used to limit the number of simultaneous requests to the host
+    batch_size : int
+        Number of records per page
+    start : int
+        Offset of first record to load. Used to skip records that have already been loaded
+    max_workers : int
+        Number of threads to use for this load
+    progress : callable
+        Called with the number of pages yielded and the total number of pages after each page is yielded
+
+    Yields
+    ------
+    pd.DataFrame
+        Pages of data in order
+    '''
+    sem = _get_host_semaphore(url)
+    def limited(fcn, *args):
+        with sem:
+            return fcn(*args)
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        count_future = pool.submit(limited, get_count)
+        first_page = pool.submit(limited, load_page, start, batch_size)
+
+        count = count_future.result()
+        if count<=start:
+            return
+
+        offsets = iter(range(start+batch_size, count, batch_size))
+        npages = len(range(start, count, batch_size))
+        pending = deque([first_page])
+        def request_next():
+            k = next(offsets, None)
+            if k is not None:
+                pending.append(pool.submit(limited, load_page, k, min(batch_size, count-k)))
+
+        for _ in range(2*max_workers):
+            request_next()
+
+        done = 0
+        while pending:
+            df = pending.popleft().result()
+            request_next()
+            done+=1
+            if progress:
+                progress(done, npages)
+            yield df
+    finally:
+        # Cancel remaining requests if there was an error or the caller stopped iterating
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,317 @@
+'''Record and replay HTTP requests made to data portals so that the explorer can run without a network
+
+When installed, HTTP requests made with requests (used by openpolicedata data loaders, sodapy, zipped_csv, and
+the NPI probe) and urllib (used by openpolicedata to load the data catalog and some files) are recorded to or
+replayed from a store on disk. Requests to local hosts (such as portal_standin) are not recorded.
+
+Modes:
+    off     Requests are not recorded or replayed
+    record  Requests are made and their responses are recorded
+    replay  Recorded responses are returned. Requests that have not been recorded fail without using the network.
+    auto    Recorded responses are returned. Requests that have not been recorded are made and recorded.
+
+Only successful responses and 404s are recorded. Other errors (such as rate limits and outages) are usually temporary
+and would otherwise be replayed indefinitely.
+
+Streamed responses (requests made with stream=True, and all urllib responses) are written to the store as they are
+received instead of being held in memory. They are then read from the store, so the caller only receives the body
+after it has been completely downloaded.
+
+The mode and store are set with the OPD_EXPLORER_HTTP_MODE and OPD_EXPLORER_HTTP_STORE environment variables. The
+store must be installed before openpolicedata is imported for the data catalog request to be recorded or replayed.
+'''
+import hashlib
+import http.client
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import urllib.response
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+MODES = ['off', 'record', 'replay', 'auto']
+# Mode and location of the store. Can be overridden with environment variables
+MODE = os.environ.get('OPD_EXPLORER_HTTP_MODE', 'off').lower()
+STORE_DIR = os.environ.get('OPD_EXPLORER_HTTP_STORE', os.path.join(tempfile.gettempdir(), 'opd_explorer_http'))
+
+KEY_HEADERS = ['range']  # Request headers that change the response
+CHUNK_SIZE = 2**20  # Number of bytes of streamed responses that are written at a time
+LOCAL_HOSTS = ['127.0.0.1', 'localhost']
+# Response headers that do not apply to the recorded body, which is decoded and complete
+_DROP_HEADERS = ['content-encoding', 'transfer-encoding', 'content-length', 'connection', 'keep-alive', 'set-cookie']
+
+class NotRecordedError(requests.ConnectionError):
+    '''Raised in replay mode for requests that have not been recorded'''
+
+
+class _Blob(io.BufferedReader):
+    # Recorded body. requests closes the body of a response with release_conn once its content has been read
+    def __init__(self, path):
+        super().__init__(io.FileIO(path, 'rb'))
+
+    def release_conn(self):
+        self.close()
+
+
+def _normalize_url(url):
+    # Query parameters are sorted so that their order does not change the key
+    parts = urlsplit(url)
+    query = '&'.join(sorted(parts.query.split('&'))) if parts.query else ''
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, query, ''))
+
+
+class HTTPStore:
+    '''Content-addressed store of HTTP responses
+
+    Response bodies are stored in blobs/ by the SHA-256 hash of their contents so responses with the same contents
+    (such as repeated requests for a catalog) are stored once. Responses are indexed in requests/ by a hash of the
+    request method, URL, headers in KEY_HEADERS, and body. Writes are atomic so readers never see a partial file.
+    '''
+    def __init__(self, directory=STORE_DIR):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.directory, 'blobs'), exist_ok=True)
+        os.makedirs(os.path.join(self.directory, 'requests'), exist_ok=True)
+
+
+    @staticmethod
+    def key(method, url, headers=None, body=None):
+        headers = {k.lower():v for k,v in (headers or {}).items()}
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        request = [method.upper(), _normalize_url(url), {k:headers[k] for k in KEY_HEADERS if k in headers},
+                   hashlib.sha256(body).hexdigest() if isinstance(body, bytes) else None]
+        return hashlib.sha256(json.dumps(request).encode('utf-8')).hexdigest()
+
+
+    def _write(self, path, data):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+    def get(self, key, stream=False):
+        '''Returns recorded response (a dictionary with status, reason, headers, and url) and body or None, None
+        if the request has not been recorded. If stream is True, body is an open file instead of bytes.'''
+        try:
+            with open(os.path.join(self.directory, 'requests', key+'.json'), 'r') as f:
+                response = json.load(f)
+            body = self.open(response)
+            if not stream:
+                with body:
+                    body = body.read()
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses+=1
+            return None, None
+
+        with self._lock:
+            self.hits+=1
+        return response, body
+
+
+    def open(self, response):
+        '''Returns the body of a recorded response as an open file'''
+        return _Blob(os.path.join(self.directory, 'blobs', response['body']))
+
+
+    def put(self, key, method, url, status, reason, headers, body):
+        '''Record a response. body is bytes or an iterable of bytes, which is written to the store as it is read.
+        Returns the recorded response (see get).'''
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=os.path.join(self.directory, 'blobs'), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in [body] if isinstance(body, bytes) else body:
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size+=len(chunk)
+            # Blobs with the same name have the same contents so replacing an existing blob does not change it
+            os.replace(tmp, os.path.join(self.directory, 'blobs', digest.hexdigest()))
+        except:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+        headers = {k:v for k,v in headers.items() if k.lower() not in _DROP_HEADERS}
+        headers['Content-Length'] = str(size)
+        response = {'method':method, 'url':url, 'status':status, 'reason':reason, 'headers':headers, 'body':digest.hexdigest(),
+                    'recorded':time.time()}
+        self._write(os.path.join(self.directory, 'requests', key+'.json'), json.dumps(response).encode('utf-8'))
+        return response
+
+
+_store = None
+_mode = 'off'
+_install_lock = threading.Lock()
+_adapter_send = requests.adapters.HTTPAdapter.send
+_urlopen = urllib.request.urlopen
+
+def _is_local(url):
+    return urlsplit(url).hostname in LOCAL_HOSTS
+
+
+def _recordable(status):
+    # Errors other than not found (such as rate limits and outages) are usually temporary and are not recorded
+    return status<400 or status==404
+
+
+def _build_response(adapter, request, response, body):
+    # body is bytes or an open file, which is read when the response's content is requested
+    r = requests.Response()
+    r.status_code = response['status']
+    r.reason = response['reason']
+    r.headers = CaseInsensitiveDict(response['headers'])
+    r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+    if isinstance(body, bytes):
+        r.raw = io.BytesIO(body)
+        r._content = body
+        r._content_consumed = True
+    else:
+        r.raw = body
+    r.url = request.url
+    r.request = request
+    r.connection = adapter
+    return r
+
+
+def _send(adapter, request, **kwargs):
+    # Replaces requests.adapters.HTTPAdapter.send, which makes all requests for requests and its sessions
+    store, mode = _store, _mode
+    if mode=='off' or _is_local(request.url):
+        return _adapter_send(adapter, request, **kwargs)
+
+    key = store.key(request.method, request.url, request.headers, request.body)
+    stream = kwargs.get('stream', False)
+    if mode!='record':
+        response, body = store.get(key, stream)
+        if response:
+            return _build_response(adapter, request, response, body)
+        elif mode=='replay':
+            raise NotRecordedError(f"No recorded response for {request.method} {request.url}", request=request)
+
+    r = _adapter_send(adapter, request, **kwargs)
+    if not _recordable(r.status_code):
+        return r
+    elif not stream:
+        store.put(key, request.method, request.url, r.status_code, r.reason, r.headers, r.content)
+        return r
+
+    with r:
+        response = store.put(key, request.method, request.url, r.status_code, r.reason, r.headers, r.iter_content(CHUNK_SIZE))
+    return _build_response(adapter, request, response, store.open(response))
+
+
+def _build_urllib_response(url, response, body):
+    # body is an open file
+    headers = http.client.HTTPMessage()
+    for k,v in response['headers'].items():
+        headers[k] = v
+    if response['status']>=400:
+        raise urllib.error.HTTPError(url, response['status'], response['reason'], headers, body)
+    r = urllib.response.addinfourl(body, headers, url, response['status'])
+    r.reason = response['reason']
+    return r
+
+
+def _open(url, data=None, *args, **kwargs):
+    # Replaces urllib.request.urlopen
+    store, mode = _store, _mode
+    request = url if isinstance(url, urllib.request.Request) else urllib.request.Request(url, data)
+    if mode=='off' or _is_local(request.full_url):
+        return _urlopen(url, data, *args, **kwargs)
+
+    method = request.get_method()
+    body = data if data is not None else request.data
+    key = store.key(method, request.full_url, dict(request.header_items()), body)
+    if mode!='record':
+        response, recorded = store.get(key, stream=True)
+        if response:
+            return _build_urllib_response(request.full_url, response, recorded)
+        elif mode=='replay':
+            raise urllib.error.URLError(f"No recorded response for {method} {request.full_url}")
+
+    try:
+        r = _urlopen(url, data, *args, **kwargs)
+    except urllib.error.HTTPError as e:
+        if not _recordable(e.code):
+            raise
+        r = e
+
+    with r:
+        response = store.put(key, method, request.full_url, r.code, r.reason, dict(r.headers.items()),
+                             iter(lambda: r.read(CHUNK_SIZE), b''))
+    return _build_urllib_response(request.full_url, response, store.open(response))
+
+
+def install(store=None, mode=MODE):
+    '''Record or replay HTTP requests using store (an HTTPStore). mode is one of MODES.'''
+    global _store, _mode
+    if mode not in MODES:
+        raise ValueError(f"Unknown HTTP store mode {mode}. Mode must be one of {MODES}")
+    with _install_lock:
+        if mode!='off' and store is None:
+            store = _store if _store and _store.directory==STORE_DIR else HTTPStore(STORE_DIR)
+        _store = store
+        _mode = mode
+        requests.adapters.HTTPAdapter.send = _send
+        urllib.request.urlopen = _open
+    return store
+
+
+def uninstall():
+    global _store, _mode
+    with _install_lock:
+        _store = None
+        _mode = 'off'
+        requests.adapters.HTTPAdapter.send = _adapter_send
+        urllib.request.urlopen = _urlopen
+
+
+def install_from_env():
+    '''Install store if OPD_EXPLORER_HTTP_MODE is set to a mode other than off. Returns the store or None.'''
+    if MODE!='off' and _mode!=MODE:
+        return install(mode=MODE)
+    return _store
+
+
+def get_mode():
+    return _mode
+
+
+class use:
+    '''Context manager that records or replays HTTP requests using store while it is active'''
+    def __init__(self, store, mode='auto'):
+        self.store = store
+        self.mode = mode
+
+
+    def __enter__(self):
+        self._previous = (_store, _mode)
+        install(self.store, self.mode)
+        return self.store
+
+
+    def __exit__(self, exc_type, exc, tb):
+        store, mode = self._previous
+        if mode=='off':
+            uninstall()
+        else:
+            install(store, mode)
+        return False
@@ -11,16 +11,17 @@ def display_version(opd_version, exp_version, st_version):
     st.session_state['logger'].info(f"\tStreamlit: {st_version}")  # 4/28/2025: Working ver =  1.44.1
 
 
-def init(level, __version__):
+def init(level, __version__, log_file=None, json_logs=False):
     if 'is_starting_up' not in st.session_state or st.session_state['is_starting_up']:  # st.session_state['is_starting_up']=True is only needed for testing
-        st.session_state['logger'] = create_logger(name = 'opd-app', level = level)
+        st.session_state['logger'] = create_logger(name = 'opd-app', level = level, file = log_file, json_format = json_logs)
         st.session_state['last_selection'] = None
         st.session_state['is_starting_up'] = True  # Indicates that the app has just been instantiated
         st.session_state['preview'] = None
+        st.session_state['jobs'] = {}  # Preview and download jobs (see jobs.py) for this session keyed by job kind
 
         # Key order is important. It is used for reseting defaults properly. See clear_defaults.
         st.session_state['default'] = {
-            'download':{k:0 for k in ['state','source','table_type_general','table_type_sub','agency','year', 'url']},
+            'download':{k:0 for k in ['state','source','table_type_general','table_type_sub','agency','year', 'url', 'id']},
             'datasets':{k:0 for k in ['state','source','table']}
         }
 
@@ -0,0 +1,217 @@
+from contextlib import contextmanager
+import itertools
+import os
+import queue
+import threading
+import time
+
+MAX_WORKERS = int(os.environ.get('OPD_EXPLORER_MAX_JOBS', 4))  # Maximum number of jobs run at once across all sessions
+
+# Job kinds. Jobs with lower priority values are run first so that short previews are not stuck behind long downloads
+PREVIEW = 'preview'
+DOWNLOAD = 'download'
+PRIORITIES = {PREVIEW:0, DOWNLOAD:1}
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    '''Preview or download run by a JobScheduler
+
+    The job's function is called with the job as its only input. It can report progress with update, which
+    raises JobCancelled if the job has been cancelled. State is updated by the worker thread and read by the page.
+    '''
+    _ids = itertools.count()
+
+    def __init__(self, fcn, kind, key=None):
+        self.id = next(Job._ids)
+        self.fcn = fcn
+        self.kind = kind
+        self.key = key  # Identifies what the job is loading (such as the output format)
+        self.state = QUEUED
+        self.batches_done = 0
+        self.batches_total = None
+        self.nbytes = 0
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+
+    def cancel(self):
+        # Queued jobs are not run. Running jobs stop at their next progress update. Results of jobs that have
+        # finished are closed if they are files.
+        self._cancel.set()
+        self._close_result()
+
+
+    def _close_result(self):
+        if hasattr(self.result, 'close'):
+            self.result.close()
+
+
+    def wait(self, timeout=None):
+        '''Wait for the job to finish. Returns True if the job is done'''
+        return self._done.wait(timeout)
+
+
+    def update(self, batches_done, batches_total, nbytes=0):
+        if self.cancelled:
+            raise JobCancelled(f"Job {self.id} was cancelled")
+        self.batches_done = batches_done
+        self.batches_total = batches_total
+        self.nbytes = nbytes
+
+
+    def fraction(self):
+        return self.batches_done / self.batches_total if self.batches_total else 0.0
+
+
+    def eta(self):
+        '''Estimated number of seconds until the job finishes or None if it is unknown'''
+        if self.state!=RUNNING or not self.batches_done or not self.batches_total:
+            return None
+        elapsed = time.time() - self.started
+        return elapsed / self.batches_done * (self.batches_total - self.batches_done)
+
+
+    def status(self):
+        # Returns text describing the state of the job
+        if self.state==QUEUED:
+            return "Waiting for other downloads to finish..."
+        elif self.state!=RUNNING:
+            return self.state.title()
+        elif not self.batches_total:
+            return "Retrieving Data..."
+
+        text = f"Retrieving Data... {self.batches_done}/{self.batches_total} batches"
+        if self.nbytes:
+            text+=f", {self.nbytes/2**20:.1f} MB"
+        if (eta:=self.eta()) is not None:
+            text+=f", {eta:.0f}s remaining"
+        return text
+
+
+    def _run(self):
+        if self.cancelled:
+            self.state = CANCELLED
+        else:
+            self.state = RUNNING
+            self.started = time.time()
+            try:
+                self.result = self.fcn(self)
+                if self.cancelled:
+                    self.state = CANCELLED
+                    self._close_result()
+                else:
+                    self.state = DONE
+            except Exception as e:
+                self.error = e
+                self.state = CANCELLED if self.cancelled or isinstance(e, JobCancelled) else FAILED
+
+        self.finished = time.time()
+        self._done.set()
+
+
+class JobScheduler:
+    '''Runs preview and download jobs on a bounded pool of worker threads
+
+    Jobs are run in order of priority (previews first) and then in order of submission. Jobs that are waiting
+    (see waiting) do not count towards max_workers.
+    '''
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()  # Breaks ties between jobs with the same priority
+        self._threads = []
+        self._lock = threading.Lock()
+
+
+    def submit(self, fcn, kind=DOWNLOAD, key=None):
+        job = Job(fcn, kind, key)
+        self._queue.put((PRIORITIES[kind], next(self._seq), job))
+        with self._lock:
+            self._start_worker()
+
+        return job
+
+
+    def _start_worker(self):
+        # Threads are started as needed. Must be called with the lock held
+        self._threads = [t for t in self._threads if t.is_alive()]
+        if len(self._threads) < self.max_workers:
+            t = threading.Thread(target=self._worker, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+
+    def _release(self):
+        # Replace the worker running the current job (see waiting)
+        with self._lock:
+            self._threads.remove(threading.current_thread())
+            self._start_worker()
+
+
+    def _worker(self):
+        _worker_state.scheduler = self
+        _worker_state.released = False
+        while not _worker_state.released:
+            _, _, job = self._queue.get()
+            try:
+                job._run()
+            finally:
+                self._queue.task_done()
+
+
+_worker_state = threading.local()  # State of the worker thread running the current job
+
+@contextmanager
+def waiting():
+    '''Context manager for jobs that wait for other work (such as a load shared with another job). The worker running
+    the job is replaced so that other jobs are not blocked by waiting jobs. The job continues on its thread, which
+    stops once the job finishes. Has no effect outside of jobs.'''
+    scheduler = getattr(_worker_state, 'scheduler', None)
+    if scheduler is not None and not _worker_state.released:
+        _worker_state.released = True
+        scheduler._release()
+    yield
+
+
+def cancel(jobs):
+    '''Cancel all jobs in a dict of jobs (such as the jobs stored in session state) and remove them'''
+    for job in jobs.values():
+        job.cancel()
+    jobs.clear()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    '''Returns scheduler shared by all sessions in this process'''
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = JobScheduler()
+    return _scheduler
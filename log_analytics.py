@@ -0,0 +1,323 @@
+'''Offline analysis of app logs to decide which datasets to cache and prefetch
+
+Reports the number of requests for each dataset, p50/p95 load times, failure rates by host and DataType, and a
+histogram of the number of rows loaded. Log files are streamed line by line so large (and gzipped) files are
+not loaded into memory.
+
+Logs can be in the Streamlit Cloud format, the formats written by streamlit_logger.create_logger (with or without
+times or as JSON lines), or a mix. Load times require times in the log (for example, from --json-logs) or
+tracing (--trace), whose load spans include the duration of each load.
+
+    python log_analytics.py --logs "logs/*.txt" --top 20
+'''
+import argparse
+from collections import Counter, defaultdict
+import csv
+from datetime import datetime, timedelta
+import glob
+import gzip
+import json
+import math
+import re
+from urllib.parse import urlparse
+
+# Matches lines logged by dashboard_utils.load:
+# Loading [preview ]data for {year}, {table}, {agency filter}, {URL}, {dataset_id}, {SourceName}, {State}, {Agency}
+LOAD_LINE = re.compile(r'Loading (?P<preview>preview )?data for (?P<year>[^,]*), (?P<table>[^,]*), (?P<agency_filter>[^,]*), '+
+                       r'(?P<url>[^,\s]*), (?P<dataset_id>[^,]*), (?P<source>[^,]*), (?P<state>[^,]*), (?P<agency>.*?)\s*$')
+# Lines logged by older versions of the app when loading data
+_LEGACY_SOURCE = re.compile(r'^\*\*\*source_name=(?P<source>.*), state=(?P<state>.*?)\s*$')
+_LEGACY_TABLE = re.compile(r'^Table type is (?P<table>.*) and year is (?P<year>.*?)\s*$')
+_LEGACY_LOAD = 'Downloading data from URL'
+
+_RECORD_COUNT = re.compile(r'record_count(?: is|:) (?P<count>\d+)')
+_ROWS = re.compile(r'Data downloaded from URL\. Total of (?P<rows>\d+) rows|Streamed (?P<streamed>\d+) rows to file')
+_FAILURES = ['Load failure occurred', 'Uncaught app exception']
+_TRACE = re.compile(r'TRACE (?P<name>\S+) (?P<ms>[\d.]+) ms (?P<status>\w+)(?P<tags>.*)$')
+_TAG = re.compile(r'(\w+)=(\S*)')
+
+# Times at the start of lines: streamlit_logger with addtime, Streamlit's logger, and Streamlit Cloud (time only)
+_TIME_FORMATS = [
+    (re.compile(r'^(\d{2}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) :: (.*)$'), '%y-%m-%d %H:%M:%S'),
+    (re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d+) (.*)$'), '%Y-%m-%d %H:%M:%S.%f'),
+    (re.compile(r'^\[(\d{2}:\d{2}:\d{2})\] (.*)$'), '%H:%M:%S'),
+]
+
+PERCENTILES = [50, 95]
+
+def parse_line(line):
+    '''Returns the time (or None), thread (or None), message, and span record (or None) of a log line
+
+    The thread is the thread's ID if it is logged since thread names are not unique.
+    '''
+    line = line.rstrip('\r\n')
+    if line.startswith('{'):
+        try:
+            record = json.loads(line)
+            t = datetime.fromisoformat(record['time']) if record.get('time') else None
+            thread = record.get('thread_id', record.get('thread'))
+            return t, thread, record.get('message', ''), record.get('span')
+        except (ValueError, TypeError, KeyError):
+            pass
+
+    for pattern, fmt in _TIME_FORMATS:
+        m = pattern.match(line)
+        if m:
+            try:
+                return datetime.strptime(m[1], fmt), None, m[2], None
+            except ValueError:
+                break
+
+    return None, None, line, None
+
+
+def parse_trace(message):
+    '''Returns span record of a text TRACE line logged by tracing or None'''
+    m = _TRACE.search(message)
+    if not m:
+        return None
+    span = {k:v for k,v in _TAG.findall(m['tags'])}
+    span.update(name=m['name'], duration=float(m['ms'])/1000, status=m['status'])
+    return span
+
+
+def iter_lines(patterns):
+    '''Stream the lines of files matching glob patterns'''
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            opener = gzip.open if path.endswith('.gz') else open
+            with opener(path, 'rt', encoding='utf-8', errors='replace') as f:
+                yield from f
+
+
+def percentile(values, p):
+    '''Nearest-rank percentile of values'''
+    if len(values)==0:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(p/100*len(values))-1)]
+
+
+def row_bucket(rows):
+    '''Returns the lower bound of the power of 10 range that rows is in'''
+    return 10**int(math.log10(rows)) if rows>0 else 0
+
+
+def format_bucket(low):
+    return f'{low:,}-{10*low-1:,}' if low>0 else '0'
+
+
+class Load:
+    __slots__ = ('dataset', 'url', 'data_type', 'preview', 'start', 'end', 'duration', 'rows', 'expected_rows', 'failed', 'done')
+    def __init__(self, dataset, url=None, preview=False, start=None):
+        self.dataset = dataset  # (SourceName, State, TableType, Agency)
+        self.url = url
+        self.data_type = None
+        self.preview = preview
+        self.start = start
+        self.end = None
+        self.duration = None  # Seconds
+        self.rows = None  # Number of rows loaded
+        self.expected_rows = None  # Number of rows reported by the source before loading
+        self.failed = False
+        self.done = False
+
+
+    @property
+    def host(self):
+        if not self.url:
+            return None
+        return urlparse(self.url).netloc or self.url
+
+
+    @property
+    def nrows(self):
+        return self.rows if self.rows is not None else self.expected_rows
+
+
+    def latency(self):
+        '''Returns load time in seconds or None if it is unknown'''
+        if self.duration is not None:
+            return self.duration
+        if self.done and self.start and self.end:
+            delta = self.end - self.start
+            if self.start.year==1900:
+                # Streamlit Cloud times do not include dates
+                delta = delta % timedelta(days=1)
+            return delta.total_seconds()
+        return None
+
+
+class LogAnalyzer:
+    '''Collects loads from log lines. Lines are associated with the load that was last started in the same thread
+    (if threads are logged).
+
+    data_types maps dataset URLs to their DataType for logs that do not include it.
+    '''
+    def __init__(self, data_types=None):
+        self.data_types = data_types if data_types else {}
+        self.loads = []
+        self._open = {}  # thread -> load in progress
+        self._last = {}  # thread -> last finished load
+        self._legacy = {}  # thread -> dataset information logged before a load by older versions
+
+
+    def feed(self, lines):
+        for line in lines:
+            self.add(line)
+        return self
+
+
+    def _finish(self, thread, t):
+        load = self._open.pop(thread, None)
+        if load:
+            load.end = t
+            load.done = True
+            self._last[thread] = load
+        return load
+
+
+    def _current(self, thread):
+        # Load in progress or the last finished load, which may still log rows and its duration
+        return self._open.get(thread) or self._last.get(thread)
+
+
+    def add(self, line):
+        t, thread, message, span = parse_line(line)
+        if span is None and 'TRACE ' in message:
+            span = parse_trace(message)
+
+        if span is not None:
+            # Loads shared with an identical load are logged by the session that made the load
+            if span.get('name')=='load' and str(span.get('shared'))!='True':
+                load = self._current(thread)
+                if load and (not span.get('url') or load.url in [None, span['url']]):
+                    if load is self._open.get(thread):
+                        self._finish(thread, t)
+                    load.duration = float(span['duration'])
+                    load.data_type = span.get('data_type', load.data_type)
+                    load.failed = load.failed or span.get('status')=='error' or str(span.get('failed'))=='True'
+            return
+
+        if m := LOAD_LINE.search(message):
+            # A load that did not finish before the next load started in the same thread is not counted as finished
+            self._open.pop(thread, None)
+            load = Load((m['source'], m['state'], m['table'], m['agency']), m['url'], m['preview'] is not None, t)
+            self._open[thread] = load
+            self.loads.append(load)
+        elif m := _LEGACY_SOURCE.search(message):
+            self._legacy[thread] = {'source':m['source'], 'state':m['state']}
+        elif message.startswith(_LEGACY_LOAD) and thread in self._legacy:
+            self._open.pop(thread, None)
+            info = self._legacy.pop(thread)
+            load = Load((info['source'], info['state'], None, None), start=t)
+            self._open[thread] = load
+            self.loads.append(load)
+        elif (m := _LEGACY_TABLE.search(message)) and (load := self._open.get(thread)) and load.dataset[2] is None:
+            load.dataset = (load.dataset[0], load.dataset[1], m['table'], load.dataset[3])
+        elif m := _RECORD_COUNT.search(message):
+            if load := self._open.get(thread):
+                load.expected_rows = int(m['count'])
+        elif m := _ROWS.search(message):
+            if load := self._current(thread):
+                load.rows = int(m['rows'] or m['streamed'])
+            self._finish(thread, t)
+        elif message.startswith('No data found'):
+            if load := self._current(thread):
+                load.rows = 0
+            self._finish(thread, t)
+        elif any(x in message for x in _FAILURES):
+            if load := self._open.get(thread):
+                load.failed = True
+                self._finish(thread, t)
+        elif message.startswith('Download complete'):
+            self._finish(thread, t)
+
+
+    def data_type(self, load):
+        return load.data_type or self.data_types.get(load.url) or 'unknown'
+
+
+    def report(self, top=None):
+        '''Returns dictionary of statistics of the loads'''
+        datasets = defaultdict(list)
+        for load in self.loads:
+            datasets[load.dataset].append(load)
+
+        per_dataset = []
+        for dataset, loads in sorted(datasets.items(), key=lambda x: -len(x[1]))[:top]:
+            latencies = [x for x in (load.latency() for load in loads if not load.failed) if x is not None]
+            stats = {
+                'source':dataset[0], 'state':dataset[1], 'table':dataset[2], 'agency':dataset[3],
+                'requests':len(loads),
+                'previews':sum(load.preview for load in loads),
+                'failures':sum(load.failed for load in loads),
+            }
+            for p in PERCENTILES:
+                stats[f'p{p}'] = percentile(latencies, p)
+            stats['max_rows'] = max([load.nrows for load in loads if load.nrows is not None], default=None)
+            per_dataset.append(stats)
+
+        def failure_rates(key):
+            counts = Counter()
+            failures = Counter()
+            for load in self.loads:
+                k = key(load)
+                counts[k]+=1
+                failures[k]+=load.failed
+            return [{'name':k, 'loads':n, 'failures':failures[k], 'failure_rate':failures[k]/n} for k,n in counts.most_common()]
+
+        histogram = Counter(row_bucket(load.nrows) for load in self.loads if load.nrows is not None)
+
+        return {
+            'loads':len(self.loads),
+            'failures':sum(load.failed for load in self.loads),
+            'datasets':per_dataset,
+            'hosts':failure_rates(lambda x: x.host or 'unknown'),
+            'data_types':failure_rates(self.data_type),
+            'rows':[{'rows':format_bucket(k), 'loads':histogram[k]} for k in sorted(histogram)],
+        }
+
+
+def read_data_types(path):
+    '''Read map of URL to DataType from a catalog CSV file'''
+    with open(path, newline='', encoding='utf-8') as f:
+        return {row['URL']:row['DataType'] for row in csv.DictReader(f)}
+
+
+def _format_seconds(x):
+    return f'{x:.1f}' if x is not None else '-'
+
+
+def format_report(report):
+    lines = [f"{report['loads']} loads, {report['failures']} failures", '', 'Requests by dataset']
+    lines.append(f"{'Requests':>8} {'Previews':>8} {'Failures':>8} {'p50 (s)':>8} {'p95 (s)':>8} {'Max rows':>10}  Dataset")
+    for x in report['datasets']:
+        rows = f"{x['max_rows']:,}" if x['max_rows'] is not None else '-'
+        lines.append(f"{x['requests']:>8} {x['previews']:>8} {x['failures']:>8} {_format_seconds(x['p50']):>8} {_format_seconds(x['p95']):>8} "+
+                     f"{rows:>10}  {', '.join(str(v) for v in [x['source'], x['state'], x['table'], x['agency']] if v is not None)}")
+
+    for title, key in [('Failure rate by host', 'hosts'), ('Failure rate by DataType', 'data_types')]:
+        lines.extend(['', title, f"{'Loads':>8} {'Failures':>8} {'Rate':>6}  Name"])
+        for x in report[key]:
+            lines.append(f"{x['loads']:>8} {x['failures']:>8} {x['failure_rate']:>6.1%}  {x['name']}")
+
+    lines.extend(['', 'Rows loaded'])
+    most = max([x['loads'] for x in report['rows']], default=0)
+    for x in report['rows']:
+        lines.append(f"{x['rows']:>21} {x['loads']:>6} {'#'*math.ceil(40*x['loads']/most)}")
+
+    return '\n'.join(lines)
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Report dataset popularity, load times, and failure rates from app logs')
+    parser.add_argument('--logs', nargs='+', default=['logs/*.txt'], help='Glob patterns of log files (may be gzipped)')
+    parser.add_argument('--top', type=int, default=20, help='Number of datasets to report')
+    parser.add_argument('--catalog', default=None, help='Catalog CSV file used to find the DataType of datasets in logs that do not include it')
+    parser.add_argument('--json', action='store_true', help='Output report as JSON')
+    args = parser.parse_args()
+
+    analyzer = LogAnalyzer(read_data_types(args.catalog) if args.catalog else None)
+    report = analyzer.feed(iter_lines(args.logs)).report(args.top)
+    print(json.dumps(report, indent=2, default=str) if args.json else format_report(report))
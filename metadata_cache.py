@@ -0,0 +1,257 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Location and type of the persistent metadata cache. Can be overridden with environment variables.
+# The cache is shared by all processes on the machine that use the same location.
+BACKEND = os.environ.get('OPD_EXPLORER_METADATA_BACKEND', 'sqlite')  # sqlite or disk
+CACHE_PATH = os.environ.get('OPD_EXPLORER_METADATA_CACHE', os.path.join(tempfile.gettempdir(), 'opd_explorer_metadata'))
+
+# Number of seconds that the results of each cached function are valid
+TTLS = {
+    'years': 24*60*60,
+    'agencies': 24*60*60,
+}
+
+class _closing:
+    # Context manager that commits and closes a sqlite3 connection (sqlite3's context manager does not close it)
+    def __init__(self, con):
+        self.con = con
+
+    def __enter__(self):
+        return self.con
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.con.commit()
+        finally:
+            self.con.close()
+
+
+# Values are stored as JSON instead of pickles since the cache is in a shared location and loading a pickle can run
+# arbitrary code. Cached values must be JSON serializable (i.e. lists of strings).
+def _loads(data):
+    try:
+        return json.loads(data)
+    except (ValueError, TypeError):
+        # Invalid or written by an older version of the app
+        return None
+
+
+class SQLiteBackend:
+    '''Stores entries in a SQLite database. SQLite handles locking between processes.'''
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as con:
+            con.execute('PRAGMA journal_mode=WAL')  # Allows reads while another process is writing
+            con.execute('CREATE TABLE IF NOT EXISTS entries (name TEXT, key TEXT, version TEXT, created REAL, value BLOB, '+
+                        'dataset TEXT, PRIMARY KEY (name, key, version))')
+            if 'dataset' not in [x[1] for x in con.execute('PRAGMA table_info(entries)')]:
+                # Cache was created before entries were labeled with their dataset
+                con.execute('ALTER TABLE entries ADD COLUMN dataset TEXT')
+
+
+    def _connect(self):
+        # A new connection is used for each operation since connections cannot be shared across threads
+        return _closing(sqlite3.connect(self.path, timeout=30))
+
+
+    def get(self, name, key, version):
+        '''Returns (created, value) or None if entry is not found'''
+        with self._connect() as con:
+            row = con.execute('SELECT created, value FROM entries WHERE name=? AND key=? AND version IS ?',
+                              (name, key, version)).fetchone()
+        value = _loads(row[1]) if row else None
+        return (row[0], value['value']) if value else None
+
+
+    def put(self, name, key, version, value, dataset=None):
+        with self._connect() as con:
+            con.execute('INSERT OR REPLACE INTO entries (name, key, version, created, value, dataset) VALUES (?, ?, ?, ?, ?, ?)',
+                        (name, key, version, time.time(), json.dumps({'value':value}), dataset))
+
+
+    def carry_over(self, old_version, new_version, changed):
+        # Move entries of unchanged datasets from old_version to new_version and remove all other old entries
+        with self._connect() as con:
+            con.executemany('DELETE FROM entries WHERE version IS ? AND dataset=?', [(old_version, x) for x in changed])
+            # Existing entries for new_version are newer and are kept
+            con.execute('UPDATE OR IGNORE entries SET version=? WHERE version IS ? AND dataset IS NOT NULL',
+                        (new_version, old_version))
+            con.execute('DELETE FROM entries WHERE version IS NOT ?', (new_version,))
+
+
+    def clear(self):
+        with self._connect() as con:
+            con.execute('DELETE FROM entries')
+
+
+class DiskBackend:
+    '''Stores each entry in a JSON file in a directory. Writes are atomic (data is written to a
+    temporary file and then renamed) so readers in other processes never see a partial file.'''
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+
+    def _path(self, name, key, version):
+        h = hashlib.sha256(repr((name, key, version)).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, h+'.json')
+
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return _loads(f.read())
+        except OSError:
+            return None
+
+
+    def get(self, name, key, version):
+        '''Returns (created, value) or None if entry is not found'''
+        entry = self._read(self._path(name, key, version))
+        return (entry['created'], entry['value']) if entry else None
+
+
+    def put(self, name, key, version, value, dataset=None):
+        self._write({'name':name, 'key':key, 'version':version, 'created':time.time(), 'value':value, 'dataset':dataset})
+
+
+    def _write(self, entry):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp, self._path(entry['name'], entry['key'], entry['version']))
+        except:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+    def carry_over(self, old_version, new_version, changed):
+        # Move entries of unchanged datasets from old_version to new_version and remove all other old entries
+        for path in self._files():
+            entry = self._read(path)
+            try:
+                if entry and entry['version']==new_version:
+                    continue
+                if entry and entry['version']==old_version and entry.get('dataset') is not None and entry['dataset'] not in changed and \
+                    not os.path.exists(self._path(entry['name'], entry['key'], new_version)):
+                    entry['version'] = new_version
+                    self._write(entry)
+                os.remove(path)
+            except OSError:
+                pass
+
+
+    def clear(self):
+        for path in self._files():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+    def _files(self):
+        return [os.path.join(self.directory, x) for x in os.listdir(self.directory) if x.endswith('.json')]
+
+
+class MetadataCache:
+    '''Persistent cache of the results of slow metadata lookups (such as years and agencies for a dataset)
+
+    Entries are keyed by the function name, its inputs, and the version of the data catalog. Entries
+    expire after the TTL of their function. When the catalog changes, entries are carried over to the
+    new catalog version unless the catalog rows of their dataset changed.
+    '''
+    def __init__(self, backend, ttls=None):
+        self.backend = backend
+        self.ttls = ttls if ttls else TTLS
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, name, key, version=None):
+        '''Returns whether the entry was found and its value'''
+        entry = self.backend.get(name, key, version)
+        if entry is None or time.time() - entry[0] > self.ttls[name]:
+            self.misses+=1
+            return False, None
+
+        self.hits+=1
+        return True, entry[1]
+
+
+    def put(self, name, key, value, version=None, dataset=None):
+        '''dataset identifies the catalog rows that the value depends on (see dataset_key)'''
+        self.backend.put(name, key, version, value, dataset)
+
+
+    def carry_over(self, old_version, new_version, changed):
+        '''Keep entries of old_version for datasets that are not in changed (see dataset_key) as entries of
+        new_version. All entries that are not for new_version are removed.'''
+        self.backend.carry_over(old_version, new_version, set(changed))
+
+
+    def clear(self):
+        self.backend.clear()
+
+
+def dataset_key(source_name, state, table_type, agency):
+    '''Identifies the catalog rows of a dataset. Entries depending on these rows are removed if they change.'''
+    return repr((source_name, state, table_type, agency))
+
+
+def cached(name, dataset=None):
+    '''Decorator that caches the results of a function in the persistent metadata cache
+
+    The decorated function has an additional keyword input catalog_version, which is the version of the
+    catalog that the inputs came from. Results are recomputed if the catalog version changes unless
+    dataset is provided.
+
+    dataset is the names of the function's source name, state, table type, and agency inputs. Results are
+    then only recomputed after a catalog change if the catalog rows of that dataset changed (see MetadataCache.carry_over).
+    '''
+    def decorator(fcn):
+        signature = inspect.signature(fcn)
+        @functools.wraps(fcn)
+        def wrapper(*args, catalog_version=None, **kwargs):
+            cache = get_cache()
+            key = repr((args, sorted(kwargs.items())))
+            found, value = cache.get(name, key, catalog_version)
+            if not found:
+                value = fcn(*args, **kwargs)
+                if dataset:
+                    inputs = signature.bind(*args, **kwargs).arguments
+                    ds = dataset_key(*[inputs[x] for x in dataset])
+                else:
+                    ds = None
+                cache.put(name, key, value, catalog_version, ds)
+            return value
+        return wrapper
+    return decorator
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    '''Returns cache shared by all sessions in this process'''
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            if BACKEND=='disk':
+                backend = DiskBackend(CACHE_PATH)
+            elif BACKEND=='sqlite':
+                backend = SQLiteBackend(CACHE_PATH+'.sqlite')
+            else:
+                raise ValueError(f"Unknown metadata cache backend {BACKEND}")
+            _cache = MetadataCache(backend)
+    return _cache
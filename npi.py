@@ -0,0 +1,103 @@
+'''Links to the National Police Index (NPI)
+
+Whether the NPI has data for a state is determined by requesting the state's page. Requests are made in the
+background with a shared keep-alive session and results are cached so that pages do not wait on the NPI.
+'''
+from concurrent import futures
+import logging
+import threading
+import time
+
+import requests
+
+NPI_URL = 'https://national.cpdp.co/'
+TTL = 24*60*60  # Number of seconds that a state is known to have data
+NEGATIVE_TTL = 60*60  # Number of seconds before retrying states without data or whose request failed
+TIMEOUT = 3
+MAX_WORKERS = 2
+
+def get_state_url(state):
+    return NPI_URL + 'states/' + state.replace(' ','-')
+
+
+def get_agency_url(state, agency_full):
+    # There currently is no way to tell if agency URL exists. If it does not, it will go to the state URL and show no results
+    return get_state_url(state) + '?agency=' + agency_full.replace(' ','+')
+
+
+class StateProbe:
+    '''Cached, non-blocking check of whether the NPI has data for a state'''
+    def __init__(self, session=None, ttl=TTL, negative_ttl=NEGATIVE_TTL, max_workers=MAX_WORKERS, logger=None):
+        self.session = session if session else requests.Session()
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.logger = logger if logger else logging.getLogger('opd-app')
+        self._results = {}  # state -> (time of request, whether state has data)
+        self._pending = {}  # state -> Future of request
+        self._pool = futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='npi_probe')
+        self._lock = threading.Lock()
+
+
+    def _probe(self, state):
+        try:
+            r = self.session.get(get_state_url(state), timeout=TIMEOUT)
+            r.raise_for_status()
+            has_data = 'placeholder="Search Data"' in r.text  # State page contains placeholders for data if data exists
+        except Exception as e:
+            self.logger.debug(f"Unable to check NPI for {state}: {e}")
+            has_data = False
+
+        with self._lock:
+            self._results[state] = (time.time(), has_data)
+            del self._pending[state]
+        return has_data
+
+
+    def has_data(self, state):
+        '''Returns whether the NPI has data for state or None if it is not known yet. If it is not known,
+        the state is checked in the background.'''
+        with self._lock:
+            result = self._results.get(state)
+            if result:
+                created, has_data = result
+                if time.time() - created <= (self.ttl if has_data else self.negative_ttl):
+                    return has_data
+            if state not in self._pending:
+                self._pending[state] = self._pool.submit(self._probe, state)
+
+        return None
+
+
+    def wait(self, state, timeout=None):
+        '''Wait for a pending check of state to finish'''
+        with self._lock:
+            future = self._pending.get(state)
+        if future:
+            futures.wait([future], timeout)
+
+
+def get_url(state=None, agency_full=None, probe=None):
+    '''Returns the most specific NPI URL known to have data for state (and agency_full if provided) and whether a check of
+    the state is still pending. The generic NPI URL is returned if state is None or the state has not been checked yet.'''
+    if state is None:
+        return NPI_URL, False
+
+    has_data = (probe if probe else get_probe()).has_data(state)
+    if not has_data:
+        return NPI_URL, has_data is None
+    elif agency_full:
+        return get_agency_url(state, agency_full), False
+    else:
+        return get_state_url(state), False
+
+
+_probe = None
+_probe_lock = threading.Lock()
+
+def get_probe():
+    '''Returns probe shared by all sessions in this process'''
+    global _probe
+    with _probe_lock:
+        if _probe is None:
+            _probe = StateProbe()
+    return _probe
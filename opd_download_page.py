@@ -1,10 +1,20 @@
 import streamlit as st
 import argparse
 import logging
-from packaging import version
-import pandas as pd
 
+# Must be installed before openpolicedata is imported so that the request for the data catalog is recorded or replayed
+import http_store
+http_store.install_from_env()
+
+import catalog_index
+import catalog_search
+import catalog_snapshot
+import dashboard_utils
 import init
+import metadata_cache
+import tracing
+import utils
+import warm_cache
 import openpolicedata as opd
 
 __version__ = "2.0"
@@ -24,28 +34,64 @@ st.set_page_config(
 # https://discuss.streamlit.io/t/command-line-arguments/386/4
 parser = argparse.ArgumentParser()
 parser.add_argument('-d', '--debug', action='store_true')
+parser.add_argument('-t', '--trace', action='store_true', help='Log timing of the stages of loads and metadata lookups (see tracing.py)')
+parser.add_argument('--log-file', default=None, help='File to write logs to in addition to the console. The file is rotated when it gets large.')
+parser.add_argument('--json-logs', action='store_true', help='Write logs as JSON lines')
 args, _ = parser.parse_known_args()
 level = logging.DEBUG if args.debug else logging.INFO
+if args.trace:
+    tracing.enable()
 
-init.init(level, __version__)
+init.init(level, __version__, log_file=args.log_file, json_logs=args.json_logs)
 
 logger = st.session_state['logger']
     
-@st.cache_data(show_spinner="Updating datasets...", ttl='1 day')
-def get_data_catalog():
-    print('Getting data catalog')
-    if not st.session_state['is_starting_up']:  # Otherwise, the datasets have just been loaded
-        opd.datasets.reload()
-        print('Reloading data catalog')
-
-    df = opd.datasets.query()
-    # Remove min_version = -1 (not available in any version) or min_version > current version
-    df = df[df["min_version"].apply(lambda x: 
-                                    pd.isnull(x) or (x.strip()!="-1" and version.parse(opd.__version__) >= version.parse(x))
-                                    )]
-    df = df.sort_values(by=["State","SourceName","TableType"])
+def load_catalog(reload):
+    with tracing.span('catalog.load', reload=reload) as s:
+        if reload:
+            print('Reloading data catalog')
+            with tracing.span('catalog.download'):
+                opd.datasets.reload()
+
+        df = utils.prepare_catalog(opd.datasets.query(), opd.__version__)
+        s.set(rows=len(df), version=df.attrs['version'])
     return df
 
+
+def update_catalog(old, new, changes):
+    # Keep cached metadata for datasets whose catalog rows did not change
+    metadata_cache.get_cache().carry_over(old.attrs['version'], new.attrs['version'], changes.datasets)
+
+
+@st.cache_resource(show_spinner=False)
+def get_catalog_store():
+    # Shared by all sessions. The catalog is served from a snapshot on disk and refreshed in the background
+    return catalog_snapshot.CatalogStore(load_catalog, on_change=update_catalog, logger=logger)
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_catalog_index(_data_catalog, catalog_version):
+    # Built once per catalog version and shared by all sessions. st.cache_resource does not copy the index on each rerun.
+    return catalog_index.CatalogIndex(_data_catalog)
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_display_catalog(_data_catalog, catalog_version):
+    # Catalog converted to Arrow once per catalog version for display on the Find Datasets page
+    return utils.get_display_table(_data_catalog)
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_catalog_search(_data_catalog, catalog_version):
+    # Search index of the catalog for the Find Datasets page. Built once per catalog version and shared by all sessions.
+    return catalog_search.CatalogSearch(_data_catalog)
+
+
+@st.cache_resource(show_spinner=False)
+def start_cache_warmer(_data_catalog, catalog_version):
+    # Runs once per catalog version in each process. Metadata for popular datasets is loaded in the background.
+    return warm_cache.start(_data_catalog, warm_cache.get_log_patterns(args.log_file), logger=logger)
+
 with st.sidebar:
     st.title('OpenPoliceData Explorer')
     st.caption("Access over 550 "+
@@ -53,7 +99,12 @@ with st.sidebar:
             "including traffic stops, use of force, and officer-involved shootings. See the "+
             "[OpenPoliceData Python library](https://openpolicedata.readthedocs.io/en/stable/documentation.html) to access data programmatically.")
 
-st.session_state['data_catalog'] = get_data_catalog()
+with st.spinner("Updating datasets..."):
+    st.session_state['data_catalog'] = get_catalog_store().get()
+st.session_state['catalog_index'] = get_catalog_index(st.session_state['data_catalog'], st.session_state['data_catalog'].attrs['version'])
+st.session_state['catalog_search'] = get_catalog_search(st.session_state['data_catalog'], st.session_state['data_catalog'].attrs['version'])
+st.session_state['display_catalog'] = get_display_catalog(st.session_state['data_catalog'], st.session_state['data_catalog'].attrs['version'])
+start_cache_warmer(st.session_state['data_catalog'], st.session_state['data_catalog'].attrs['version'])
 
 page2 = '2_Find_Datasets.py'
 pg = st.navigation(["1_Download_Data.py", page2], position='top')
@@ -69,6 +120,21 @@ if st.session_state['is_starting_up'] and len(query)>0:
         key = 'datasets' if st.context.url.endswith(page2[2:].strip('.py')) else 'download'
 
     logger.info(f'Query: {query}')
+    if key=='download' and 'url' in query:
+        # Deep link to a dataset. Filters are set from its catalog row instead of searching each filter's options.
+        rows = st.session_state['catalog_index'].find(query['url'], query.get('id'))
+        if len(rows)>0:
+            selected = st.session_state['data_catalog'].iloc[rows]
+            if 'year' in query:
+                # Multiple rows can have the same URL and dataset ID
+                is_year = selected['Year'].astype(str)==query['year']
+                if is_year.any():
+                    selected = selected[is_year]
+            dashboard_utils.set_defaults_to_go_to_dataset(selected.iloc[0])
+        else:
+            logger.info(f"Dataset in query not found: {query['url']}, {query.get('id')}")
+            st.toast(f"ERROR: Requested dataset {query['url']} not found", duration='infinite', icon=":material/error:")
+
     for k,v in query.items():
         if k in st.session_state['default'][key]:
             st.session_state['default'][key][k] = v
@@ -0,0 +1,260 @@
+'''Local stand-in for the data portals that datasets are loaded from
+
+Serves synthetic data in the formats of the catalog's DataTypes so that loads can be benchmarked and tested without
+the network. URLs are generated by Portal.url:
+    ArcGIS   http://{host}/arcgis/{rows}/FeatureServer/0  Layer metadata, counts, and paged queries
+    Socrata  {host}/socrata/{rows}                        SODA-style count and paged queries of /resource/{id}.json
+    CSV      http://{host}/files/{rows}.csv
+    zip      http://{host}/files/{rows}.csv.zip           Zip file containing a CSV file
+    Excel    http://{host}/files/{rows}.xlsx
+Files support HEAD and HTTP range requests. Each request waits latency seconds before it is answered.
+
+Socrata clients always use HTTPS so the portal routes Socrata requests for its host over HTTP while it is running.
+
+    with portal_standin.Portal(latency=0.05) as portal:
+        url = portal.url('ArcGIS', 10000)
+'''
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import json
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+import zipfile
+
+import pandas as pd
+import requests
+import sodapy
+
+from openpolicedata.data_loaders import socrata
+
+DATA_TYPES = ['ArcGIS', 'Socrata', 'CSV', 'zip', 'Excel']
+PAGE_SIZE = 1000  # Maximum number of rows returned by a query (ArcGIS maxRecordCount)
+DATASET_ID = 'abcd-1234'
+
+_RACES = ['WHITE', 'BLACK', 'HISPANIC', 'ASIAN', 'UNKNOWN']
+_GENDERS = ['MALE', 'FEMALE']
+_START = pd.Timestamp('2020-01-01')
+
+def make_table(rows, offset=0):
+    '''Synthetic table of police stops. Row k is the same regardless of the size of the table.'''
+    k = pd.RangeIndex(offset, offset+rows)
+    return pd.DataFrame({
+        'id':k,
+        'date':_START + pd.to_timedelta(k*7, unit='min'),
+        'race':[_RACES[x % len(_RACES)] for x in k],
+        'gender':[_GENDERS[x % len(_GENDERS)] for x in k],
+        'age':18 + k % 60,
+        'description':[f'Traffic stop {x} for speeding on Main St' for x in k],
+    })
+
+
+_ARCGIS_FIELDS = [{'name':'id', 'type':'esriFieldTypeOID'}, {'name':'date', 'type':'esriFieldTypeDate'},
+                  {'name':'race', 'type':'esriFieldTypeString'}, {'name':'gender', 'type':'esriFieldTypeString'},
+                  {'name':'age', 'type':'esriFieldTypeInteger'}, {'name':'description', 'type':'esriFieldTypeString'}]
+
+def _arcgis_features(offset, rows):
+    df = make_table(rows, offset)
+    df['date'] = df['date'].astype('int64') // 10**6  # ms since epoch
+    return [{'attributes':x} for x in df.to_dict('records')]
+
+
+def _socrata_records(offset, rows):
+    df = make_table(rows, offset)
+    df['date'] = df['date'].dt.strftime('%Y-%m-%dT%H:%M:%S.000')
+    return df.astype(str).to_dict('records')
+
+
+def _make_file(name):
+    rows, ext = name.split('.', 1)
+    df = make_table(int(rows))
+    if ext=='csv':
+        return df.to_csv(index=False).encode()
+    elif ext=='csv.zip':
+        b = io.BytesIO()
+        with zipfile.ZipFile(b, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr(f'{rows}.csv', df.to_csv(index=False))
+        return b.getvalue()
+    elif ext=='xlsx':
+        b = io.BytesIO()
+        df.to_excel(b, index=False)
+        return b.getvalue()
+    raise FileNotFoundError(name)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep connections alive like the portals do
+
+    def log_message(self, format, *args):
+        pass
+
+
+    def _send(self, body, content_type='application/json', status=200, headers=None, head=False):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for k,v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+        self.server.portal._sent(len(body) if not head else 0)
+
+
+    def _handle(self, head=False):
+        portal = self.server.portal
+        url = urlparse(self.path)
+        params = {k:v[-1] for k,v in parse_qs(url.query).items()}
+        time.sleep(portal.latency)
+        try:
+            if m := re.fullmatch(r'/arcgis/(\d+)/FeatureServer/0/?(query)?', url.path):
+                portal._count('ArcGIS')
+                self._arcgis(int(m[1]), m[2], params, head)
+            elif m := re.fullmatch(r'/socrata/(\d+)/resource/([\w-]+)\.json', url.path):
+                portal._count('Socrata')
+                self._socrata(int(m[1]), params, head)
+            elif m := re.fullmatch(r'/files/(\d+\.(?:csv|csv\.zip|xlsx))', url.path):
+                portal._count(portal.file_type(m[1]))
+                self._file(portal.file(m[1]), head)
+            else:
+                self._send({'error':'Not found'}, status=404, head=head)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+    def _arcgis(self, nrows, query, params, head):
+        portal = self.server.portal
+        if not query:
+            body = {'type':'Table', 'name':f'Stops {nrows}', 'maxRecordCount':portal.page_size, 'fields':_ARCGIS_FIELDS}
+        elif params.get('returnCountOnly', '').lower()=='true':
+            body = {'count':nrows}
+        else:
+            offset = int(params.get('resultOffset', 0))
+            count = min(int(params.get('resultRecordCount', portal.page_size)), portal.page_size, max(nrows-offset, 0))
+            body = {'fields':_ARCGIS_FIELDS, 'features':_arcgis_features(offset, count),
+                    'exceededTransferLimit':offset+count<nrows}
+        self._send(body, head=head)
+
+
+    def _socrata(self, nrows, params, head):
+        if params.get('$select', '').lower()=='count(*)':
+            body = [{'count':str(nrows)}]
+        else:
+            offset = int(params.get('$offset', 0))
+            count = min(int(params.get('$limit', 1000)), max(nrows-offset, 0))
+            body = _socrata_records(offset, count)
+        self._send(body, head=head)
+
+
+    def _file(self, data, head):
+        content_type = 'text/csv' if self.path.endswith('.csv') else 'application/octet-stream'
+        headers = {'Accept-Ranges':'bytes'}
+        m = re.fullmatch(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+        if m and (m[1] or m[2]):
+            size = len(data)
+            start, end = (int(m[1]), int(m[2]) if m[2] else size-1) if m[1] else (max(size-int(m[2]), 0), size-1)
+            end = min(end, size-1)
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+            self._send(data[start:end+1], content_type, 206, headers, head)
+        else:
+            self._send(data, content_type, headers=headers, head=head)
+
+
+    def do_GET(self):
+        self._handle()
+
+
+    def do_HEAD(self):
+        self._handle(head=True)
+
+
+class Portal:
+    '''Local HTTP server that stands in for data portals. See module docstring for the URLs that it serves.
+
+    latency is the number of seconds that each request waits before being answered. page_size is the
+    maximum number of rows returned by a query. requests counts requests by DataType.
+    '''
+    def __init__(self, latency=0, page_size=PAGE_SIZE, port=0):
+        self.latency = latency
+        self.page_size = page_size
+        self.requests = Counter()
+        self.bytes_sent = 0
+        self._files = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self._server.daemon_threads = True
+        self._server.portal = self
+        self._thread = None
+        self._client = None
+        self.host = f'127.0.0.1:{self._server.server_address[1]}'
+
+
+    def url(self, data_type, rows):
+        '''URL of a dataset of the DataType data_type with rows rows. Socrata URLs are domains as in the catalog
+        and the dataset ID is DATASET_ID.'''
+        if data_type=='ArcGIS':
+            return f'http://{self.host}/arcgis/{rows}/FeatureServer/0'
+        elif data_type=='Socrata':
+            return f'{self.host}/socrata/{rows}'
+        elif data_type in ['CSV', 'zip', 'Excel']:
+            return f'http://{self.host}/files/{rows}.' + {'CSV':'csv', 'zip':'csv.zip', 'Excel':'xlsx'}[data_type]
+        raise ValueError(f'Unknown DataType {data_type}')
+
+
+    @staticmethod
+    def file_type(name):
+        return 'zip' if name.endswith('.zip') else 'Excel' if name.endswith('.xlsx') else 'CSV'
+
+
+    def file(self, name):
+        '''Returns contents of a file. Files are generated once.'''
+        with self._lock:
+            if name not in self._files:
+                self._files[name] = _make_file(name)
+            return self._files[name]
+
+
+    def _count(self, data_type):
+        with self._lock:
+            self.requests[data_type]+=1
+
+
+    def _sent(self, nbytes):
+        with self._lock:
+            self.bytes_sent+=nbytes
+
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name='portal_standin')
+        self._thread.start()
+
+        # Route Socrata requests for this host over HTTP
+        self._client = socrata.SocrataClient
+        host = self.host
+        def client(domain, *args, **kwargs):
+            if domain.startswith(host):
+                kwargs['session_adapter'] = {'prefix':'http://', 'adapter':requests.adapters.HTTPAdapter()}
+            return sodapy.Socrata(domain, *args, **kwargs)
+        socrata.SocrataClient = client
+        return self
+
+
+    def stop(self):
+        if self._client:
+            socrata.SocrataClient = self._client
+            self._client = None
+        self._server.shutdown()
+        self._server.server_close()
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
@@ -0,0 +1,232 @@
+'''Benchmark dashboard_utils.load against a local stand-in for the data portals (see portal_standin.py)
+
+Measures the time to load a preview and to download each DataType at each size, the rows/s of downloads, the
+number of requests made, and peak memory (Python allocations measured with tracemalloc and the process's resident
+set size). Each run uses a new catalog version so that the dataset and metadata caches are cold.
+
+Results are written as JSON so that they can be compared between commits. Run from the repository root:
+    python scripts/benchmark_load.py --rows 1000 10000 --latency 0.05 --output before.json
+    python scripts/benchmark_load.py --rows 1000 10000 --latency 0.05 --output after.json --compare before.json
+'''
+import argparse
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import warnings
+
+# Caches must not be shared with the app or previous benchmarks
+_tmp = tempfile.mkdtemp(prefix='opd_explorer_benchmark_')
+os.environ['OPD_EXPLORER_CACHE_DIR'] = os.path.join(_tmp, 'datasets')
+os.environ['OPD_EXPLORER_METADATA_CACHE'] = os.path.join(_tmp, 'metadata')
+
+import openpolicedata as opd
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dashboard_utils
+import export
+import portal_standin
+
+PREVIEW_ROWS = 20
+MODES = ['preview', 'download']
+
+
+class PeakRSS:
+    '''Samples the resident set size of the process in a background thread. peak is in bytes.
+
+    If the resident set size cannot be sampled (i.e. not Linux), peak is the maximum resident set size of
+    the process so far.
+    '''
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._done = threading.Event()
+        self._page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else None
+
+
+    def _rss(self):
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1])*self._page_size
+        except (OSError, TypeError):
+            return None
+
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, self._rss() or 0)
+
+
+    def __enter__(self):
+        if self._rss() is not None:
+            self.peak = self._rss()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        else:
+            self._thread = None
+        return self
+
+
+    def __exit__(self, exc_type, exc, tb):
+        self._done.set()
+        if self._thread:
+            self._thread.join()
+            self.peak = max(self.peak, self._rss() or 0)
+        else:
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024  # KB on Linux
+        return False
+
+
+def make_catalog(portal, cases):
+    '''Catalog of a dataset for each (DataType, number of rows) in cases'''
+    rows = []
+    for data_type, n in cases:
+        rows.append({'State':'Virginia', 'SourceName':f'{data_type} {n}', 'Agency':f'{data_type} {n}', 'AgencyFull':f'{data_type} {n}',
+                     'TableType':'STOPS', 'Year':opd.defs.MULTI, 'Description':'Benchmark dataset',
+                     'DataType':'CSV' if data_type=='zip' else data_type, 'URL':portal.url(data_type, n),
+                     'date_field':None, 'dataset_id':portal_standin.DATASET_ID if data_type=='Socrata' else None,
+                     'agency_field':None, 'min_version':None, 'readme':None, 'source_url':None, 'coverage_start':None,
+                     'coverage_end':None, 'query':None, 'py_min_version':None})
+    return pd.DataFrame(rows)
+
+
+_nruns = 0
+def load(catalog, k, mode, fmt):
+    # Load with cold caches. Returns number of rows in the preview or None for downloads
+    global _nruns
+    _nruns+=1
+    selected_row = catalog.iloc[[k]].copy()
+    selected_row.attrs['version'] = f'benchmark-{_nruns}'
+    selection = {'year':opd.defs.MULTI, 'table':'STOPS', 'agency':None}
+    logger = logging.getLogger('benchmark')
+    if mode=='preview':
+        _, df, failed = dashboard_utils.load(selected_row, selection, PREVIEW_ROWS, logger=logger, use_streamlit=False)
+        nrows = len(df) if not failed else 0
+    else:
+        data, _, failed = dashboard_utils.load(selected_row, selection, logger=logger, use_streamlit=False, stream=True, fmt=fmt)
+        nrows = None
+        if hasattr(data, 'close'):
+            data.close()
+    if failed:
+        raise RuntimeError(f"{mode} of {selected_row.iloc[0]['URL']} failed")
+    return nrows
+
+
+def run_case(portal, catalog, cases, k, mode, fmt, repeat):
+    data_type, rows = cases[k]
+    times = []
+    nrequests = []
+    for _ in range(repeat):
+        before = sum(portal.requests.values())
+        start = time.perf_counter()
+        preview_rows = load(catalog, k, mode, fmt)
+        times.append(time.perf_counter()-start)
+        nrequests.append(sum(portal.requests.values())-before)
+
+    # Memory is measured separately since tracemalloc slows down loads
+    tracemalloc.start()
+    try:
+        with PeakRSS() as rss:
+            load(catalog, k, mode, fmt)
+        _, traced_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    seconds = statistics.median(times)
+    return {
+        'data_type':data_type,
+        'rows':rows,
+        'mode':mode,
+        'format':fmt if mode=='download' else 'CSV',
+        'rows_loaded':preview_rows if mode=='preview' else rows,
+        'seconds':seconds,  # Time to first preview for previews
+        'seconds_min':min(times),
+        'rows_per_second':rows/seconds if mode=='download' and seconds>0 else None,
+        'requests':int(statistics.median(nrequests)),
+        'tracemalloc_peak_bytes':traced_peak,
+        'rss_peak_bytes':rss.peak,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _key(result):
+    return (result['data_type'], result['rows'], result['mode'], result['format'])
+
+
+def format_results(results, baseline=None):
+    baseline = {_key(x):x for x in baseline['results']} if baseline else {}
+    lines = [f"{'DataType':<8} {'Rows':>8} {'Mode':<9} {'Time (s)':>9} {'Rows/s':>10} {'Requests':>8} {'Traced MB':>9} {'RSS MB':>7}" +
+             ('  vs. baseline' if baseline else '')]
+    for x in results:
+        rows_per_second = f"{x['rows_per_second']:,.0f}" if x['rows_per_second'] else '-'
+        line = f"{x['data_type']:<8} {x['rows']:>8} {x['mode']:<9} {x['seconds']:>9.3f} {rows_per_second:>10} {x['requests']:>8} "+\
+               f"{x['tracemalloc_peak_bytes']/2**20:>9.1f} {x['rss_peak_bytes']/2**20:>7.0f}"
+        if _key(x) in baseline:
+            line+=f"  {x['seconds']/baseline[_key(x)]['seconds']:.2f}x time"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Benchmark loading of previews and downloads from a local stand-in for data portals')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000], help='Dataset sizes (number of rows)')
+    parser.add_argument('--types', nargs='+', default=portal_standin.DATA_TYPES, choices=portal_standin.DATA_TYPES, help='DataTypes to benchmark')
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    parser.add_argument('--format', default=export.DEFAULT_FORMAT, choices=list(export.FORMATS), help='Output format of downloads')
+    parser.add_argument('--latency', type=float, default=0.05, help='Time (s) that the stand-in waits before answering each request')
+    parser.add_argument('--page-size', type=int, default=portal_standin.PAGE_SIZE, help='Maximum number of rows returned by each API request')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs of each case. The median time is reported.')
+    parser.add_argument('--output', default=None, help='JSON file to write results to')
+    parser.add_argument('--compare', default=None, help='JSON file of previous results to compare to')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    logging.getLogger('benchmark').setLevel(logging.WARNING)
+
+    results = []
+    with portal_standin.Portal(latency=args.latency, page_size=args.page_size) as portal:
+        cases = [(data_type, n) for data_type in args.types for n in args.rows]
+        catalog = make_catalog(portal, cases)
+        opd.datasets.reload(catalog)
+        for k in range(len(cases)):
+            for mode in args.modes:
+                results.append(run_case(portal, catalog, cases, k, mode, args.format, args.repeat))
+                print(format_results(results[-1:]).splitlines()[-1], flush=True)
+
+    output = {
+        'commit':git_commit(),
+        'time':datetime.now(timezone.utc).isoformat(),
+        'python':platform.python_version(),
+        'openpolicedata':opd.__version__,
+        'pandas':pd.__version__,
+        'config':{'latency':args.latency, 'page_size':args.page_size, 'repeat':args.repeat, 'preview_rows':PREVIEW_ROWS},
+        'results':results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print()
+    print(format_results(results, baseline))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
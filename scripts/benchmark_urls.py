@@ -0,0 +1,86 @@
+'''Benchmark generating OPD Explorer dataset finder URLs one at a time vs. in a batch
+
+Run from the repository root:
+    python scripts/benchmark_urls.py --n 2000
+'''
+import argparse
+import os
+import sys
+import time
+
+import openpolicedata as opd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import url
+import utils
+
+
+def get_url_per_call(state=None, source=None, table_type=None, url_type=None):
+    # Previous implementation of url.get_opd_explorer_dataset_url, which filters the whole catalog on each call
+    url = 'https://openpolicedata.streamlit.app' if url_type!='local' else 'http://localhost:8501'
+    url += '/Find_Datasets/'
+    df = opd.datasets.query()
+    pre = '?'
+    if state:
+        df = df[df['State']==state]
+        url+=pre+'state'+'='+state
+        pre = '&'
+    if source:
+        df = df[df['SourceName']==source]
+        url+=pre+'source'+'='+source
+        pre = '&'
+    if table_type:
+        df = df.copy()
+        df['TableTypeGeneral'],_,_ = utils.split_tables(df['TableType'].tolist())
+        df = df[df['TableTypeGeneral']==table_type]
+        url+=pre+'table'+'='+table_type
+        pre = '&'
+    return url if len(df)>0 else None
+
+
+def get_filters(n):
+    # Filters for every state, source, and table type in the catalog with some filters that do not match any datasets
+    df = opd.datasets.query()
+    general,_,_ = utils.split_tables(df['TableType'].tolist())
+    combos = list(dict.fromkeys(zip(df['State'], df['SourceName'], general)))
+    filters = []
+    for k in range(n):
+        state, source, table = combos[k % len(combos)]
+        if k % 5==1:
+            source = None
+        elif k % 5==2:
+            state = None
+        elif k % 5==3:
+            table = 'NOT A TABLE'
+        filters.append((state, source, table))
+    return filters
+
+
+def timeit(fcn):
+    start = time.perf_counter()
+    result = fcn()
+    return time.perf_counter()-start, result
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Benchmark URL generation for the OPD Explorer dataset finder page')
+    parser.add_argument('--n', type=int, default=2000, help='Number of URLs to generate')
+    parser.add_argument('--catalog', default=None, help='CSV file to use as the catalog instead of the OpenPoliceData catalog')
+    args = parser.parse_args()
+
+    if args.catalog:
+        opd.datasets.reload(args.catalog)
+
+    filters = get_filters(args.n)
+
+    t_old, expected = timeit(lambda: [get_url_per_call(*f) for f in filters])
+    t_single, single = timeit(lambda: [url.get_opd_explorer_dataset_url(*f) for f in filters])
+    t_batch, batch = timeit(lambda: url.get_opd_explorer_dataset_urls(filters))
+
+    assert single==expected
+    assert batch==expected
+
+    print(f"{len(filters)} URLs ({sum(x is None for x in expected)} filters without datasets)")
+    print(f"Per-call (previous implementation): {t_old:.3f} s")
+    print(f"Per-call (indexed catalog):         {t_single:.3f} s")
+    print(f"Batch:                              {t_batch:.3f} s ({t_old/t_batch:.0f}x faster than previous)")
@@ -1,24 +1,156 @@
+import copy
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import threading
+import warnings
+
+MAX_BYTES = 10*1024*1024  # Size at which log files are rotated
+BACKUP_COUNT = 5  # Number of rotated log files to keep
+QUEUE_SIZE = 10000  # Number of records buffered for the background thread that writes logs
+
+class RingBufferQueue(queue.Queue):
+    '''Bounded queue that drops the oldest record instead of blocking when it is full so that logging never waits on I/O'''
+    def __init__(self, maxsize=QUEUE_SIZE):
+        super().__init__(maxsize)
+        self.dropped = 0
+
+
+    def put(self, item, block=True, timeout=None):
+        with self.mutex:
+            if self.maxsize>0 and self._qsize()>=self.maxsize:
+                self._get()
+                self.dropped+=1
+                # The dropped record will never be marked as done by a consumer (see task_done)
+                self.unfinished_tasks -= 1
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+
+class JSONFormatter(logging.Formatter):
+    '''Formats records as JSON lines. Structured fields added to records (such as span from tracing) are included.'''
+    EXTRA_FIELDS = ['span']
+
+    def format(self, record):
+        out = {
+            'time':self.formatTime(record, self.datefmt),
+            'level':record.levelname,
+            'logger':record.name,
+            'thread':record.threadName,
+            'thread_id':record.thread,  # Thread names are not unique (i.e. Streamlit's script threads)
+            'message':record.getMessage(),
+        }
+        if record.exc_info:
+            out['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out['exception'] = record.exc_text
+        for field in self.EXTRA_FIELDS:
+            if hasattr(record, field):
+                out[field] = getattr(record, field)
+        return json.dumps(out, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    # Owns the listener that writes the records it queues. logging.shutdown closes it at exit, which writes the queued records.
+    def __init__(self, q, listener, format_options):
+        super().__init__(q)
+        self.listener = listener
+        self.format_options = format_options  # (addtime, json_format) that the logger was created with
+
+
+    def prepare(self, record):
+        # Unlike QueueHandler.prepare, the message is not formatted here so that the listener's formatters
+        # see the message and exception separately
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        record.stack_info = None
+        return record
+
+
+    def close(self):
+        with _lock:
+            if self.listener._thread is not None:
+                self.listener.stop()
+        for h in self.listener.handlers:
+            h.close()  # Closes log files. Console streams are not closed.
+        super().close()
+
+_lock = threading.Lock()
+
+def _make_formatter(addtime, json_format):
+    if json_format:
+        return JSONFormatter(datefmt='%Y-%m-%dT%H:%M:%S%z')
+    elif addtime:
+        return logging.Formatter("%(asctime)s :: %(message)s", '%y-%m-%d %H:%M:%S')
+    else:
+        return logging.Formatter('%(message)s', '%y-%m-%d %H:%M:%S')
+
+
+def _make_file_handler(file, max_bytes, backup_count, formatter):
+    handler = logging.handlers.RotatingFileHandler(file, 'a', maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+    handler.setFormatter(formatter)
+    return handler
+
+
+def _update(logger, handler, file, addtime, json_format, max_bytes, backup_count):
+    # Logger was already created. Add a file handler if one is requested and the logger does not have one.
+    if (addtime, json_format)!=handler.format_options:
+        warnings.warn(f"Logger {logger.name} was already created with addtime={handler.format_options[0]} and "+
+                      f"json_format={handler.format_options[1]}. Its format is not changed.")
+    if file is None:
+        return
+
+    listener = handler.listener
+    file_handlers = [h for h in listener.handlers if isinstance(h, logging.FileHandler)]
+    if len(file_handlers)==0:
+        # Handlers are read by the listener's thread so they are replaced instead of modified
+        listener.handlers = listener.handlers + (_make_file_handler(file, max_bytes, backup_count, listener.handlers[0].formatter),)
+    elif file_handlers[0].baseFilename!=os.path.abspath(file):
+        warnings.warn(f"Logger {logger.name} already writes to {file_handlers[0].baseFilename}. It will not write to {file}.")
+
 
 # https://discuss.streamlit.io/t/streamlit-duplicates-log-messages-when-stream-handler-is-added/16426/4
-def create_logger(name, level=logging.INFO, file=None, addtime=False):
+def create_logger(name, level=logging.INFO, file=None, addtime=False, json_format=False, max_bytes=MAX_BYTES,
+                  backup_count=BACKUP_COUNT, queue_size=QUEUE_SIZE):
+    '''Create logger that writes to the console and optionally a file.
+
+    Records are put in a bounded queue (see RingBufferQueue) and written by a background thread so that logging does not block
+    on I/O. The log file is appended to and rotated when it reaches max_bytes. If json_format is True, records are written as
+    JSON lines (see JSONFormatter). Handlers are only added the 1st time that the logger is created except that a file is added
+    if it is requested later. A warning is issued if the format or file conflicts with the existing logger.
+    '''
     logger = logging.getLogger(name)
     logger.propagate = False
     logger.setLevel(level)
-    if addtime:
-        format = "%(asctime)s :: %(message)s"
-    else:
-        format = '%(message)s'
-    #if no streamhandler present, add one
-    if sum([isinstance(handler, logging.StreamHandler) for handler in logger.handlers]) == 0:
-        ch = logging.StreamHandler()
-        ch.setFormatter(logging.Formatter(format, '%y-%m-%d %H:%M:%S'))
-        logger.addHandler(ch)
-    #if a file handler is requested, check for existence then add
-    if file is not None:
-        if sum([isinstance(handler, logging.FileHandler) for handler in logger.handlers]) == 0:
-            ch = logging.FileHandler(file, 'w')
-            ch.setFormatter(logging.Formatter(format, '%y-%m-%d %H:%M:%S'))
-            logger.addHandler(ch)
-        
+    with _lock:
+        #if a queue handler is present, only add a missing file
+        existing = [handler for handler in logger.handlers if isinstance(handler, _QueueHandler)]
+        if len(existing) > 0:
+            _update(logger, existing[0], file, addtime, json_format, max_bytes, backup_count)
+            return logger
+
+        formatter = _make_formatter(addtime, json_format)
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(formatter)
+        handlers = [stream_handler]
+        if file is not None:
+            handlers.append(_make_file_handler(file, max_bytes, backup_count, formatter))
+
+        q = RingBufferQueue(queue_size)
+        listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+        handler = _QueueHandler(q, listener, (addtime, json_format))
+        listener.start()
+        logger.addHandler(handler)
+
     return logger
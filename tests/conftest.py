@@ -2,6 +2,21 @@ import pytest
 import streamlit as st
 from streamlit.testing.v1 import AppTest
 
+import http_store
+
+def pytest_addoption(parser):
+    parser.addoption('--http-mode', default=http_store.MODE, choices=http_store.MODES,
+                     help='Record or replay HTTP requests to data portals (see http_store.py). Use auto to run tests offline after they have been run once.')
+    parser.addoption('--http-store', default=http_store.STORE_DIR, help='Directory of recorded HTTP requests')
+
+
+def pytest_configure(config):
+    # Runs before test modules import openpolicedata so that the request for the data catalog is recorded or replayed
+    mode = config.getoption('--http-mode')
+    if mode!='off':
+        http_store.install(http_store.HTTPStore(config.getoption('--http-store')), mode)
+
+
 @pytest.fixture(scope='session')
 def app(request):
     at = AppTest.from_file('opd_download_page.py', default_timeout=60)
@@ -12,7 +27,7 @@ def app(request):
 
 # Create testable download_button
 class DownloadButton(object): # Singleton class (only be created once)
-    def __new__(cls, label=None, data=None, file_name=None, mime=None):
+    def __new__(cls, label=None, data=None, file_name=None, mime=None, disabled=False):
         if not hasattr(cls, 'instance'):
             cls.instance = super(DownloadButton, cls).__new__(cls)
             cls.instance.value = False
@@ -21,6 +36,7 @@ class DownloadButton(object): # Singleton class (only be created once)
         cls.instance.data = data
         cls.instance.file_name = file_name
         cls.instance.mime = mime
+        cls.instance.disabled = disabled
 
         return cls.instance
     
@@ -28,10 +44,10 @@ class DownloadButton(object): # Singleton class (only be created once)
         self.value = True
   
 
-def download_button(label, data, file_name, mime):
-    btn = DownloadButton(label, data, file_name, mime)
+def download_button(label, data, file_name, mime, disabled=False):
+    btn = DownloadButton(label, data, file_name, mime, disabled)
 
-    out = btn.value
+    out = btn.value and not disabled
     if out and callable(btn.data):
         btn.data = data()
     # Set to False to revert value after a button click
@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+
+import catalog_index
+import utils
+
+@pytest.fixture(scope='module')
+def catalog():
+    df = pd.DataFrame({
+        'State':['Virginia']*5 + ['California']*3 + ['MULTIPLE'],
+        'SourceName':['Fairfax County']*3 + ['Richmond']*2 + ['Stockton', 'Stockton', 'Richmond', 'Stanford'],
+        'TableType':['STOPS', 'USE OF FORCE - INCIDENTS', 'USE OF FORCE - SUBJECTS', 'STOPS', 'STOPS', 
+                     'STOPS', 'CALLS FOR SERVICE', 'ARRESTS', 'STOPS'],
+        'Agency':['Fairfax County']*3 + ['Richmond', 'MULTIPLE', 'Stockton', 'Stockton', 'Richmond', 'MULTIPLE'],
+        'Year':[2020, 'MULTIPLE', 'MULTIPLE', 2021, 2021, 2022, 'MULTIPLE', 2019, 'MULTIPLE'],
+        'URL':['fairfax.gov', 'fairfax.gov', 'fairfax.gov', 'richmond.gov/1', 'richmond.gov/1', 'stockton.gov', 'stockton.gov',
+               'richmond.gov/2', 'stanford.edu'],
+        'dataset_id':[None, 'abcd-1234', 'efgh-5678', None, None, float('nan'), None, {'id':1}, None],
+    })
+    return df.sort_values(by=["State","SourceName","TableType"])
+
+
+def test_options(catalog):
+    index = catalog_index.CatalogIndex(catalog)
+
+    assert index.options()==list(catalog['State'].unique())
+    assert index.options('Virginia')==['Fairfax County', 'Richmond']
+    assert index.options(utils.ALL)==list(catalog['SourceName'].unique())
+    assert index.options('Virginia', 'Fairfax County')==['STOPS', 'USE OF FORCE']
+    assert index.options('Virginia', 'Fairfax County', 'USE OF FORCE')==['INCIDENTS', 'SUBJECTS']
+    assert index.options('Virginia', 'Fairfax County', 'STOPS')==[None]
+    assert index.options('Virginia', 'Richmond', 'STOPS', None)==['Richmond', 'MULTIPLE']
+    assert index.options('Virginia', 'Richmond', 'STOPS', None, 'MULTIPLE')==[2021]
+    assert index.options('Texas')==[]
+    assert index.options(utils.ALL, 'Richmond')==['ARRESTS', 'STOPS']
+
+
+@pytest.mark.parametrize('state', [utils.ALL, 'Virginia', 'California', 'MULTIPLE', 'Texas'])
+@pytest.mark.parametrize('source', [utils.ALL, 'Fairfax County', 'Richmond', 'Stockton'])
+@pytest.mark.parametrize('table', [utils.ALL, 'STOPS', 'USE OF FORCE'])
+def test_select_matches_filtering(catalog, state, source, table):
+    index = catalog_index.CatalogIndex(catalog)
+
+    expected = catalog
+    if state!=utils.ALL:
+        expected = expected[expected['State']==state]
+    if source!=utils.ALL:
+        expected = expected[expected['SourceName']==source]
+    if table!=utils.ALL:
+        general, _, _ = utils.split_tables(list(expected['TableType']))
+        expected = expected[pd.Series([x==table for x in general], index=expected.index, dtype=bool)]
+
+    pd.testing.assert_frame_equal(index.select(catalog, state, source, table), expected)
+
+
+def test_select_full_path(catalog):
+    index = catalog_index.CatalogIndex(catalog)
+
+    df = index.select(catalog, 'Virginia', 'Fairfax County', 'USE OF FORCE', 'SUBJECTS', 'Fairfax County', 'MULTIPLE')
+
+    assert df['TableType'].tolist()==['USE OF FORCE - SUBJECTS']
+    assert len(index.select(catalog, 'Virginia', 'Fairfax County', 'USE OF FORCE', 'SUBJECTS', 'Fairfax County', 2020))==0
+
+
+def test_join_tables():
+    for t in ['STOPS', 'USE OF FORCE - SUBJECTS', 'A - B - C']:
+        general, _, sub = utils.split_tables(t)
+        assert utils.join_tables(general, sub)==t
+
+
+@pytest.mark.parametrize('url, dataset_id, expected', [
+    ('fairfax.gov', 'abcd-1234', [('Fairfax County', 'USE OF FORCE - INCIDENTS')]),
+    ('fairfax.gov', None, [('Fairfax County', 'STOPS')]),
+    ('richmond.gov/1', None, [('Richmond', 'STOPS'), ('Richmond', 'STOPS')]),
+    ('richmond.gov/2', "{'id': 1}", [('Richmond', 'ARRESTS')]),
+    ('richmond.gov/2', None, [('Richmond', 'ARRESTS')]),  # URL is unique so dataset ID is not required
+    ('stockton.gov', None, [('Stockton', 'STOPS'), ('Stockton', 'CALLS FOR SERVICE')]),
+    ('fairfax.gov', 'not-an-id', []),
+    ('unknown.gov', None, []),
+])
+def test_find(catalog, url, dataset_id, expected):
+    index = catalog_index.CatalogIndex(catalog)
+
+    rows = index.find(url, dataset_id)
+
+    assert sorted(zip(catalog['SourceName'].iloc[rows], catalog['TableType'].iloc[rows]))==sorted(expected)
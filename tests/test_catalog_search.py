@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+import catalog_search
+
+@pytest.fixture
+def catalog():
+    return pd.DataFrame({
+        'State':['Virginia', 'Virginia', 'Virginia', 'California', 'Maryland'],
+        'SourceName':['Fairfax County', 'Fairfax County', 'Richmond', 'Los Angeles', 'Montgomery County'],
+        'AgencyFull':['Fairfax County Police Department', 'Fairfax County Police Department', 'Richmond Police Department', 
+                      None, 'Montgomery County Police Department'],
+        'TableType':['USE OF FORCE', 'TRAFFIC STOPS', 'USE OF FORCE', 'USE OF FORCE', 'OFFICER-INVOLVED SHOOTINGS'],
+        'Description':['Use of force incidents', None, 'Use of force by officers', 'Incidents in Virginia Park', 'Shootings'],
+    })
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('Fairfax', [0, 1]),
+    ('fairfx', [0, 1]),  # Typo
+    ('fair', [0, 1]),  # Prefix
+    ('use of force Virginia', [0, 2, 3]),  # Matches of Virginia in State are ranked above matches in Description
+    ('ofice shootings', [4]),
+    ('Richmond zzzz', [2]),  # Words that do not match anything are ignored
+])
+def test_search(catalog, query, expected):
+    search = catalog_search.CatalogSearch(catalog)
+
+    positions, scores = search.search(query)
+
+    assert positions==expected
+    assert scores==sorted(scores, reverse=True)
+
+
+@pytest.mark.parametrize('query', ['', '  ', 'zzzz', '!!'])
+def test_search_no_matches(catalog, query):
+    assert catalog_search.CatalogSearch(catalog).search(query)==([], [])
+
+
+def test_search_limit(catalog):
+    positions, scores = catalog_search.CatalogSearch(catalog).search('use of force', limit=2)
+    assert len(positions)==len(scores)==2
+
+
+def test_select(catalog):
+    search = catalog_search.CatalogSearch(catalog)
+
+    assert search.select(catalog, 'fairfax traffic').index.tolist()==[1]
+    assert search.select(catalog, 'use of force', rows=[2, 3]).index.tolist()==[2, 3]
+    assert search.rows('use of force', rows=[3, 2])==[2, 3]
@@ -0,0 +1,146 @@
+import os
+import pandas as pd
+import threading
+
+import catalog_snapshot
+import metadata_cache
+
+def make_catalog(version='v1'):
+    df = pd.DataFrame({
+        'State':['Virginia', 'California', 'Texas'],
+        'Year':[2020, 'MULTIPLE', 'NONE'],
+        'dataset_id':['abcd-1234', {'url':'test', 'id':1}, None],
+        'coverage_start':[pd.Timestamp('2015-01-01'), pd.NaT, pd.Timestamp('2020-06-30')],
+        'min_version':[None, '0.5', None],
+    })
+    df.attrs['version'] = version
+    return df
+
+
+def test_save_load(tmp_path):
+    path = str(tmp_path / 'catalog.parquet')
+    df = make_catalog()
+
+    catalog_snapshot.save(df, path)
+    df_loaded = catalog_snapshot.load(path)
+
+    assert df_loaded.attrs['version']=='v1'
+    assert df_loaded['Year'].tolist()==[2020, 'MULTIPLE', 'NONE']
+    assert df_loaded['dataset_id'].tolist()==['abcd-1234', {'url':'test', 'id':1}, None]
+    assert df_loaded['coverage_start'].iloc[0]==pd.Timestamp('2015-01-01')
+    assert pd.isnull(df_loaded['coverage_start'].iloc[1])
+    assert df_loaded['State'].tolist()==df['State'].tolist()
+    assert [x for x in os.listdir(tmp_path)]==['catalog.parquet']
+
+
+def test_save_load_nested(tmp_path):
+    path = str(tmp_path / 'catalog.parquet')
+    df = make_catalog()
+    df['dataset_id'] = [{'url':'test', 'id':1}, None, {'url':'test2', 'id':2}]
+
+    catalog_snapshot.save(df, path)
+
+    assert catalog_snapshot.load(path)['dataset_id'].tolist()==df['dataset_id'].tolist()
+
+
+def make_diff_catalog():
+    return pd.DataFrame({
+        'State':['Virginia', 'Virginia', 'Virginia', 'Texas'],
+        'SourceName':['Richmond', 'Richmond', 'Fairfax', 'Austin'],
+        'Agency':['Richmond', 'Richmond', 'Fairfax', 'Austin'],
+        'TableType':['STOPS', 'STOPS', 'ARRESTS', 'STOPS'],
+        'Year':[2020, 2021, 'MULTIPLE', 2020],
+        'URL':['richmond.gov', 'richmond.gov', 'fairfax.gov', 'austin.gov'],
+        'dataset_id':[None, None, {'id':1}, float('nan')],
+        'readme':['a', 'b', 'c', 'd'],
+    })
+
+
+def test_diff():
+    old = make_diff_catalog()
+    new = make_diff_catalog()
+    new.loc[1, 'readme'] = 'new'
+    new = new.drop(index=2)
+    new = pd.concat([new, old.iloc[[3]].assign(Year=2021)], ignore_index=True)
+
+    diff = catalog_snapshot.CatalogDiff(old, new)
+
+    assert diff.added[['State','Year']].values.tolist()==[['Texas', 2021]]
+    assert diff.removed['SourceName'].tolist()==['Fairfax']
+    assert diff.modified[['SourceName','Year','readme']].values.tolist()==[['Richmond', 2021, 'new']]
+    assert len(diff)==3
+    assert diff.datasets=={metadata_cache.dataset_key('Richmond', 'Virginia', 'STOPS', 'Richmond'),
+                           metadata_cache.dataset_key('Fairfax', 'Virginia', 'ARRESTS', 'Fairfax'),
+                           metadata_cache.dataset_key('Austin', 'Texas', 'STOPS', 'Austin')}
+
+
+def test_diff_snapshot(tmp_path):
+    # Catalogs loaded from a snapshot are not different from the catalog that was saved
+    path = str(tmp_path / 'catalog.parquet')
+    df = make_diff_catalog()
+    catalog_snapshot.save(df, path)
+
+    diff = catalog_snapshot.CatalogDiff(catalog_snapshot.load(path), df)
+
+    assert len(diff)==0
+    assert diff.datasets==set()
+
+
+def test_store_loads_without_snapshot(tmp_path):
+    path = str(tmp_path / 'catalog.parquet')
+    calls = []
+    def load_catalog(reload):
+        calls.append(reload)
+        return make_catalog()
+
+    store = catalog_snapshot.CatalogStore(load_catalog, path)
+
+    assert store.get().attrs['version']=='v1'
+    assert calls==[False]
+    assert catalog_snapshot.load(path).attrs['version']=='v1'
+    # Catalog is not refreshed until the refresh interval has passed
+    store.get()
+    assert calls==[False]
+
+
+def test_store_serves_snapshot_then_refreshes(tmp_path):
+    path = str(tmp_path / 'catalog.parquet')
+    df = make_diff_catalog()
+    df.attrs['version'] = 'v1'
+    catalog_snapshot.save(df, path)
+    release = threading.Event()
+    def load_catalog(reload):
+        # Catalog host is slow
+        release.wait(5)
+        df_new = make_diff_catalog()
+        df_new.loc[0, 'readme'] = 'new'
+        df_new.attrs['version'] = 'v2'
+        return df_new
+    changes = []
+    def on_change(old, new, diff):
+        changes.append((old.attrs['version'], new.attrs['version'], len(diff)))
+
+    store = catalog_snapshot.CatalogStore(load_catalog, path, on_change=on_change)
+
+    # Snapshot is returned while catalog is being refreshed
+    assert store.get().attrs['version']=='v1'
+    release.set()
+    store._refresh_thread.join(5)
+
+    assert store.get().attrs['version']=='v2'
+    assert changes==[('v1', 'v2', 1)]
+    assert catalog_snapshot.load(path).attrs['version']=='v2'
+
+
+def test_store_refresh_failure(tmp_path):
+    path = str(tmp_path / 'catalog.parquet')
+    catalog_snapshot.save(make_catalog('v1'), path)
+    def load_catalog(reload):
+        raise ConnectionError('Catalog host is down')
+
+    store = catalog_snapshot.CatalogStore(load_catalog, path)
+    assert store.get().attrs['version']=='v1'
+    store._refresh_thread.join(5)
+
+    assert store.get().attrs['version']=='v1'
+    assert store._refresh_thread.is_alive()==False
@@ -0,0 +1,207 @@
+import threading
+import time
+
+import coalesce
+
+def run_concurrently(fcn, n):
+    results = [None]*n
+    def run(k):
+        results[k] = fcn()
+    threads = [threading.Thread(target=run, args=(k,)) for k in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_single_flight_coalesces():
+    flight = coalesce.SingleFlight()
+    calls = []
+    def fcn(progress):
+        calls.append(1)
+        time.sleep(0.2)
+        return object()
+
+    results = run_concurrently(lambda: flight.do('key', fcn), 5)
+
+    assert len(calls)==1
+    assert all(r[0] is results[0][0] for r in results)
+    assert all(r[1] for r in results)
+    assert flight.deduplicated==4
+
+
+def test_single_flight_share():
+    flight = coalesce.SingleFlight()
+    def fcn(progress):
+        time.sleep(0.2)
+        return 'result'
+
+    ncallers = []
+    def share(result, n):
+        ncallers.append(n)
+        return [f'{result}{k}' for k in range(n)]
+    results = run_concurrently(lambda: flight.do('key', fcn, share=share), 3)
+
+    assert ncallers==[3]
+    assert sorted(r[0] for r in results)==['result0', 'result1', 'result2']
+
+
+def test_single_flight_sequential_not_shared():
+    flight = coalesce.SingleFlight()
+
+    assert flight.do('key', lambda progress: 1)==(1, False)
+    assert flight.do('key', lambda progress: 2)==(2, False)
+    assert flight.deduplicated==0
+
+
+def test_single_flight_different_keys():
+    flight = coalesce.SingleFlight()
+    calls = []
+    def fcn(progress):
+        calls.append(1)
+        time.sleep(0.1)
+
+    run_concurrently(lambda: flight.do(len(calls), fcn), 1)
+    run_concurrently(lambda: flight.do(len(calls), fcn), 1)
+
+    assert len(calls)==2
+
+
+def test_single_flight_error_shared():
+    flight = coalesce.SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    def fcn(progress):
+        started.set()
+        release.wait(5)
+        raise ValueError('Test')
+
+    errors = []
+    def call():
+        try:
+            flight.do('key', fcn)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    waiter = threading.Thread(target=call)
+    waiter.start()
+    while flight.deduplicated==0:
+        time.sleep(0.01)
+    release.set()
+    leader.join()
+    waiter.join()
+
+    assert len(errors)==2
+
+
+def test_single_flight_progress():
+    flight = coalesce.SingleFlight()
+    stop = {'a':False, 'b':False}
+    received = {'a':[], 'b':[]}
+    def listener(name):
+        def progress(k):
+            if stop[name]:
+                raise ValueError(name)
+            received[name].append(k)
+        return progress
+
+    joined = threading.Event()
+    def fcn(progress):
+        joined.wait(5)
+        for k in range(100):
+            progress(k)
+            stop['a'] = stop['a'] or k==10
+            stop['b'] = stop['b'] or k==20
+
+    errors = []
+    def call(name):
+        try:
+            flight.do('key', fcn, listener(name))
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call, args=(name,)) for name in ['a','b']]
+    threads[0].start()
+    while 'key' not in flight._calls:
+        time.sleep(0.01)
+    threads[1].start()
+    while flight.deduplicated==0:
+        time.sleep(0.01)
+    joined.set()
+    for t in threads:
+        t.join()
+
+    # Load continues after the 1st caller stops and stops when all callers stop. Each caller receives its own error
+    assert received['a']==list(range(11))
+    assert received['b']==list(range(21))
+    assert errors==['a', 'b']
+
+
+def test_single_flight_cancelled_caller_does_not_stop_others():
+    flight = coalesce.SingleFlight()
+    release = threading.Event()
+    def fcn(progress):
+        while not release.is_set():
+            progress()
+            time.sleep(0.01)
+        return 'done'
+
+    def cancelled():
+        raise ValueError('cancelled')
+
+    results = {}
+    def call(name, progress):
+        try:
+            results[name] = flight.do('key', fcn, progress)
+        except ValueError as e:
+            results[name] = str(e)
+
+    leader = threading.Thread(target=call, args=('leader', lambda: None))
+    leader.start()
+    while 'key' not in flight._calls:
+        time.sleep(0.01)
+    waiter = threading.Thread(target=call, args=('waiter', cancelled))
+    waiter.start()
+
+    # Cancelled caller stops waiting while the call continues for the leader
+    waiter.join(5)
+    assert results['waiter']=='cancelled'
+    assert leader.is_alive()
+    release.set()
+    leader.join()
+    assert results['leader']==('done', True)
+
+
+def test_single_flight_stopped_call_not_joined():
+    flight = coalesce.SingleFlight()
+    stopped = threading.Event()
+    release = threading.Event()
+    def stopping(progress):
+        try:
+            progress()
+        finally:
+            stopped.set()
+            release.wait(5)
+
+    def cancelled():
+        raise ValueError('cancelled')
+
+    errors = []
+    def call():
+        try:
+            flight.do('key', stopping, cancelled)
+        except ValueError as e:
+            errors.append(e)
+    t = threading.Thread(target=call)
+    t.start()
+    stopped.wait(5)
+
+    # Call is still in flight but has been stopped so a new call is made
+    assert flight.do('key', lambda progress: 1)==(1, False)
+    release.set()
+    t.join()
+    assert len(errors)==1
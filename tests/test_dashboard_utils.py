@@ -0,0 +1,328 @@
+import logging
+import pytest
+import threading
+import time
+from types import SimpleNamespace
+import pandas as pd
+
+import coalesce
+import dashboard_utils
+import dataset_cache
+import jobs
+import metadata_cache
+import tracing
+import openpolicedata as opd
+
+@pytest.fixture(autouse=True)
+def metadata(tmp_path, monkeypatch):
+    # Do not use or fill the persistent metadata cache
+    cache = metadata_cache.MetadataCache(metadata_cache.SQLiteBackend(str(tmp_path / 'metadata.sqlite')))
+    monkeypatch.setattr(metadata_cache, '_cache', cache)
+    return cache
+
+
+def test_load_from_cache(tmp_path, monkeypatch):
+    cache = dataset_cache.DatasetCache(str(tmp_path))
+    monkeypatch.setattr(dataset_cache, '_cache', cache)
+
+    ds = pd.DataFrame({'SourceName':['Test'], 'State':['Virginia'], 'Agency':['Test'], 'DataType':['ArcGIS'], 
+                       'URL':['https://www.test.com'], 'dataset_id':['1']})
+    ds.attrs['version'] = 'v1'
+    selection = {'year':2020, 'table':'STOPS', 'agency':None}
+    df = pd.DataFrame({'a':range(10)})
+    cache.put(dashboard_utils.get_cache_key(ds.iloc[0], selection, 'v1'), df.to_csv(index=False).encode())
+
+    data, df_prev, load_failure = dashboard_utils.load(ds, selection, 5, logger=logging.getLogger(), use_streamlit=False)
+
+    assert not load_failure
+    assert data is None
+    pd.testing.assert_frame_equal(df_prev, df.head(5))
+
+    data, df_prev, load_failure = dashboard_utils.load(ds, selection, logger=logging.getLogger(), use_streamlit=False)
+
+    assert not load_failure
+    pd.testing.assert_frame_equal(pd.read_csv(data), df)
+    assert cache.hits==2
+
+
+class FakeSource:
+    # Stands in for opd.Source for an API dataset
+    requested = []
+    def __init__(self, *args, **kwargs):
+        self.df = pd.DataFrame({'a':range(12000), 'b':'x'})
+
+    def get_count(self, **kwargs):
+        return len(self.df)
+    
+    def load(self, nrows=None, offset=0, **kwargs):
+        FakeSource.requested.append((offset, nrows))
+        return SimpleNamespace(table=self.df.iloc[offset:offset+nrows])
+
+
+def test_download_resumes_after_preview(tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_cache, '_cache', dataset_cache.DatasetCache(str(tmp_path)))
+    monkeypatch.setattr(opd, 'Source', FakeSource)
+    FakeSource.requested = []
+
+    ds = pd.DataFrame({'SourceName':['Test'], 'State':['Virginia'], 'Agency':['Test'], 'DataType':['ArcGIS'], 
+                       'URL':['https://www.test.com'], 'dataset_id':['1']})
+    selection = {'year':2020, 'table':'STOPS', 'agency':None}
+    logger = logging.getLogger()
+
+    _, df_prev, _ = dashboard_utils.load(ds, selection, 20, logger=logger, use_streamlit=False)
+    assert len(df_prev)==20
+    # Larger preview only loads new rows
+    _, df_prev, _ = dashboard_utils.load(ds, selection, 30, logger=logger, use_streamlit=False)
+    assert len(df_prev)==30
+    # Smaller preview loads no rows
+    _, df_prev, _ = dashboard_utils.load(ds, selection, 5, logger=logger, use_streamlit=False)
+    assert len(df_prev)==5
+
+    data, _, load_failure = dashboard_utils.load(ds, selection, logger=logger, use_streamlit=False, stream=True)
+
+    assert not load_failure
+    # Pages are requested concurrently so order of requests is not fixed
+    assert sorted(FakeSource.requested)==[(0,20), (20,10), (30,5000), (5030,5000), (10030,1970)]
+    pd.testing.assert_frame_equal(pd.read_csv(data), FakeSource().df)
+
+
+@pytest.mark.parametrize('fmt', ['Parquet', 'Feather'])
+def test_download_format(tmp_path, monkeypatch, fmt):
+    monkeypatch.setattr(dataset_cache, '_cache', dataset_cache.DatasetCache(str(tmp_path)))
+    monkeypatch.setattr(opd, 'Source', FakeSource)
+    FakeSource.requested = []
+
+    ds = pd.DataFrame({'SourceName':['Test'], 'State':['Virginia'], 'Agency':['Test'], 'DataType':['ArcGIS'], 
+                       'URL':['https://www.test.com'], 'dataset_id':['1']})
+    selection = {'year':2020, 'table':'STOPS', 'agency':None}
+
+    data, _, load_failure = dashboard_utils.load(ds, selection, logger=logging.getLogger(), use_streamlit=False, stream=True, fmt=fmt)
+
+    assert not load_failure
+    read = pd.read_parquet if fmt=='Parquet' else pd.read_feather
+    pd.testing.assert_frame_equal(read(data), FakeSource().df)
+
+
+@pytest.mark.parametrize('fmt', ['Parquet', 'Feather'])
+def test_download_format_after_csv(tmp_path, monkeypatch, fmt):
+    # Types of the loaded data are kept instead of being read from previously loaded CSV data
+    monkeypatch.setattr(dataset_cache, '_cache', dataset_cache.DatasetCache(str(tmp_path)))
+    class ZipSource(FakeSource):
+        def __init__(self, *args, **kwargs):
+            self.df = pd.DataFrame({'a':range(12000), 'zip':'02134'})
+    monkeypatch.setattr(opd, 'Source', ZipSource)
+
+    ds = pd.DataFrame({'SourceName':['Test'], 'State':['Virginia'], 'Agency':['Test'], 'DataType':['ArcGIS'], 
+                       'URL':['https://www.test.com'], 'dataset_id':['1']})
+    selection = {'year':2020, 'table':'STOPS', 'agency':None}
+    data, _, _ = dashboard_utils.load(ds, selection, logger=logging.getLogger(), use_streamlit=False, stream=True)
+    data.close()
+
+    data, _, load_failure = dashboard_utils.load(ds, selection, logger=logging.getLogger(), use_streamlit=False, stream=True, fmt=fmt)
+
+    assert not load_failure
+    read = pd.read_parquet if fmt=='Parquet' else pd.read_feather
+    pd.testing.assert_frame_equal(read(data), ZipSource().df)
+    data.close()
+
+
+def test_compressed_download_resumes_after_preview(tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_cache, '_cache', dataset_cache.DatasetCache(str(tmp_path)))
+    monkeypatch.setattr(opd, 'Source', FakeSource)
+    FakeSource.requested = []
+
+    ds = pd.DataFrame({'SourceName':['Test'], 'State':['Virginia'], 'Agency':['Test'], 'DataType':['ArcGIS'], 
+                       'URL':['https://www.test.com'], 'dataset_id':['1']})
+    selection = {'year':2020, 'table':'STOPS', 'agency':None}
+    logger = logging.getLogger()
+
+    dashboard_utils.load(ds, selection, 20, logger=logger, use_streamlit=False)
+    data, _, load_failure = dashboard_utils.load(ds, selection, logger=logger, use_streamlit=False, stream=True, fmt='CSV (gzip)')
+
+    assert not load_failure
+    # Pages are requested from multiple threads so the order of requests is not fixed
+    assert min(x[0] for x in FakeSource.requested[1:])==20
+    pd.testing.assert_frame_equal(pd.read_csv(data, compression='gzip'), FakeSource().df)
+
+
+def test_download_cancelled(tmp_path, monkeypatch):
+    cache = dataset_cache.DatasetCache(str(tmp_path))
+    monkeypatch.setattr(dataset_cache, '_cache', cache)
+    monkeypatch.setattr(opd, 'Source', FakeSource)
+
+    ds = pd.DataFrame({'SourceName':['Test'], 'State':['Virginia'], 'Agency':['Test'], 'DataType':['ArcGIS'], 
+                       'URL':['https://www.test.com'], 'dataset_id':['1']})
+    selection = {'year':2020, 'table':'STOPS', 'agency':None}
+    job = jobs.Job(None, jobs.DOWNLOAD)
+    job.cancel()
+
+    # Cancelled loads are not failures
+    with pytest.raises(jobs.JobCancelled):
+        dashboard_utils.load(ds, selection, logger=logging.getLogger(), use_streamlit=False, stream=True, progress=job.update)
+
+    assert cache.stats()['entries']==0
+
+
+def test_concurrent_loads_coalesced(tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_cache, '_cache', dataset_cache.DatasetCache(str(tmp_path)))
+    monkeypatch.setattr(dashboard_utils, 'inflight_loads', coalesce.SingleFlight())
+
+    class SlowSource(FakeSource):
+        counts = []
+        def get_count(self, **kwargs):
+            SlowSource.counts.append(1)
+            time.sleep(0.5)
+            return super().get_count(**kwargs)
+        
+    monkeypatch.setattr(opd, 'Source', SlowSource)
+
+    ds = pd.DataFrame({'SourceName':['Test'], 'State':['Virginia'], 'Agency':['Test'], 'DataType':['ArcGIS'], 
+                       'URL':['https://www.test.com'], 'dataset_id':['1']})
+    selection = {'year':2020, 'table':'STOPS', 'agency':None}
+
+    results = [None]*4
+    def run(k):
+        results[k] = dashboard_utils.load(ds, selection, logger=logging.getLogger(), use_streamlit=False, stream=True)
+    threads = [threading.Thread(target=run, args=(k,)) for k in range(len(results))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(SlowSource.counts)==1
+    assert dashboard_utils.inflight_loads.deduplicated==len(results)-1
+    # Each caller gets its own file
+    assert len({id(x[0]) for x in results})==len(results)
+    for data, _, load_failure in results:
+        assert not load_failure
+        pd.testing.assert_frame_equal(pd.read_csv(data), FakeSource().df)
+        data.close()
+
+
+def test_cancelled_load_shared(tmp_path, monkeypatch):
+    # Cancelling one of the loads sharing a load is not a failure and does not stop the other load
+    monkeypatch.setattr(dataset_cache, '_cache', dataset_cache.DatasetCache(str(tmp_path)))
+    monkeypatch.setattr(dashboard_utils, 'inflight_loads', coalesce.SingleFlight())
+
+    class SlowSource(FakeSource):
+        def load(self, **kwargs):
+            time.sleep(0.1)
+            return super().load(**kwargs)
+    monkeypatch.setattr(opd, 'Source', SlowSource)
+
+    ds = pd.DataFrame({'SourceName':['Test'], 'State':['Virginia'], 'Agency':['Test'], 'DataType':['ArcGIS'], 
+                       'URL':['https://www.test.com'], 'dataset_id':['1']})
+    selection = {'year':2020, 'table':'STOPS', 'agency':None}
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger = logging.getLogger('test_cancelled_load_shared')
+    logger.addHandler(handler)
+
+    load_jobs = [jobs.Job(lambda job: dashboard_utils.load(ds, selection, logger=logger, use_streamlit=False, stream=True, progress=job.update), 
+                          jobs.DOWNLOAD) for _ in range(2)]
+    threads = [threading.Thread(target=job._run) for job in load_jobs]
+    threads[0].start()
+    while not dashboard_utils.inflight_loads._calls:
+        time.sleep(0.01)
+    threads[1].start()
+    while dashboard_utils.inflight_loads.deduplicated==0:
+        time.sleep(0.01)
+    load_jobs[1].cancel()
+    for t in threads:
+        t.join()
+
+    assert load_jobs[1].state==jobs.CANCELLED
+    assert isinstance(load_jobs[1].error, jobs.JobCancelled)
+    assert load_jobs[0].state==jobs.DONE
+    data, _, load_failure = load_jobs[0].result
+    assert not load_failure
+    pd.testing.assert_frame_equal(pd.read_csv(data), FakeSource().df)
+    assert not any(x.getMessage()=='Load failure occurred' for x in records)
+
+    logger.removeHandler(handler)
+
+
+def test_record_count_logged_by_load_thread(tmp_path, monkeypatch):
+    # Count is requested from another thread but must be logged from the thread of the load (see log_analytics)
+    monkeypatch.setattr(dataset_cache, '_cache', dataset_cache.DatasetCache(str(tmp_path)))
+    monkeypatch.setattr(opd, 'Source', FakeSource)
+    ds = pd.DataFrame({'SourceName':['Test'], 'State':['Virginia'], 'Agency':['Test'], 'DataType':['ArcGIS'], 
+                       'URL':['https://www.test.com'], 'dataset_id':['1']})
+    selection = {'year':2020, 'table':'STOPS', 'agency':None}
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger = logging.getLogger('test_record_count_logged_by_load_thread')
+    logger.addHandler(handler)
+    monkeypatch.setattr(logger, 'level', logging.INFO)
+
+    dashboard_utils.load(ds, selection, logger=logger, use_streamlit=False, stream=True)
+    logger.removeHandler(handler)
+
+    counts = [x for x in records if x.getMessage().startswith('record_count')]
+    assert [x.getMessage() for x in counts]==['record_count: 12000']
+    assert counts[0].thread==threading.get_ident()
+
+
+def test_count_not_cached(tmp_path, monkeypatch, metadata):
+    # Rows added to a dataset since the last load are loaded
+    monkeypatch.setattr(dataset_cache, '_cache', dataset_cache.DatasetCache(str(tmp_path / 'data')))
+    class GrowingSource(FakeSource):
+        nrows = 12000
+        def __init__(self, *args, **kwargs):
+            self.df = pd.DataFrame({'a':range(GrowingSource.nrows), 'b':'x'})
+    monkeypatch.setattr(opd, 'Source', GrowingSource)
+
+    ds = pd.DataFrame({'SourceName':['Test'], 'State':['Virginia'], 'Agency':['Test'], 'DataType':['ArcGIS'], 
+                       'URL':['https://www.test.com'], 'dataset_id':['1']})
+    ds.attrs['version'] = 'v1'
+    selection = {'year':2020, 'table':'STOPS', 'agency':None}
+
+    dashboard_utils.load(ds, selection, logger=logging.getLogger(), use_streamlit=False, stream=True)
+    dataset_cache.get_cache().clear()
+    GrowingSource.nrows = 13000
+    data, _, _ = dashboard_utils.load(ds, selection, logger=logging.getLogger(), use_streamlit=False, stream=True)
+
+    assert len(pd.read_csv(data))==13000
+    assert metadata.hits+metadata.misses==0
+
+
+@pytest.mark.parametrize('years, expected', [
+    ([2020, 2022, 2021, 2022], ['2022', '2021', '2020']),
+    ([2020, opd.defs.MULTI], None),
+    ([opd.defs.NA], None),
+    ([], None),
+])
+def test_get_catalog_years(years, expected):
+    rows = pd.DataFrame({'Year':years}, dtype=object)
+    assert dashboard_utils.get_catalog_years(rows)==expected
+
+
+def test_load_traced(tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_cache, '_cache', dataset_cache.DatasetCache(str(tmp_path)))
+    monkeypatch.setattr(opd, 'Source', FakeSource)
+    monkeypatch.setattr(tracing, '_enabled', True)
+    monkeypatch.setattr(tracing.logger, 'level', logging.INFO)
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    tracing.logger.addHandler(handler)
+
+    ds = pd.DataFrame({'SourceName':['Test'], 'State':['Virginia'], 'Agency':['Test'], 'DataType':['ArcGIS'], 
+                       'URL':['https://www.test.com'], 'dataset_id':['1']})
+    selection = {'year':2020, 'table':'STOPS', 'agency':None}
+    try:
+        dashboard_utils.load(ds, selection, logger=logging.getLogger(), use_streamlit=False, stream=True)
+    finally:
+        tracing.logger.removeHandler(handler)
+
+    spans = [r.span for r in records if hasattr(r, 'span')]
+    load = [s for s in spans if s['name']=='load'][0]
+    assert load['url']=='https://www.test.com'
+    assert load['data_type']=='ArcGIS'
+    assert all(s['trace_id']==load['trace_id'] for s in spans)
+    assert {s['name'] for s in spans}=={'load', 'load.cache_lookup', 'load.count', 'load.page', 'load.stream'}
+    assert [s['rows'] for s in spans if s['name']=='load.stream']==[12000]
+    assert [s['rows'] for s in spans if s['name']=='load.count']==[12000]
+    assert sum(s['rows'] for s in spans if s['name']=='load.page')==12000
@@ -0,0 +1,94 @@
+import os
+import time
+
+from dataset_cache import DatasetCache
+
+def test_miss(tmp_path):
+    cache = DatasetCache(str(tmp_path))
+
+    assert cache.get(('url', 'id'))==None
+    assert cache.misses==1
+    assert cache.hits==0
+
+
+def test_hit(tmp_path):
+    cache = DatasetCache(str(tmp_path))
+    key = ('url', 'id', 2020)
+
+    path = cache.put(key, [b'a,b\n', b'1,2\n'])
+
+    assert cache.get(key)==path
+    with open(path, 'rb') as f:
+        assert f.read()==b'a,b\n1,2\n'
+    assert cache.hits==1
+    assert cache.stats()=={'hits':1, 'misses':0, 'entries':1, 'bytes':8}
+
+
+def test_ttl(tmp_path):
+    cache = DatasetCache(str(tmp_path), ttl=0)
+    key = ('url', 'id')
+
+    cache.put(key, b'test')
+    time.sleep(0.01)
+
+    assert cache.get(key)==None
+    assert cache.stats()['entries']==0
+
+
+def test_lru_eviction(tmp_path):
+    cache = DatasetCache(str(tmp_path), max_bytes=10)
+
+    path1 = cache.put(('1',), b'x'*4)
+    path2 = cache.put(('2',), b'x'*4)
+    # Make 1st entry the most recently used
+    os.utime(path2, (time.time()-10, time.time()-10))
+    cache.get(('1',))
+    cache.put(('3',), b'x'*4)
+
+    assert cache.get(('1',))==path1
+    assert cache.get(('2',))==None
+    assert cache.get(('3',))!=None
+
+
+def test_entry_larger_than_budget_kept(tmp_path):
+    cache = DatasetCache(str(tmp_path), max_bytes=2)
+
+    path = cache.put(('1',), b'x'*4)
+
+    assert os.path.exists(path)
+
+
+def test_open_files_not_evicted(tmp_path):
+    cache = DatasetCache(str(tmp_path), max_bytes=1000)
+
+    path = cache.put(('1',), b'x'*800)
+    f1 = cache.open(path)
+    f2 = cache.open(path)
+    cache.put(('2',), b'y'*800)
+    assert os.path.exists(path)
+    # Files are read separately
+    assert f1.read()==b'x'*800
+    assert f2.read(10)==b'x'*10
+    f1.close()
+    cache.put(('3',), b'z'*100)
+    assert os.path.exists(path)
+
+    f2.close()
+    cache.put(('4',), b'z'*300)
+    assert not os.path.exists(path)
+
+
+def test_no_partial_files_on_failure(tmp_path):
+    cache = DatasetCache(str(tmp_path))
+
+    def chunks():
+        yield b'test'
+        raise ValueError()
+    
+    try:
+        cache.put(('1',), chunks())
+    except ValueError:
+        pass
+
+    assert len(os.listdir(tmp_path))==0
+    assert cache.get(('1',))==None
@@ -0,0 +1,128 @@
+from io import BytesIO
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import export
+
+def test_iter_csv_header_only_first():
+    tables = [pd.DataFrame({'a':[1,2], 'b':['x','y']}), pd.DataFrame({'a':[3], 'b':['z']})]
+
+    chunks = list(export.iter_csv(tables))
+
+    assert len(chunks)==2
+    assert chunks[0].startswith(b'a,b\n')
+    assert chunks[1]==b'3,z\n'
+
+
+def test_iter_csv_column_order():
+    tables = [pd.DataFrame({'a':[1], 'b':['x']}), pd.DataFrame({'b':['z'], 'a':[3]})]
+
+    chunks = list(export.iter_csv(tables))
+
+    assert chunks[1]==b'3,z\n'
+
+
+def get_tables():
+    tables = [pd.DataFrame({'a':range(k*5, (k+1)*5), 'b':['x',1,None,'y','z'], 'c':None, 
+                            'd':pd.date_range('2020-01-01', periods=5)}) for k in range(3)]
+    tables[1]['c'] = 'test'
+    return tables
+
+
+@pytest.mark.parametrize('fmt', ['Parquet', 'Feather'])
+def test_iter_chunks_columnar(fmt):
+    tables = get_tables()
+
+    chunks = list(export.iter_chunks(iter(tables), fmt))
+
+    # 1 chunk per table plus file footer
+    assert len(chunks)==len(tables)+1
+    read = pd.read_parquet if fmt=='Parquet' else pd.read_feather
+    df = read(BytesIO(b''.join(chunks)))
+    df_true = pd.concat(tables, ignore_index=True)
+    df_true['b'] = df_true['b'].apply(lambda x: x if pd.isnull(x) else str(x))
+
+    pd.testing.assert_frame_equal(df, df_true, check_dtype=False)
+    assert df['a'].dtype=='int64'
+    assert df['d'].dtype.kind=='M'
+
+
+def test_parquet_compression():
+    import pyarrow.parquet as pq
+    data = b''.join(export.iter_chunks(get_tables(), 'Parquet'))
+
+    assert pq.ParquetFile(BytesIO(data)).metadata.row_group(0).column(0).compression=='ZSTD'
+
+
+def read_columnar(chunks, fmt):
+    read = pd.read_parquet if fmt=='Parquet' else pd.read_feather
+    return read(BytesIO(b''.join(chunks)))
+
+
+@pytest.mark.parametrize('fmt', ['Parquet', 'Feather'])
+def test_iter_chunks_null_then_float(fmt):
+    tables = [pd.DataFrame({'a':[1,2], 'b':[None,None]}), pd.DataFrame({'a':[3,4], 'b':[1.5,2.5]})]
+
+    df = read_columnar(export.iter_chunks(tables, fmt), fmt)
+
+    assert df['b'].dtype=='float64'
+    assert df['b'].tolist()[2:]==[1.5,2.5]
+    assert df['b'].isnull().tolist()==[True,True,False,False]
+
+
+@pytest.mark.parametrize('fmt', ['Parquet', 'Feather'])
+def test_iter_chunks_int_then_float(fmt):
+    tables = [pd.DataFrame({'a':[1,2]}), pd.DataFrame({'a':[3.5,None]})]
+
+    df = read_columnar(export.iter_chunks(tables, fmt), fmt)
+
+    assert df['a'].dtype=='float64'
+    assert df['a'].tolist()[:3]==[1,2,3.5]
+
+
+@pytest.mark.parametrize('fmt', ['Parquet', 'Feather'])
+def test_iter_chunks_later_conflict(fmt):
+    # Column types are determined from all tables
+    tables = [pd.DataFrame({'zip':[22030, 22031]}) for _ in range(3)] + [pd.DataFrame({'zip':['22030-1234', None]})]
+
+    df = read_columnar(export.iter_chunks(tables, fmt), fmt)
+
+    assert df['zip'].tolist()==['22030', '22031']*3 + ['22030-1234', None]
+
+
+@pytest.mark.parametrize('fmt', ['Parquet', 'Feather'])
+def test_iter_chunks_large_int_then_float(fmt):
+    # Integers that cannot be converted to floats exactly are written as strings
+    tables = [pd.DataFrame({'a':[2**60]}), pd.DataFrame({'a':[1.5]})]
+
+    df = read_columnar(export.iter_chunks(tables, fmt), fmt)
+
+    assert df['a'].tolist()==[str(2**60), '1.5']
+
+
+@pytest.mark.parametrize('fmt', ['Parquet', 'Feather'])
+def test_iter_chunks_empty(fmt):
+    assert list(export.iter_chunks([], fmt))==[]
+
+
+def test_get_filename():
+    assert export.get_filename('test.csv', 'Parquet')=='test.parquet'
+    assert export.get_filename('test.csv', 'CSV')=='test.csv'
+
+
+@pytest.mark.parametrize('fmt, compression', [('CSV (gzip)','gzip'), ('CSV (zstd)','zstd')])
+def test_iter_chunks_compressed(fmt, compression):
+    tables = [pd.DataFrame({'a':range(k*1000, (k+1)*1000), 'b':'x'}) for k in range(5)]
+
+    data = b''.join(export.iter_chunks(tables, fmt))
+
+    with pa.CompressedInputStream(pa.BufferReader(data), compression) as f:
+        df = pd.read_csv(f)
+    pd.testing.assert_frame_equal(df, pd.concat(tables, ignore_index=True))
+    assert len(data) < len(b''.join(export.iter_csv(tables)))/2
+
+
+def test_compress_uncompressed():
+    chunks = [b'a,b\n', b'1,2\n']
+    assert list(export.compress(chunks, 'CSV'))==chunks
@@ -29,6 +29,9 @@ def get_table_filter(app):
 def get_year_filter(app):
     return get_widget(app.sidebar.selectbox, 'Years')
 
+def get_search(app):
+    return get_widget(app.sidebar.text_input, 'Search')
+
 def match_dataframes(df_true, df_app):
     if 'dataset_id' in df_app:
         df_app['dataset_id'] = df_app['dataset_id'].apply(lambda x: np.nan if x=='nan' else x)
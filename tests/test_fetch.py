@@ -0,0 +1,98 @@
+import pandas as pd
+import pytest
+import random
+import threading
+import time
+
+import fetch
+
+def make_loader(count, delay=0.0, record=None):
+    def get_count():
+        time.sleep(delay)
+        return count
+    
+    def load_page(offset, nrows):
+        if record is not None:
+            record.append(offset)
+        time.sleep(random.uniform(0, delay))
+        return pd.DataFrame({'a':range(offset, min(offset+nrows, count))})
+    
+    return get_count, load_page
+
+
+@pytest.mark.parametrize('count', [0, 3, 10, 95, 100])
+def test_iter_pages_order(count):
+    get_count, load_page = make_loader(count, delay=0.01)
+
+    pages = list(fetch.iter_pages(get_count, load_page, 'https://www.test.com', batch_size=10))
+
+    assert len(pages)==len(range(0, count, 10))
+    if count>0:
+        pd.testing.assert_frame_equal(pd.concat(pages, ignore_index=True), pd.DataFrame({'a':range(count)}))
+
+
+def test_iter_pages_progress():
+    get_count, load_page = make_loader(45)
+    progress = []
+
+    list(fetch.iter_pages(get_count, load_page, 'www.test.com', batch_size=10, progress=lambda x,y: progress.append((x,y))))
+
+    assert progress==[(k,5) for k in range(1,6)]
+
+
+def test_iter_pages_first_page_before_count():
+    # 1st page should be requested before count is returned
+    record = []
+    count_returned = threading.Event()
+    def get_count():
+        time.sleep(0.1)
+        count_returned.set()
+        return 20
+    
+    def load_page(offset, nrows):
+        record.append((offset, count_returned.is_set()))
+        return pd.DataFrame({'a':range(offset, offset+min(nrows, 20-offset))})
+
+    list(fetch.iter_pages(get_count, load_page, 'www.test.com', batch_size=10))
+
+    assert record[0]==(0, False)
+
+
+def test_iter_pages_host_limit(monkeypatch):
+    monkeypatch.setattr(fetch, 'MAX_PER_HOST', 2)
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+    def load_page(offset, nrows):
+        nonlocal active, max_active
+        with lock:
+            active+=1
+            max_active = max(max_active, active)
+        time.sleep(0.01)
+        with lock:
+            active-=1
+        return pd.DataFrame({'a':range(offset, offset+nrows)})
+
+    list(fetch.iter_pages(lambda: 100, load_page, 'https://www.host-limit-test.com', batch_size=10, max_workers=8))
+
+    assert max_active<=2
+
+
+def test_iter_pages_error():
+    def load_page(offset, nrows):
+        if offset==20:
+            raise ValueError('Failed')
+        return pd.DataFrame({'a':range(offset, offset+nrows)})
+    
+    with pytest.raises(ValueError):
+        list(fetch.iter_pages(lambda: 50, load_page, 'www.test.com', batch_size=10))
+
+
+def test_iter_pages_start():
+    record = []
+    get_count, load_page = make_loader(45, record=record)
+
+    pages = list(fetch.iter_pages(get_count, load_page, 'www.test.com', batch_size=10, start=12))
+
+    assert sorted(record)==[12,22,32,42]
+    pd.testing.assert_frame_equal(pd.concat(pages, ignore_index=True), pd.DataFrame({'a':range(12,45)}))
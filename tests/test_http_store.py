@@ -0,0 +1,209 @@
+import io
+import logging
+import os
+import urllib.error
+import urllib.request
+
+import openpolicedata as opd
+import pandas as pd
+import pytest
+import requests
+
+import dashboard_utils
+import dataset_cache
+import http_store
+import metadata_cache
+import npi
+import portal_standin
+import zipped_csv
+
+NROWS = 1200
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Requests to the stand-in are recorded so that it can stand in for a remote portal
+    monkeypatch.setattr(http_store, 'LOCAL_HOSTS', [])
+    return http_store.HTTPStore(str(tmp_path / 'http'))
+
+
+@pytest.fixture
+def portal():
+    with portal_standin.Portal(page_size=500) as p:
+        yield p
+
+
+def test_key():
+    key = http_store.HTTPStore.key
+    assert key('GET', 'http://test.com/a?x=1&y=2')==key('get', 'http://test.com/a?y=2&x=1')
+    assert key('GET', 'http://test.com/a', {'User-Agent':'a'})==key('GET', 'http://test.com/a', {'User-Agent':'b'})
+    assert key('GET', 'http://test.com/a', {'Range':'bytes=0-9'})!=key('GET', 'http://test.com/a')
+    assert key('POST', 'http://test.com/a', body=b'a')!=key('POST', 'http://test.com/a', body=b'b')
+
+
+def test_requests(store, portal):
+    url = portal.url('CSV', NROWS)
+    with http_store.use(store, 'auto'):
+        r1 = requests.get(url)
+        r2 = requests.get(url, headers={'Range':'bytes=10-19'})
+    assert portal.requests['CSV']==2
+
+    portal.stop()
+    with http_store.use(store, 'replay'):
+        r = requests.get(url)
+        assert r.status_code==200
+        assert r.content==r1.content
+        assert r.headers['Content-Type']=='text/csv'
+        r = requests.get(url, headers={'Range':'bytes=10-19'})
+        assert r.status_code==206
+        assert r.content==r2.content==portal.file(f'{NROWS}.csv')[10:20]
+        with requests.Session() as s:
+            assert s.get(url).text==r1.text
+
+    assert (store.hits, store.misses)==(3, 2)
+    assert http_store.get_mode()=='off'
+
+
+def test_urllib(store, portal):
+    url = portal.url('zip', NROWS)
+    with http_store.use(store, 'auto'):
+        with urllib.request.urlopen(url) as r:
+            data = r.read()
+    portal.stop()
+
+    with http_store.use(store, 'replay'):
+        with urllib.request.urlopen(urllib.request.Request(url)) as r:
+            assert r.status==200
+            assert r.read()==data
+
+
+def test_error_status(store, portal):
+    url = f'http://{portal.host}/missing'
+    with http_store.use(store, 'auto'):
+        assert requests.get(url).status_code==404
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url)
+    portal.stop()
+
+    with http_store.use(store, 'replay'):
+        assert requests.get(url).status_code==404
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(url)
+        assert e.value.code==404
+
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_errors_not_recorded(store, monkeypatch, status):
+    # Temporary errors would be replayed indefinitely if they were recorded
+    url = 'https://www.test.com/data.csv'
+    def send(adapter, request, **kwargs):
+        r = requests.Response()
+        r.status_code = status
+        r._content = b'Error'
+        r.url = request.url
+        return r
+    def urlopen(url, *args, **kwargs):
+        raise urllib.error.HTTPError(url, status, 'Error', {}, io.BytesIO(b'Error'))
+    monkeypatch.setattr(http_store, '_adapter_send', send)
+    monkeypatch.setattr(http_store, '_urlopen', urlopen)
+
+    with http_store.use(store, 'auto'):
+        assert requests.get(url).status_code==status
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url)
+
+    assert os.listdir(os.path.join(store.directory, 'requests'))==[]
+
+
+def test_stream(store, portal):
+    url = portal.url('zip', NROWS)
+    with http_store.use(store, 'auto'):
+        with zipped_csv.download(url) as f:
+            data = f.read()
+        with requests.get(url, stream=True) as r:
+            # Body is read from the store
+            assert not r._content_consumed
+            assert b''.join(r.iter_content(100))==data
+    assert data==portal.file(f'{NROWS}.csv.zip')
+    assert portal.requests['zip']==1
+    portal.stop()
+
+    with http_store.use(store, 'replay'):
+        with zipped_csv.download(url) as f:
+            assert f.read()==data
+
+
+def test_replay_miss(store):
+    with http_store.use(store, 'replay'):
+        with pytest.raises(requests.ConnectionError):
+            requests.get('https://www.test.com/data.csv')
+        with pytest.raises(urllib.error.URLError):
+            urllib.request.urlopen('https://www.test.com/data.csv')
+    assert store.misses==2
+
+
+def test_record_overwrites(store, portal):
+    url = f'http://{portal.host}/files/{NROWS}.csv'
+    key = store.key('GET', url)
+    store.put(key, 'GET', url, 200, 'OK', {}, b'old')
+    with http_store.use(store, 'record'):
+        assert requests.get(url).content==portal.file(f'{NROWS}.csv')
+    assert store.get(key)[1]==portal.file(f'{NROWS}.csv')
+
+
+def test_local_not_recorded(tmp_path, portal):
+    store = http_store.HTTPStore(str(tmp_path / 'http'))
+    with http_store.use(store, 'replay'):
+        assert requests.get(portal.url('CSV', 10)).status_code==200
+    assert store.misses==0
+
+
+def test_load_offline(store, portal, tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_cache, '_cache', dataset_cache.DatasetCache(str(tmp_path / 'datasets')))
+    monkeypatch.setattr(metadata_cache, '_cache', metadata_cache.MetadataCache(metadata_cache.SQLiteBackend(str(tmp_path / 'metadata.sqlite'))))
+    monkeypatch.setattr(opd.datasets, 'datasets', opd.datasets.datasets)  # Restored after test
+
+    rows = []
+    for data_type in ['ArcGIS', 'Socrata']:
+        rows.append({'State':'Virginia', 'SourceName':data_type, 'Agency':data_type, 'AgencyFull':data_type, 'TableType':'STOPS',
+                     'Year':opd.defs.MULTI, 'Description':None, 'DataType':data_type, 'URL':portal.url(data_type, NROWS),
+                     'date_field':None, 'dataset_id':portal_standin.DATASET_ID if data_type=='Socrata' else None,
+                     'agency_field':None, 'min_version':None, 'readme':None, 'source_url':None, 'coverage_start':None,
+                     'coverage_end':None, 'query':None, 'py_min_version':None})
+    opd.datasets.reload(pd.DataFrame(rows))
+    catalog = opd.datasets.query()
+    selection = {'year':opd.defs.MULTI, 'table':'STOPS', 'agency':None}
+
+    def load(data_type, version):
+        selected_row = catalog[catalog['SourceName']==data_type].copy()
+        selected_row.attrs['version'] = version  # New version so that the dataset cache is not used
+        data, _, load_failure = dashboard_utils.load(selected_row, selection, logger=logging.getLogger(), use_streamlit=False, stream=True)
+        assert not load_failure
+        df = pd.read_csv(data if hasattr(data, 'read') else io.BytesIO(data))
+        if hasattr(data, 'close'):
+            data.close()
+        return df
+
+    with http_store.use(store, 'auto'):
+        recorded = {x:load(x, 'v1') for x in ['ArcGIS', 'Socrata']}
+    nrequests = sum(portal.requests.values())
+    assert nrequests>0
+
+    with http_store.use(store, 'replay'):
+        for data_type, df in recorded.items():
+            pd.testing.assert_frame_equal(load(data_type, 'v2'), df)
+    assert sum(portal.requests.values())==nrequests
+    assert recorded['ArcGIS']['id'].tolist()==list(range(NROWS))
+
+
+def test_npi_replay(store):
+    url = npi.get_state_url('Virginia')
+    store.put(store.key('GET', url), 'GET', url, 200, 'OK', {'Content-Type':'text/html'}, b'<input placeholder="Search Data">')
+
+    with http_store.use(store, 'replay'):
+        probe = npi.StateProbe()
+        for state in ['Virginia', 'Texas']:
+            assert probe.has_data(state) is None
+            probe.wait(state, timeout=5)
+        assert probe.has_data('Virginia')
+        assert probe.has_data('Texas') is False  # Not recorded
+    assert store.misses==1
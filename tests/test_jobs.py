@@ -0,0 +1,152 @@
+import threading
+import time
+
+import jobs
+
+def test_job_result():
+    scheduler = jobs.JobScheduler(max_workers=2)
+
+    job = scheduler.submit(lambda job: 5)
+
+    assert job.wait(5)
+    assert job.state==jobs.DONE
+    assert job.result==5
+
+
+def test_job_failure():
+    scheduler = jobs.JobScheduler(max_workers=2)
+    def fail(job):
+        raise ValueError('Test')
+
+    job = scheduler.submit(fail)
+
+    assert job.wait(5)
+    assert job.state==jobs.FAILED
+    assert isinstance(job.error, ValueError)
+
+
+def test_previews_run_before_downloads():
+    scheduler = jobs.JobScheduler(max_workers=1)
+    release = threading.Event()
+    order = []
+
+    # Block the only worker so that the remaining jobs are queued
+    blocker = scheduler.submit(lambda job: release.wait(5))
+    queued = [scheduler.submit(lambda job, k=k: order.append(k), kind=kind) for k,kind in 
+              enumerate([jobs.DOWNLOAD, jobs.PREVIEW, jobs.DOWNLOAD, jobs.PREVIEW])]
+    release.set()
+
+    assert all(j.wait(5) for j in [blocker]+queued)
+    assert order==[1, 3, 0, 2]
+
+
+def test_waiting_job_does_not_use_worker():
+    scheduler = jobs.JobScheduler(max_workers=1)
+    release = threading.Event()
+    def wait(job):
+        with jobs.waiting():
+            release.wait(5)
+        return release.is_set()
+
+    waiting = scheduler.submit(wait)
+    job = scheduler.submit(lambda job: 5)
+
+    assert job.wait(5)
+    assert not waiting.done
+    release.set()
+    assert waiting.wait(5)
+    assert waiting.result
+
+    # Thread of the waiting job stops once it finishes
+    time.sleep(0.1)
+    assert len([t for t in scheduler._threads if t.is_alive()])==1
+
+
+def test_cancel_queued():
+    scheduler = jobs.JobScheduler(max_workers=1)
+    release = threading.Event()
+    ran = []
+
+    scheduler.submit(lambda job: release.wait(5))
+    job = scheduler.submit(lambda job: ran.append(True))
+    job.cancel()
+    release.set()
+
+    assert job.wait(5)
+    assert job.state==jobs.CANCELLED
+    assert not ran
+
+
+def test_cancel_running():
+    scheduler = jobs.JobScheduler(max_workers=1)
+    started = threading.Event()
+    def run(job):
+        k = 0
+        while True:
+            job.update(k, 1000, nbytes=10*k)
+            started.set()
+            k+=1
+
+    job = scheduler.submit(run)
+    assert started.wait(5)
+    assert job.state==jobs.RUNNING
+    assert job.batches_total==1000
+    job.cancel()
+
+    assert job.wait(5)
+    assert job.state==jobs.CANCELLED
+    assert isinstance(job.error, jobs.JobCancelled)
+
+
+def test_cancel_session_jobs():
+    scheduler = jobs.JobScheduler(max_workers=1)
+    release = threading.Event()
+    session_jobs = {jobs.DOWNLOAD: scheduler.submit(lambda job: release.wait(5))}
+    job = session_jobs[jobs.DOWNLOAD]
+
+    jobs.cancel(session_jobs)
+    release.set()
+
+    assert len(session_jobs)==0
+    assert job.wait(5)
+    assert job.state==jobs.CANCELLED
+
+
+def test_cancel_closes_result(tmp_path):
+    scheduler = jobs.JobScheduler(max_workers=1)
+    path = tmp_path / 'data.csv'
+    path.write_bytes(b'a,b\n1,2\n')
+
+    job = scheduler.submit(lambda job: open(path, 'rb'))
+    assert job.wait(5)
+    assert not job.result.closed
+    jobs.cancel({jobs.DOWNLOAD:job})
+    assert job.result.closed
+
+    # Result is closed if the job is cancelled while it is running
+    started = threading.Event()
+    release = threading.Event()
+    def run(job):
+        started.set()
+        release.wait(5)
+        return open(path, 'rb')
+    job = scheduler.submit(run)
+    assert started.wait(5)
+    job.cancel()
+    release.set()
+    assert job.wait(5)
+    assert job.state==jobs.CANCELLED
+    assert job.result.closed
+
+
+def test_eta():
+    job = jobs.Job(None, jobs.DOWNLOAD)
+    assert job.eta() is None
+
+    job.state = jobs.RUNNING
+    job.started = job.submitted - 10
+    job.update(2, 6)
+
+    assert 19 < job.eta() < 30
+    assert job.fraction()==2/6
+    assert '2/6 batches' in job.status()
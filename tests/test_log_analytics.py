@@ -0,0 +1,145 @@
+import gzip
+import json
+
+import pytest
+
+import log_analytics
+import warm_cache
+
+TEXT_LINES = [
+    "23-06-30 20:49:41 :: Loading preview data for 2020, STOPS, None, https://www.test.com/1.csv, None, Fairfax County, Virginia, Fairfax County",
+    "23-06-30 20:49:43 :: Data downloaded from URL. Total of 20 rows",
+    "23-06-30 20:50:00 :: Loading data for 2020, STOPS, None, https://www.test.com/1.csv, None, Fairfax County, Virginia, Fairfax County",
+    "23-06-30 20:50:10 :: Download complete!!!!!",
+    "23-06-30 20:51:00 :: Loading data for 2021, USE OF FORCE, None, https://data.org/api, abcd-1234, Richmond, Virginia, Richmond",
+    "23-06-30 20:51:01 :: record_count: 12000",
+    "23-06-30 20:51:05 :: Load failure occurred",
+    "23-06-30 20:51:05 :: Traceback (most recent call last):",
+    "23-06-30 20:52:00 :: Loading data for 2021, USE OF FORCE, None, https://data.org/api, abcd-1234, Richmond, Virginia, Richmond",
+    "23-06-30 20:52:01 :: record_count: 12000",
+    "23-06-30 20:52:03 :: Streamed 12000 rows to file",
+]
+
+LEGACY_LINES = [
+    "[20:04:51] 📦 Processed dependencies!",
+    "***source_name=New York City, state=New York",
+    "Downloading data from URL",
+    "Table type is ARRESTS and year is 2006",
+    "record_count is 371934",
+    "Table size is 371934",
+    "Data downloaded from URL. Total of 371934 rows",
+    "***source_name=Fairfax County, state=Virginia",
+    "Downloading data from URL",
+    "Table type is ARRESTS and year is 2022",
+    "record_count is None",
+    "Data downloaded from URL. Total of 25658 rows",
+]
+
+
+def json_line(message, thread, span=None, thread_id=None):
+    record = {'time':'2025-01-01T00:00:00+0000', 'level':'INFO', 'logger':'opd-app', 'thread':thread, 'message':message}
+    if thread_id:
+        record['thread_id'] = thread_id
+    if span:
+        record['span'] = span
+    return json.dumps(record)
+
+
+def test_text():
+    report = log_analytics.LogAnalyzer().feed(TEXT_LINES).report()
+
+    assert report['loads']==4
+    assert report['failures']==1
+    assert report['datasets']==[
+        {'source':'Fairfax County', 'state':'Virginia', 'table':'STOPS', 'agency':'Fairfax County', 'requests':2, 'previews':1,
+         'failures':0, 'p50':2.0, 'p95':10.0, 'max_rows':20},
+        {'source':'Richmond', 'state':'Virginia', 'table':'USE OF FORCE', 'agency':'Richmond', 'requests':2, 'previews':0,
+         'failures':1, 'p50':3.0, 'p95':3.0, 'max_rows':12000},
+    ]
+    assert report['hosts']==[{'name':'www.test.com', 'loads':2, 'failures':0, 'failure_rate':0.0},
+                             {'name':'data.org', 'loads':2, 'failures':1, 'failure_rate':0.5}]
+    assert report['rows']==[{'rows':'10-99', 'loads':1}, {'rows':'10,000-99,999', 'loads':2}]
+
+
+def test_data_types_from_catalog(tmp_path):
+    catalog = tmp_path / 'catalog.csv'
+    catalog.write_text('State,URL,DataType\nVirginia,https://www.test.com/1.csv,CSV\nVirginia,https://data.org/api,Socrata\n')
+    report = log_analytics.LogAnalyzer(log_analytics.read_data_types(catalog)).feed(TEXT_LINES).report()
+
+    assert report['data_types']==[{'name':'CSV', 'loads':2, 'failures':0, 'failure_rate':0.0},
+                                  {'name':'Socrata', 'loads':2, 'failures':1, 'failure_rate':0.5}]
+
+
+def test_legacy():
+    report = log_analytics.LogAnalyzer().feed(LEGACY_LINES).report()
+
+    assert [(x['source'], x['table'], x['max_rows'], x['p50']) for x in report['datasets']]==[
+        ('New York City', 'ARRESTS', 371934, None), ('Fairfax County', 'ARRESTS', 25658, None)]
+
+
+def test_json_threads_and_spans():
+    url1 = 'https://www.test.com/1.csv'
+    url2 = 'https://data.org/api'
+    lines = [
+        json_line(f"Loading data for 2020, STOPS, None, {url1}, None, Fairfax County, Virginia, Fairfax County", 'A'),
+        json_line(f"Loading data for 2021, USE OF FORCE, None, {url2}, abcd-1234, Richmond, Virginia, Richmond", 'B'),
+        json_line('Load failure occurred', 'B'),
+        json_line('TRACE load', 'B', {'name':'load', 'duration':0.5, 'status':'ok', 'url':url2, 'data_type':'Socrata', 'failed':True}),
+        json_line('TRACE load', 'A', {'name':'load', 'duration':4.0, 'status':'ok', 'url':url1, 'data_type':'CSV', 'failed':False}),
+        # Shared load does not replace the duration of the load that was made
+        json_line('TRACE load', 'A', {'name':'load', 'duration':0.1, 'status':'ok', 'url':url1, 'data_type':'CSV', 'shared':True}),
+        json_line('Data downloaded from URL. Total of 20 rows', 'A'),
+    ]
+    report = log_analytics.LogAnalyzer().feed(lines).report()
+
+    assert [(x['source'], x['failures'], x['p50'], x['max_rows']) for x in report['datasets']]==[
+        ('Fairfax County', 0, 4.0, 20), ('Richmond', 1, None, None)]
+    assert report['data_types']==[{'name':'CSV', 'loads':1, 'failures':0, 'failure_rate':0.0},
+                                  {'name':'Socrata', 'loads':1, 'failures':1, 'failure_rate':1.0}]
+
+
+def test_json_thread_ids():
+    # Streamlit sessions run in threads with the same name
+    name = 'ScriptRunner.scriptThread'
+    lines = [
+        json_line("Loading data for 2020, STOPS, None, https://www.test.com/1.csv, None, Fairfax County, Virginia, Fairfax County", name, thread_id=1),
+        json_line("Loading data for 2021, USE OF FORCE, None, https://data.org/api, abcd-1234, Richmond, Virginia, Richmond", name, thread_id=2),
+        json_line('record_count: 12000', name, thread_id=2),
+        json_line('Load failure occurred', name, thread_id=1),
+        json_line('Streamed 12000 rows to file', name, thread_id=2),
+    ]
+    report = log_analytics.LogAnalyzer().feed(lines).report()
+
+    assert [(x['source'], x['failures'], x['max_rows']) for x in report['datasets']]==[('Fairfax County', 1, None), ('Richmond', 0, 12000)]
+
+
+def test_text_trace():
+    lines = [
+        "Loading data for 2020, STOPS, None, https://www.test.com/1.csv, None, Fairfax County, Virginia, Fairfax County",
+        "TRACE load 1500.0 ms ok url=https://www.test.com/1.csv data_type=CSV year=2020 preview=False fmt=csv shared=False failed=False",
+    ]
+    report = log_analytics.LogAnalyzer().feed(lines).report()
+
+    assert report['datasets'][0]['p50']==1.5
+    assert report['data_types'][0]['name']=='CSV'
+
+
+@pytest.mark.parametrize('values, p, expected', [([], 50, None), ([3,1,2], 50, 2), ([1,2,3,4], 50, 2), (list(range(1,101)), 95, 95)])
+def test_percentile(values, p, expected):
+    assert log_analytics.percentile(values, p)==expected
+
+
+def test_iter_lines(tmp_path):
+    with gzip.open(tmp_path / 'a.txt.gz', 'wt', encoding='utf-8') as f:
+        f.write('\n'.join(TEXT_LINES[:2]) + '\n')
+    (tmp_path / 'b.txt').write_text('\n'.join(TEXT_LINES[2:]) + '\n', encoding='utf-8')
+
+    lines = log_analytics.iter_lines([str(tmp_path / '*.gz'), str(tmp_path / '*.txt')])
+
+    assert [x.rstrip('\n') for x in lines]==TEXT_LINES
+
+
+def test_popularity_from_json():
+    line = "Loading data for 2021, USE OF FORCE, B, www.test.org, abcd-1234, Richmond, Virginia, MULTIPLE"
+
+    assert warm_cache.read_popularity([json_line(line, 'A')])=={('Richmond', 'Virginia', 'USE OF FORCE', 'MULTIPLE'):1}
@@ -0,0 +1,148 @@
+import json
+import os
+import pickle
+import pytest
+import sqlite3
+import time
+
+import metadata_cache
+
+@pytest.fixture(params=['sqlite', 'disk'])
+def make_cache(request, tmp_path):
+    def make(ttls=None):
+        if request.param=='sqlite':
+            backend = metadata_cache.SQLiteBackend(os.path.join(tmp_path, 'metadata.sqlite'))
+        else:
+            backend = metadata_cache.DiskBackend(os.path.join(tmp_path, 'metadata'))
+        return metadata_cache.MetadataCache(backend, ttls)
+    return make
+
+
+def test_miss_then_hit(make_cache):
+    cache = make_cache()
+
+    assert cache.get('years', 'key', 'v1')==(False, None)
+    cache.put('years', 'key', [2021, 2020], 'v1')
+
+    assert cache.get('years', 'key', 'v1')==(True, [2021, 2020])
+    assert cache.get('agencies', 'key', 'v1')==(False, None)
+    assert cache.get('years', 'key', 'v2')==(False, None)
+    assert (cache.hits, cache.misses)==(1, 3)
+
+
+def test_shared_between_instances(make_cache):
+    # Instances using the same location represent different processes
+    make_cache().put('years', 'key', ['2020'], 'v1')
+
+    assert make_cache().get('years', 'key', 'v1')==(True, ['2020'])
+
+
+def test_ttl(make_cache):
+    cache = make_cache(ttls={'years':0.1, 'count':60})
+    cache.put('years', 'key', ['2020'])
+    cache.put('count', 'key', 100)
+    time.sleep(0.2)
+
+    assert cache.get('years', 'key')==(False, None)
+    assert cache.get('count', 'key')==(True, 100)
+
+
+def test_cached(make_cache, monkeypatch):
+    monkeypatch.setattr(metadata_cache, '_cache', make_cache())
+    calls = []
+    @metadata_cache.cached('years')
+    def get_years(src, table_type=None):
+        calls.append((src, table_type))
+        return [2020]
+
+    assert get_years('A', table_type='STOPS', catalog_version='v1')==[2020]
+    assert get_years('A', table_type='STOPS', catalog_version='v1')==[2020]
+    assert len(calls)==1
+
+    get_years('B', table_type='STOPS', catalog_version='v1')
+    get_years('A', table_type='STOPS', catalog_version='v2')
+    assert calls==[('A','STOPS'), ('B','STOPS'), ('A','STOPS')]
+
+
+def test_carry_over(make_cache):
+    cache = make_cache()
+    cache.put('years', 'key1', ['2020'], 'v1', dataset='A')
+    cache.put('years', 'key2', ['2021'], 'v1', dataset='B')
+    cache.put('agencies', 'key3', ['A'], 'v1')
+    cache.put('years', 'key4', ['2022'], 'v0', dataset='A')
+    cache.put('years', 'key5', ['2023'], 'v2', dataset='A')
+    cache.put('years', 'key1', ['2024'], 'v2', dataset='A')
+
+    cache.carry_over('v1', 'v2', ['B'])
+
+    assert cache.get('years', 'key1', 'v2')==(True, ['2024'])
+    assert cache.get('years', 'key2', 'v2')==(False, None)
+    assert cache.get('agencies', 'key3', 'v2')==(False, None)
+    assert cache.get('years', 'key5', 'v2')==(True, ['2023'])
+    for version in ['v0', 'v1']:
+        for key in ['key1', 'key2', 'key3', 'key4']:
+            assert cache.get('years', key, version)==(False, None)
+
+
+def test_carry_over_unchanged(make_cache):
+    cache = make_cache()
+    cache.put('years', 'key1', ['2020'], 'v1', dataset='A')
+
+    cache.carry_over('v1', 'v2', ['B'])
+
+    assert cache.get('years', 'key1', 'v2')==(True, ['2020'])
+    assert cache.get('years', 'key1', 'v1')==(False, None)
+
+
+def test_sqlite_without_dataset(tmp_path):
+    # Cache created before entries were labeled with their dataset
+    path = os.path.join(tmp_path, 'metadata.sqlite')
+    with sqlite3.connect(path) as con:
+        con.execute('CREATE TABLE entries (name TEXT, key TEXT, version TEXT, created REAL, value BLOB, '+
+                    'PRIMARY KEY (name, key, version))')
+        con.execute('INSERT INTO entries VALUES (?, ?, ?, ?, ?)', ('years', 'key1', 'v1', time.time(), json.dumps({'value':['2020']})))
+    con.close()
+
+    cache = metadata_cache.MetadataCache(metadata_cache.SQLiteBackend(path))
+    cache.put('years', 'key2', ['2021'], 'v1', dataset='A')
+    assert cache.get('years', 'key1', 'v1')==(True, ['2020'])
+
+    cache.carry_over('v1', 'v2', [])
+
+    assert cache.get('years', 'key1', 'v2')==(False, None)
+    assert cache.get('years', 'key2', 'v2')==(True, ['2021'])
+
+
+def test_cached_dataset(make_cache, monkeypatch):
+    cache = make_cache()
+    monkeypatch.setattr(metadata_cache, '_cache', cache)
+    calls = []
+    @metadata_cache.cached('agencies', dataset=('source', 'state', 'table_type', 'agency'))
+    def get_agencies(source, state, agency, table_type, year=None):
+        calls.append((source, year))
+        return [agency]
+
+    get_agencies('A', 'Virginia', 'A', 'STOPS', year=2020, catalog_version='v1')
+    get_agencies('B', 'Virginia', 'B', 'STOPS', year=2020, catalog_version='v1')
+    cache.carry_over('v1', 'v2', [metadata_cache.dataset_key('B', 'Virginia', 'STOPS', 'B')])
+    get_agencies('A', 'Virginia', 'A', 'STOPS', year=2020, catalog_version='v2')
+    get_agencies('B', 'Virginia', 'B', 'STOPS', year=2020, catalog_version='v2')
+
+    assert calls==[('A', 2020), ('B', 2020), ('B', 2020)]
+
+
+def test_values_are_json(make_cache, tmp_path):
+    cache = make_cache()
+    cache.put('years', 'key', ['2020'], 'v1')
+
+    # Pickles (i.e. written by older versions) are not loaded
+    for path in tmp_path.rglob('*'):
+        if path.is_file() and path.suffix=='.json':
+            json.loads(path.read_text())
+            path.write_bytes(pickle.dumps({'created':time.time(), 'value':['2021']}))
+    if (tmp_path / 'metadata.sqlite').exists():
+        with sqlite3.connect(tmp_path / 'metadata.sqlite') as con:
+            con.execute('UPDATE entries SET value=?', (pickle.dumps(['2021']),))
+        con.close()
+
+    assert cache.get('years', 'key', 'v1')==(False, None)
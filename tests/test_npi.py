@@ -0,0 +1,92 @@
+import pytest
+import requests
+import threading
+import time
+
+import npi
+
+class FakeResponse:
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code>=400:
+            raise requests.HTTPError(f'{self.status_code} Error')
+
+
+class FakeSession:
+    def __init__(self, pages, release=None):
+        self.pages = pages
+        self.release = release
+        self.requested = []
+
+    def get(self, url, timeout=None):
+        self.requested.append(url)
+        if self.release:
+            self.release.wait(5)
+        page = self.pages.get(url)
+        if isinstance(page, Exception):
+            raise page
+        return FakeResponse(page) if page is not None else FakeResponse('', 404)
+
+
+@pytest.fixture
+def session():
+    return FakeSession({
+        npi.get_state_url('Virginia'):'<input placeholder="Search Data">',
+        npi.get_state_url('North Dakota'):'<p>No data</p>',
+        npi.get_state_url('Texas'):requests.ConnectionError('Unable to connect'),
+    })
+
+
+def test_get_url_no_state():
+    assert npi.get_url()==(npi.NPI_URL, False)
+
+
+@pytest.mark.parametrize('state, agency, expected', [
+    ('Virginia', None, 'https://national.cpdp.co/states/Virginia'),
+    ('Virginia', 'Fairfax County Police Department', 'https://national.cpdp.co/states/Virginia?agency=Fairfax+County+Police+Department'),
+    ('North Dakota', None, npi.NPI_URL),
+    ('Texas', None, npi.NPI_URL),
+    ('Maryland', None, npi.NPI_URL),
+])
+def test_get_url(session, state, agency, expected):
+    probe = npi.StateProbe(session)
+
+    # Generic URL is returned while the state is being checked
+    assert npi.get_url(state, agency, probe)==(npi.NPI_URL, True)
+    probe.wait(state, 5)
+
+    assert npi.get_url(state, agency, probe)==(expected, False)
+
+
+def test_probe_does_not_block(session):
+    release = threading.Event()
+    session.release = release
+    probe = npi.StateProbe(session)
+
+    start = time.time()
+    assert probe.has_data('Virginia') is None
+    assert probe.has_data('Virginia') is None
+    assert time.time()-start < 1
+
+    release.set()
+    probe.wait('Virginia', 5)
+    assert probe.has_data('Virginia')==True
+    assert session.requested==[npi.get_state_url('Virginia')]
+
+
+def test_ttl(session):
+    probe = npi.StateProbe(session, ttl=60, negative_ttl=0.1)
+    for state in ['Virginia', 'North Dakota']:
+        probe.has_data(state)
+        probe.wait(state, 5)
+    time.sleep(0.2)
+
+    # States without data are checked again after the negative TTL
+    assert probe.has_data('Virginia')==True
+    assert probe.has_data('North Dakota') is None
+    probe.wait('North Dakota', 5)
+    assert session.requested.count(npi.get_state_url('Virginia'))==1
+    assert session.requested.count(npi.get_state_url('North Dakota'))==2
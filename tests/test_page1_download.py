@@ -5,6 +5,7 @@ import pandas as pd
 
 from .test_fcns import *
 from .conftest import DownloadButton
+import jobs
 import utils
 
 SAVED_CSV = 'csv_text_output'
@@ -72,7 +73,7 @@ def test_preview(app, state, src, tbl, year, id, url, reset=True):
     assert len(ds)==1
     ds = ds.iloc[0]
 
-    load_all = not (ds['DataType'] in utils.API_DATA_TYPES or (ds['DataType']=='CSV' and not ds['URL'].endswith('zip')))
+    load_all = not (ds['DataType'] in utils.API_DATA_TYPES or ds['DataType']=='CSV')
     if not load_all:
         assert app.session_state[SAVED_CSV]==None
     else:
@@ -97,7 +98,12 @@ def test_preview(app, state, src, tbl, year, id, url, reset=True):
     pd.testing.assert_frame_equal(df_preview, df2)
 
     if load_all:
-        df_app = pd.read_csv(BytesIO(app.session_state[SAVED_CSV]))
+        data = app.session_state[SAVED_CSV]
+        if not isinstance(data, bytes):
+            # Data is served from a file
+            data.seek(0)
+            data = data.read()
+        df_app = pd.read_csv(BytesIO(data))
 
         assert len(t.table)==len(df_app)
         assert (t.table.columns==df_app.columns).all()
@@ -130,13 +136,22 @@ def test_download(app, state, src, tbl, year, id, url, reset=True):
     assert len(app.session_state['preview'])==0
     assert app.session_state[SAVED_CSV]==None
 
+    # Download is disabled until the data has been loaded in the background
+    app.run()
+    assert DownloadButton.instance.disabled
+    get_widget(app.button,'Load CSV').click().run()
+    assert app.session_state['jobs'][jobs.DOWNLOAD].wait(600)
+    app.run()
+
     btn = DownloadButton()
     btn.click()
     app.run()
 
-    assert isinstance(btn.data, bytes)
-
     download = btn.data
+    if not isinstance(download, bytes):
+        # API data is streamed to a file
+        download = download.read()
+    assert isinstance(download, bytes)
 
     ds = opd.datasets.query(state=state, source_name=src, table_type=tbl)
 
@@ -9,6 +9,7 @@ from .test_fcns import *
 @pytest.fixture(autouse=True)  # Setup function to ensure that each test is on correct page. autouse means it will be created despite not being passed into the tests
 def ensure_correct_page(app):
     app.switch_page("2_Find_Datasets.py").run()
+    get_search(app).input('').run()
     get_state_filter(app).select(utils.ALL).run()
     get_source_filter(app).select(utils.ALL).run()
     get_table_filter(app).select(utils.ALL).run()
@@ -65,4 +66,18 @@ def test_filter(app, state, src, table, from_url):
     assert len(df_true)>0
     df_true, df_app = match_dataframes(df_true, app.dataframe[0].value)
 
-    pd.testing.assert_frame_equal(df_true[['URL','dataset_id']], df_app[['URL','dataset_id']])
\ No newline at end of file
+    pd.testing.assert_frame_equal(df_true[['URL','dataset_id']], df_app[['URL','dataset_id']])
+
+
+@pytest.mark.parametrize('query', ['Denver', 'denvr', 'DENVER police'])
+def test_search(app, query):
+    get_state_filter(app).select('Colorado').run()
+    get_search(app).input(query).run()
+
+    df_app = app.dataframe[0].value
+    df_true = opd.datasets.query(state='Colorado', source_name='Denver')
+    df_true, df_app = match_dataframes(df_true, df_app)
+
+    assert len(df_app)>0
+    assert (df_app['SourceName']=='Denver').all()
+    assert set(df_app['URL'])==set(df_true['URL'])
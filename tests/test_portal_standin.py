@@ -0,0 +1,84 @@
+import io
+import logging
+
+import openpolicedata as opd
+import pandas as pd
+import pytest
+import requests
+
+import dashboard_utils
+import dataset_cache
+import metadata_cache
+import portal_standin
+import zipped_csv
+
+NROWS = 1500
+
+@pytest.fixture(scope='module')
+def portal():
+    with portal_standin.Portal(page_size=500) as p:
+        yield p
+
+
+@pytest.fixture
+def catalog(portal, tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_cache, '_cache', dataset_cache.DatasetCache(str(tmp_path / 'datasets')))
+    monkeypatch.setattr(metadata_cache, '_cache', metadata_cache.MetadataCache(metadata_cache.SQLiteBackend(str(tmp_path / 'metadata.sqlite'))))
+    monkeypatch.setattr(opd.datasets, 'datasets', opd.datasets.datasets)  # Restored after test
+
+    rows = []
+    for data_type in portal_standin.DATA_TYPES:
+        rows.append({'State':'Virginia', 'SourceName':data_type, 'Agency':data_type, 'AgencyFull':data_type, 'TableType':'STOPS',
+                     'Year':opd.defs.MULTI, 'Description':None, 'DataType':'CSV' if data_type=='zip' else data_type,
+                     'URL':portal.url(data_type, NROWS), 'date_field':None,
+                     'dataset_id':portal_standin.DATASET_ID if data_type=='Socrata' else None, 'agency_field':None,
+                     'min_version':None, 'readme':None, 'source_url':None, 'coverage_start':None, 'coverage_end':None,
+                     'query':None, 'py_min_version':None})
+    opd.datasets.reload(pd.DataFrame(rows))
+    df = opd.datasets.query()
+    df.attrs['version'] = 'v1'
+    return df
+
+
+def test_make_table():
+    pd.testing.assert_frame_equal(portal_standin.make_table(5, 10).reset_index(drop=True),
+                                  portal_standin.make_table(20).iloc[10:15].reset_index(drop=True))
+
+
+def test_range_request(portal):
+    data = portal.file(f'{NROWS}.csv')
+    r = requests.get(portal.url('CSV', NROWS), headers={'Range':'bytes=10-19'})
+
+    assert r.status_code==206
+    assert r.content==data[10:20]
+    assert r.headers['Content-Range']==f'bytes 10-19/{len(data)}'
+
+    r = requests.get(portal.url('CSV', NROWS), headers={'Range':'bytes=-5'})
+    assert r.content==data[-5:]
+
+
+def test_zip_preview(portal):
+    df = zipped_csv.read_preview(portal.url('zip', NROWS), 20)
+
+    pd.testing.assert_frame_equal(df, pd.read_csv(io.BytesIO(portal.file(f'{NROWS}.csv')), nrows=20))
+
+
+@pytest.mark.parametrize('data_type', portal_standin.DATA_TYPES)
+def test_load(catalog, portal, data_type):
+    selected_row = catalog[catalog['SourceName']==data_type]
+    selection = {'year':opd.defs.MULTI, 'table':'STOPS', 'agency':None}
+
+    _, df_prev, load_failure = dashboard_utils.load(selected_row, selection, 20, logger=logging.getLogger(), use_streamlit=False)
+    assert not load_failure
+    assert len(df_prev)==20
+
+    data, _, load_failure = dashboard_utils.load(selected_row, selection, logger=logging.getLogger(), use_streamlit=False, stream=True)
+    assert not load_failure
+    df = pd.read_csv(data if hasattr(data, 'read') else io.BytesIO(data))
+    if hasattr(data, 'close'):
+        data.close()
+
+    expected = portal_standin.make_table(NROWS)
+    assert len(df)==NROWS
+    assert df['id'].tolist()==expected['id'].tolist()
+    assert df['description'].tolist()==expected['description'].tolist()
@@ -2,9 +2,10 @@ import pytest
 import pandas as pd
 import numpy as np
 from copy import deepcopy
-from urllib.parse import urlparse
+from urllib.parse import urlparse, parse_qsl
 import openpolicedata as opd
 
+import url as explorer_url
 from .test_fcns import *
 
 @pytest.fixture()  # Setup function to ensure that each test is on correct page. autouse means it will be created despite not being passed into the tests
@@ -236,3 +237,25 @@ def test_bad_default_value(app):
         assert len(app.toast)>0
         assert fake_val in app.toast[0].value
         assert key in app.toast[0].value
+
+
+@pytest.mark.parametrize('state, source , table, year, id, url', [
+    ('North Carolina', 'Asheville', 'USE OF FORCE', 2020, np.nan, 
+        'https://services.arcgis.com/aJ16ENn1AaqdFlqx/arcgis/rest/services/APD_UseOfForce2021/FeatureServer/0'),
+    ('Colorado', 'Colorado Springs', 'ARRESTS', 2020, '34jw-x9zp', 'policedata.coloradosprings.gov'),
+])
+def test_page1_deep_link(app_page1, state, source, table, year, id, url):
+    app = app_page1
+
+    # We currently cannot set the URL for the test so simulate receipt of a URL
+    query_url = explorer_url.get_opd_explorer_download_url(url, id, year, url_type='local')
+    app.query_params = dict(parse_qsl(query_url[query_url.find('?')+1:]))
+    app.session_state['is_starting_up'] = True
+    app.run()
+
+    assert get_state_filter(app).value==state
+    assert get_source_filter(app).value==source
+    assert get_table_filter(app).value==table
+    assert get_year_filter(app).value==str(year)
+
+    check_last_selection(app, url, id)
@@ -0,0 +1,130 @@
+import json
+import logging
+import threading
+
+import pytest
+
+import streamlit_logger
+import tracing
+
+
+@pytest.fixture
+def logger_name(request):
+    name = 'test-opd-app.' + request.node.name
+    yield name
+    logger = logging.getLogger(name)
+    for h in logger.handlers[:]:
+        logger.removeHandler(h)
+        h.close()
+
+
+def flush(logger):
+    # Wait for queued records to be written
+    for h in logger.handlers:
+        h.listener.stop()
+
+
+def test_ring_buffer_drops_oldest():
+    q = streamlit_logger.RingBufferQueue(3)
+    for k in range(5):
+        q.put_nowait(k)
+
+    assert q.dropped==2
+    assert [q.get_nowait() for _ in range(3)]==[2,3,4]
+
+    # Dropped records do not need to be marked as done
+    for _ in range(3):
+        q.task_done()
+    t = threading.Thread(target=q.join, daemon=True)
+    t.start()
+    t.join(5)
+    assert not t.is_alive()
+
+
+def test_file_appended(tmp_path, logger_name):
+    file = tmp_path / 'app.log'
+    file.write_text('previous run\n')
+    logger = streamlit_logger.create_logger(logger_name, file=str(file))
+    logger.info('message %d', 1)
+    flush(logger)
+
+    assert file.read_text()=='previous run\nmessage 1\n'
+
+
+def test_handlers_added_once(logger_name):
+    logger = streamlit_logger.create_logger(logger_name)
+    assert streamlit_logger.create_logger(logger_name, level=logging.DEBUG) is logger
+    assert len(logger.handlers)==1
+    assert logger.level==logging.DEBUG
+
+
+def test_file_added_later(tmp_path, logger_name):
+    logger = streamlit_logger.create_logger(logger_name)
+    file = tmp_path / 'app.log'
+    assert streamlit_logger.create_logger(logger_name, file=str(file)) is logger
+    logger.info('message')
+    flush(logger)
+
+    assert len(logger.handlers)==1
+    assert file.read_text()=='message\n'
+
+
+def test_conflicting_options_warn(tmp_path, logger_name):
+    streamlit_logger.create_logger(logger_name, file=str(tmp_path / 'a.log'))
+
+    with pytest.warns(UserWarning, match='json_format'):
+        streamlit_logger.create_logger(logger_name, json_format=True)
+    with pytest.warns(UserWarning, match='b.log'):
+        streamlit_logger.create_logger(logger_name, file=str(tmp_path / 'b.log'))
+
+
+def test_rotation(tmp_path, logger_name):
+    file = tmp_path / 'app.log'
+    logger = streamlit_logger.create_logger(logger_name, file=str(file), max_bytes=100, backup_count=2)
+    for k in range(20):
+        logger.info(f'message {k:02d} ' + 'x'*20)
+    flush(logger)
+
+    assert sorted(p.name for p in tmp_path.iterdir())==['app.log', 'app.log.1', 'app.log.2']
+    assert all(p.stat().st_size<=100 for p in tmp_path.iterdir())
+    assert file.read_text().splitlines()[-1].startswith('message 19')
+
+
+def test_json(tmp_path, logger_name, monkeypatch):
+    file = tmp_path / 'app.log'
+    logger = streamlit_logger.create_logger(logger_name, file=str(file), json_format=True)
+    monkeypatch.setattr(tracing, 'logger', logger.getChild('trace'))
+    monkeypatch.setattr(tracing, '_enabled', True)
+
+    logger.info('message %s', 'a')
+    with tracing.span('load', url='https://example.com'):
+        pass
+    try:
+        raise ValueError('bad')
+    except ValueError:
+        logger.exception('failed')
+    flush(logger)
+
+    lines = [json.loads(x) for x in file.read_text().splitlines()]
+    assert lines[0]['message']=='message a'
+    assert lines[0]['level']=='INFO'
+    assert lines[0]['logger']==logger_name
+    assert lines[0]['thread_id']==threading.get_ident()
+    assert lines[1]['logger']==logger_name+'.trace'
+    assert lines[1]['span']['name']=='load'
+    assert lines[1]['span']['url']=='https://example.com'
+    assert lines[2]['message']=='failed'
+    assert 'ValueError: bad' in lines[2]['exception']
+
+
+def test_logging_does_not_block(logger_name):
+    logger = streamlit_logger.create_logger(logger_name, queue_size=10)
+    handler = logger.handlers[0]
+    handler.listener.stop()  # Nothing reads the queue
+
+    t = threading.Thread(target=lambda: [logger.info('message') for _ in range(100)])
+    t.start()
+    t.join(5)
+
+    assert not t.is_alive()
+    assert handler.queue.dropped==90
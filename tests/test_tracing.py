@@ -0,0 +1,93 @@
+import logging
+import pytest
+import threading
+
+import tracing
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def records(monkeypatch):
+    # The app's logger does not propagate records so a handler is added directly
+    handler = ListHandler()
+    monkeypatch.setattr(tracing.logger, 'level', logging.INFO)
+    tracing.logger.addHandler(handler)
+    yield handler
+    tracing.logger.removeHandler(handler)
+
+
+@pytest.fixture
+def spans(monkeypatch, records):
+    monkeypatch.setattr(tracing, '_enabled', True)
+    def get():
+        return [r.span for r in records.records if hasattr(r, 'span')]
+    return get
+
+
+def test_disabled(monkeypatch, records):
+    monkeypatch.setattr(tracing, '_enabled', False)
+
+    with tracing.span('test', url='test.com') as s:
+        s.set(rows=10)
+
+    assert s is tracing.span('other')
+    assert tracing.current() is None
+    assert len(records.records)==0
+
+
+def test_span(spans):
+    with tracing.span('load', url='test.com') as s:
+        s.set(rows=10)
+
+    records = spans()
+    assert len(records)==1
+    assert records[0]['name']=='load'
+    assert records[0]['status']=='ok'
+    assert records[0]['url']=='test.com'
+    assert records[0]['rows']==10
+    assert records[0]['duration']>=0
+    assert records[0]['parent_id'] is None
+
+
+def test_nested(spans):
+    with tracing.span('load') as parent:
+        with tracing.span('load.count'):
+            pass
+        with tracing.span('load.fetch'):
+            pass
+
+        # Spans in other threads only have a parent if it is provided
+        def run():
+            with tracing.span('load.page', parent=parent):
+                pass
+            with tracing.span('other'):
+                pass
+        t = threading.Thread(target=run)
+        t.start()
+        t.join()
+
+    records = {r['name']:r for r in spans()}
+    assert list(records)==['load.count', 'load.fetch', 'load.page', 'other', 'load']
+    for name in ['load.count', 'load.fetch', 'load.page']:
+        assert records[name]['parent_id']==records['load']['span_id']
+        assert records[name]['trace_id']==records['load']['trace_id']
+    assert records['other']['parent_id'] is None
+    assert records['other']['trace_id']!=records['load']['trace_id']
+    assert tracing.current() is None
+
+
+def test_error(spans):
+    with pytest.raises(ValueError):
+        with tracing.span('load'):
+            raise ValueError('failed')
+
+    records = spans()
+    assert records[0]['status']=='error'
+    assert records[0]['error']=='ValueError'
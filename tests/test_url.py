@@ -0,0 +1,49 @@
+import openpolicedata as opd
+import pandas as pd
+import pytest
+
+import url
+
+@pytest.fixture
+def catalog():
+    return pd.DataFrame({
+        'State':['Virginia', 'Virginia', 'Virginia', 'California'],
+        'SourceName':['Fairfax County', 'Fairfax County', 'Richmond', 'Stockton'],
+        'TableType':['STOPS', 'USE OF FORCE - INCIDENTS', 'USE OF FORCE', 'STOPS'],
+        'Agency':['Fairfax County', 'Fairfax County', 'Richmond', 'Stockton'],
+        'Year':[2020, 'MULTIPLE', 'MULTIPLE', 2021],
+        'URL':['fairfax.gov', 'fairfax.gov', 'richmond.gov', 'stockton.gov'],
+        'dataset_id':[None, 'abcd-1234', None, None],
+    }, index=[10, 3, 7, 1])
+
+
+@pytest.mark.parametrize('state, source, table, expected', [
+    (None, None, None, 'https://openpolicedata.streamlit.app/Find_Datasets/'),
+    ('Virginia', None, None, 'https://openpolicedata.streamlit.app/Find_Datasets/?state=Virginia'),
+    ('Virginia', 'Fairfax County', 'USE OF FORCE', 'https://openpolicedata.streamlit.app/Find_Datasets/?state=Virginia&source=Fairfax County&table=USE OF FORCE'),
+    (None, 'Richmond', 'USE OF FORCE', 'https://openpolicedata.streamlit.app/Find_Datasets/?source=Richmond&table=USE OF FORCE'),
+    (None, None, 'STOPS', 'https://openpolicedata.streamlit.app/Find_Datasets/?table=STOPS'),
+    ('California', 'Fairfax County', None, None),
+    ('Virginia', 'Richmond', 'STOPS', None),
+    ('Texas', None, None, None),
+])
+def test_get_opd_explorer_dataset_url(catalog, monkeypatch, state, source, table, expected):
+    monkeypatch.setattr(opd.datasets, 'datasets', catalog)
+    assert url.get_opd_explorer_dataset_url(state, source, table)==expected
+
+
+def test_get_opd_explorer_dataset_urls(catalog):
+    filters = [('Virginia', 'Fairfax County', 'STOPS'), ('Texas', None, None), (None, 'Stockton', None)]
+
+    urls = url.get_opd_explorer_dataset_urls(filters, url_type='local', catalog=catalog)
+
+    assert urls==['http://localhost:8501/Find_Datasets/?state=Virginia&source=Fairfax County&table=STOPS', None,
+                  'http://localhost:8501/Find_Datasets/?source=Stockton']
+    df = pd.DataFrame(filters, columns=['state', 'source', 'table_type'])
+    assert url.get_opd_explorer_dataset_urls(df, url_type='local', catalog=catalog)==urls
+
+
+def test_get_opd_explorer_download_url():
+    assert url.get_opd_explorer_download_url('https://test.com/FeatureServer/0', 'abcd-1234', 2020)== \
+        'https://openpolicedata.streamlit.app/?url=https%3A%2F%2Ftest.com%2FFeatureServer%2F0&id=abcd-1234&year=2020'
+    assert url.get_opd_explorer_download_url('test.com', float('nan'), url_type='local')=='http://localhost:8501/?url=test.com'
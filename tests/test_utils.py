@@ -1,4 +1,6 @@
 import pytest
+import pandas as pd
+import pyarrow as pa
 import openpolicedata as opd
 
 import utils
@@ -85,4 +87,48 @@ def test_get_unique_urls_different_websites():
 
     u = utils.get_unique_urls(urls, ids)
 
-    assert u == ['test.com', 'nottest.com']
\ No newline at end of file
+    assert u == ['test.com', 'nottest.com']
+
+
+@pytest.mark.parametrize("data_type, url, partial",
+                         [('ArcGIS', 'https://www.test.com/FeatureServer/0', True),
+                          ('Socrata', 'www.test.com', True),
+                          ('CSV', 'https://www.test.com/test.csv', True),
+                          ('CSV', 'https://www.test.com/test.csv.zip', True),
+                          ('Excel', 'https://www.test.com/test.xlsx', False)])
+def test_test_partial_load(data_type, url, partial):
+    ds = pd.Series({'DataType':data_type, 'URL':url})
+
+    assert utils.test_partial_load(ds)==partial
+
+def test_prepare_catalog():
+    df = pd.DataFrame({
+        'State':['Texas', 'Virginia', 'California', 'Alabama'],
+        'SourceName':['A', 'B', 'C', 'D'],
+        'TableType':['STOPS']*4,
+        'min_version':[None, '-1', '0.5', '100.0'],
+    })
+
+    df_prepared = utils.prepare_catalog(df, '1.0')
+
+    assert df_prepared['State'].tolist()==['California', 'Texas']
+    assert 'version' in df_prepared.attrs
+
+
+def test_get_display_table():
+    df = pd.DataFrame({
+        'State':['Virginia', 'Texas', 'Ohio'],
+        'Year':[2020, 'MULTIPLE', 2021],
+        'dataset_id':[None, 'abcd-1234', {'id':1}],
+        'coverage_start':pd.to_datetime(['2015-01-01', None, '2020-06-30']),
+        'mixed':[1, 'a', 2.5],
+    })
+
+    tbl = utils.get_display_table(df)
+
+    assert tbl.column_names==df.columns.tolist()
+    assert tbl['Year'].to_pylist()==['2020', 'MULTIPLE', '2021']
+    assert tbl['dataset_id'].to_pylist()==['None', 'abcd-1234', "{'id': 1}"]
+    assert tbl['mixed'].to_pylist()==['1', 'a', '2.5']
+    assert tbl['coverage_start'].type.equals(pa.timestamp('ns'))
+    assert tbl.take([2, 0])['State'].to_pylist()==['Ohio', 'Virginia']
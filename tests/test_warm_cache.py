@@ -0,0 +1,88 @@
+import pandas as pd
+
+import metadata_cache
+import warm_cache
+
+LINES = [
+    "Loading preview data for 2020, STOPS, None, https://www.test.com/1, 1, Fairfax County, Virginia, Fairfax County",
+    "Selected year is 2023 with type <class 'int'>",
+    "23-06-30 20:49:41 :: Loading data for MULTIPLE, STOPS, None, https://www.test.com/1, 1, Fairfax County, Virginia, Fairfax County",
+    "Loading data for 2021, USE OF FORCE, A, www.test.org, abcd-1234, Richmond, Virginia, MULTIPLE",
+    "Loading data for 2021, USE OF FORCE, B, www.test.org, abcd-1234, Richmond, Virginia, MULTIPLE",
+    "Loading data for 2021, USE OF FORCE, B, www.test.org, abcd-1234, Richmond, Virginia, MULTIPLE",
+    "Loading data for 2019, STOPS, None, www.old.com, None, Removed, Texas, Removed",
+]
+
+CATALOG = pd.DataFrame({'SourceName':['Fairfax County', 'Richmond', 'Asheville'], 'State':['Virginia', 'Virginia', 'North Carolina'],
+                        'TableType':['STOPS', 'USE OF FORCE', 'STOPS'], 'Agency':['Fairfax County', 'MULTIPLE', 'Asheville'],
+                        'Year':['MULTIPLE', 'MULTIPLE', 'MULTIPLE'], 'DataType':['CSV', 'Socrata', 'ArcGIS'],
+                        'URL':['https://www.test.com/1', 'www.test.org', 'https://www.test.com/2'], 'dataset_id':[None, 'abcd-1234', None]})
+
+def test_read_popularity():
+    counts = warm_cache.read_popularity(LINES)
+
+    assert counts=={('Fairfax County', 'Virginia', 'STOPS', 'Fairfax County'):2, 
+                    ('Richmond', 'Virginia', 'USE OF FORCE', 'MULTIPLE'):3,
+                    ('Removed', 'Texas', 'STOPS', 'Removed'):1}
+
+
+def test_read_popularity_legacy():
+    # Older versions of the app did not log the agency
+    lines = ["***source_name=Fairfax County, state=Virginia", "Downloading data from URL", "Table type is STOPS and year is 2022"]
+
+    counts = warm_cache.read_popularity(lines*2)
+
+    assert counts=={('Fairfax County', 'Virginia', 'STOPS', None):2}
+    tasks = warm_cache.get_tasks(CATALOG, counts, top_n=10)
+    assert [(f.__name__, args) for f,args in tasks]==[('load_years', ('Fairfax County', 'Virginia', 'STOPS', 'Fairfax County'))]
+
+
+def test_log_patterns(tmp_path):
+    log_file = tmp_path / 'opd.log'
+    for path in [log_file, tmp_path / 'opd.log.1']:
+        path.write_text(LINES[2]+'\n')
+
+    patterns = warm_cache.get_log_patterns(str(log_file))
+
+    assert patterns[0]==warm_cache.LOG_PATTERN
+    assert warm_cache.read_popularity_files(patterns[1:])=={('Fairfax County', 'Virginia', 'STOPS', 'Fairfax County'):2}
+    assert warm_cache.get_log_patterns()==[warm_cache.LOG_PATTERN]
+
+
+def test_get_tasks():
+    tasks = warm_cache.get_tasks(CATALOG, warm_cache.read_popularity(LINES), top_n=10)
+
+    assert [(f.__name__, args) for f,args in tasks]==[
+        ('load_years', ('Richmond', 'Virginia', 'USE OF FORCE', 'MULTIPLE')),
+        ('load_agencies', ('Richmond', 'Virginia', 'USE OF FORCE', 'MULTIPLE', 'MULTIPLE', 'www.test.org', 'abcd-1234')),
+        ('load_years', ('Fairfax County', 'Virginia', 'STOPS', 'Fairfax County')),
+    ]
+
+    assert len(warm_cache.get_tasks(CATALOG, warm_cache.read_popularity(LINES), top_n=1))==2
+
+
+def test_warm(tmp_path, monkeypatch):
+    cache = metadata_cache.MetadataCache(metadata_cache.SQLiteBackend(str(tmp_path / 'metadata.sqlite')))
+    monkeypatch.setattr(metadata_cache, '_cache', cache)
+
+    class FakeSource:
+        def __init__(self, source_name, state=None, agency=None):
+            if source_name=='Richmond':
+                raise ValueError('Site is down')
+        def get_years(self, **kwargs):
+            return [2020, 2021]
+
+    monkeypatch.setattr(warm_cache.dashboard_utils.opd, 'Source', FakeSource)
+    catalog = CATALOG.copy()
+    catalog.attrs['version'] = 'v1'
+    log_file = tmp_path / 'log.txt'
+    log_file.write_text('\n'.join(LINES))
+
+    thread = warm_cache.start(catalog, str(tmp_path / '*.txt'), top_n=10)
+    thread.join(10)
+
+    # Lookups with the same inputs as the page are loaded from the cache
+    monkeypatch.setattr(warm_cache.dashboard_utils.opd, 'Source', None)
+    years = warm_cache.dashboard_utils.load_years('Fairfax County', 'Virginia', 'STOPS', 'Fairfax County', catalog_version='v1')
+    assert years==['2021', '2020']
+    assert cache.hits==1
@@ -0,0 +1,144 @@
+from functools import partial
+import numpy as np
+import pandas as pd
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import threading
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from openpolicedata import data_loaders
+import utils
+import zipped_csv
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    # Local stand-in for a server that supports HTTP range requests
+    requests = []
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        byte_range = self.headers.get('Range')
+        RangeRequestHandler.requests.append(byte_range)
+        if not byte_range:
+            return super().do_GET()
+        
+        with open(self.translate_path(self.path), 'rb') as f:
+            data = f.read()
+
+        start, stop = byte_range.replace('bytes=','').split('-')
+        if start=='':
+            start = max(len(data)-int(stop), 0)
+            stop = len(data)-1
+        else:
+            start = int(start)
+            stop = min(int(stop), len(data)-1)
+
+        self.send_response(206)
+        self.send_header('Content-Range', f'bytes {start}-{stop}/{len(data)}')
+        self.send_header('Content-Length', str(stop-start+1))
+        self.end_headers()
+        self.wfile.write(data[start:stop+1])
+
+
+def start_server(directory, handler):
+    handler = partial(handler, directory=str(directory))
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    return httpd
+
+
+@pytest.fixture()
+def server(tmp_path):
+    # Local HTTP server for files in tmp_path that does not support range requests
+    class Handler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+    httpd = start_server(tmp_path, Handler)
+
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture()
+def range_server(tmp_path):
+    # Local HTTP server for files in tmp_path that supports range requests
+    RangeRequestHandler.requests = []
+    httpd = start_server(tmp_path, RangeRequestHandler)
+
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def make_zip(path, text, name='data.csv'):
+    with ZipFile(path, 'w', ZIP_DEFLATED) as z:
+        z.writestr(name, text)
+
+
+@pytest.mark.parametrize('text', [b'', b'a,b\n', b'a,b\n1,2\n3,4\n', b'a,b\n1,2\n3,4', b'a,b\n1,2\n3,4\n\n\n',
+                                  b'a,b\n1,"x\ny"\n3,4\n', b'a,b\n' + b'1,"2"\n'*1000])
+def test_count_csv_rows(tmp_path, text):
+    path = tmp_path / 'test.csv'
+    path.write_bytes(text)
+
+    count = zipped_csv.count_csv_rows(str(path), block_size=16)
+
+    assert count==(data_loaders.csv_class.count_csv_rows(text) if len(text)>0 else 0)
+
+
+def test_download_and_extract(tmp_path, server):
+    text = b'a,b\n' + b''.join(f'{k},{k**2}\n'.encode() for k in range(10000))
+    make_zip(tmp_path / 'test.csv.zip', text)
+
+    with zipped_csv.download(server+'/test.csv.zip') as f:
+        data = b''.join(zipped_csv.iter_member(f, block_size=1000))
+
+    assert data==text
+
+
+def test_multiple_files(tmp_path):
+    with ZipFile(tmp_path / 'test.zip', 'w') as z:
+        z.writestr('1.csv', 'a\n1\n')
+        z.writestr('2.csv', 'a\n1\n')
+
+    with pytest.raises(ValueError):
+        list(zipped_csv.iter_member(tmp_path / 'test.zip'))
+
+
+def test_read_preview(tmp_path, range_server):
+    # Random data so that the file does not compress well
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'a':rng.integers(0, 10**9, 500000), 'b':rng.random(500000)})
+    make_zip(tmp_path / 'test.csv.zip', df.to_csv(index=False).encode())
+    size = (tmp_path / 'test.csv.zip').stat().st_size
+
+    df_prev = zipped_csv.read_preview(range_server+'/test.csv.zip', 10)
+
+    pd.testing.assert_frame_equal(df_prev, df.head(10))
+    assert zipped_csv.supports_ranges(range_server+'/test.csv.zip')
+    assert RangeRequestHandler.requests[0]==f'bytes=-{zipped_csv.TAIL_SIZE}'  # Central directory
+    # Only the beginning of the file should be downloaded
+    downloaded = zipped_csv.TAIL_SIZE + zipped_csv.READ_SIZE*(len(RangeRequestHandler.requests)-1)
+    assert downloaded < size/5
+
+
+def test_read_preview_small_file(tmp_path, range_server):
+    make_zip(tmp_path / 'test.csv.zip', b'a,b\n1,2\n3,4\n')
+
+    df_prev = zipped_csv.read_preview(range_server+'/test.csv.zip', 10)
+
+    pd.testing.assert_frame_equal(df_prev, pd.DataFrame({'a':[1,3], 'b':[2,4]}))
+
+
+def test_read_preview_ranges_not_supported(tmp_path, server):
+    make_zip(tmp_path / 'test.csv.zip', b'a,b\n1,2\n3,4\n')
+
+    with pytest.raises(zipped_csv.RangeNotSupported):
+        zipped_csv.read_preview(server+'/test.csv.zip', 10)
+    # Entire file is loaded for later previews
+    assert zipped_csv.supports_ranges(server+'/test.csv.zip')==False
+    assert not utils.test_partial_load(pd.Series({'DataType':'CSV', 'URL':server+'/test.csv.zip'}))
@@ -0,0 +1,109 @@
+'''Lightweight tracing of the stages of slow operations (such as loading data)
+
+Spans time a stage and are tagged with information about it (such as the dataset URL, number of rows, and bytes).
+When a span ends, it is logged as a structured record with the logger opd-app.trace. The logger is a child of the app's
+logger (see streamlit_logger.create_logger) so records are written by its handlers. The span's fields are in the
+record's span attribute.
+
+Tracing is disabled unless the OPD_EXPLORER_TRACING environment variable is set to 1 or enable is called.
+When disabled, span returns a shared object that does nothing.
+
+    with tracing.span('load.count', url=url) as s:
+        count = get_count()
+        s.set(rows=count)
+'''
+import contextvars
+import itertools
+import logging
+import os
+import time
+
+_enabled = os.environ.get('OPD_EXPLORER_TRACING', '0').lower() in ['1', 'true']
+logger = logging.getLogger('opd-app.trace')
+
+_current = contextvars.ContextVar('opd_explorer_span', default=None)
+_ids = itertools.count(1)
+
+def enable(enabled=True):
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled():
+    return _enabled
+
+
+class _NoopSpan:
+    # Returned by span when tracing is disabled
+    def set(self, **tags):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    '''Timed stage of an operation. Spans started inside another span (in the same thread unless parent is provided)
+    are its children and share its trace ID.'''
+    __slots__ = ('name', 'tags', 'span_id', 'parent_id', 'trace_id', 'start', '_t0', '_token')
+    def __init__(self, name, tags, parent=None):
+        self.name = name
+        self.tags = tags
+        self.span_id = next(_ids)
+        parent = parent if isinstance(parent, Span) else _current.get()
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+
+
+    def set(self, **tags):
+        '''Add or update tags'''
+        self.tags.update(tags)
+
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._t0
+        _current.reset(self._token)
+        record = {
+            'name':self.name,
+            'trace_id':self.trace_id,
+            'span_id':self.span_id,
+            'parent_id':self.parent_id,
+            'start':self.start,
+            'duration':duration,
+            'status':'ok' if exc_type is None else 'error',
+            **self.tags
+        }
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+
+        tags = ' '.join(f'{k}={v}' for k,v in self.tags.items())
+        logger.info(f"TRACE {self.name} {1000*duration:.1f} ms {record['status']} {tags}".rstrip(), extra={'span':record})
+        return False
+
+
+def span(name, parent=None, **tags):
+    '''Returns a context manager that times a stage named name. Keyword inputs are tags.
+
+    parent is the parent span for spans started in other threads, which do not see the current span of the thread that started them.
+    '''
+    if not _enabled:
+        return _NOOP
+    return Span(name, tags, parent)
+
+
+def current():
+    '''Returns the current span of this thread or None'''
+    return _current.get() if _enabled else None
+
@@ -1,6 +1,25 @@
+import threading
+from urllib.parse import urlencode
 import openpolicedata as opd
+import pandas as pd
+
+import catalog_index
 import utils
 
+_index = None  # (catalog, index of catalog)
+_index_lock = threading.Lock()
+
+def _get_index(catalog=None):
+    # Index of the catalog is only rebuilt if the catalog is replaced (i.e. by opd.datasets.reload)
+    global _index
+    if catalog is None:
+        catalog = opd.datasets.datasets if isinstance(opd.datasets.datasets, pd.DataFrame) else opd.datasets.query()
+    with _index_lock:
+        if _index is None or _index[0] is not catalog:
+            _index = (catalog, catalog_index.CatalogIndex(catalog.reset_index(drop=True)))
+        return _index[1]
+
+
 def get_opd_explorer_dataset_url(state=None, source=None, table_type=None, url_type=None):
     '''Return URL that will go to default page and/or filters of OPD Explorer (https://openpolicedata.streamlit.app)
     If set, inputs state, source, and/or table_type will be appended to the URL to go to a filtered view of the OPD Explorer dataset finder page.
@@ -27,28 +46,82 @@ def get_opd_explorer_dataset_url(state=None, source=None, table_type=None, url_t
 
     '''
 
-    url = 'https://openpolicedata.streamlit.app' if url_type!='local' else 'http://localhost:8501'
+    return get_opd_explorer_dataset_urls([(state, source, table_type)], url_type=url_type)[0]
+
+
+def get_opd_explorer_dataset_urls(filters, url_type=None, catalog=None):
+    '''Return URLs that will go to filtered views of the OPD Explorer dataset finder page for many filters at once.
+    See get_opd_explorer_dataset_url.
+
+    Parameters
+        ----------
+        filters : list[tuple] | pd.DataFrame
+            (state, source, table_type) for each URL. None (or a missing value) for any of these is the same as not setting it 
+            in get_opd_explorer_dataset_url. DataFrames must contain state, source, and table_type columns.
+        url_type : str
+            If set to 'local', the URLs will be for running Streamlit locally: http://localhost:8501/, by default None
+        catalog : pd.DataFrame
+            Data catalog to check filters against, by default opd.datasets.query()
+
+        Returns
+        -------
+        list[str | None]
+            URL for each filter if the filter will find datasets and None if not
+    '''
+    if isinstance(filters, pd.DataFrame):
+        filters = zip(filters['state'], filters['source'], filters['table_type'])
+
+    index = _get_index(catalog)
+
+    base_url = 'https://openpolicedata.streamlit.app' if url_type!='local' else 'http://localhost:8501'
+    base_url += '/Find_Datasets/'
+
+    urls = []
+    for f in filters:
+        f = [x if isinstance(x, str) and len(x)>0 else None for x in f]
+        path = [x if x else utils.ALL for x in f]
+        if len(index.rows(*path))==0:
+            urls.append(None)
+            continue
 
-    url += '/Find_Datasets/'
+        url = base_url
+        pre = '?'
+        for name, value in zip(['state', 'source', 'table'], f):
+            if value:
+                url+=pre+name+'='+value
+                pre = '&'
+        urls.append(url)
 
-    df = opd.datasets.query()
+    return urls
 
-    pre = '?'
-    if state:
-        df = df[df['State']==state]
-        url+=pre+'state'+'='+state
-        pre = '&'
 
-    if source:
-        df = df[df['SourceName']==source]
-        url+=pre+'source'+'='+source
-        pre = '&'
+def get_opd_explorer_download_url(url, dataset_id=None, year=None, url_type=None):
+    '''Return URL that will go directly to a dataset on the download page of OPD Explorer (https://openpolicedata.streamlit.app)
+
+    Parameters
+        ----------
+        url : str
+            URL of dataset (URL column of the OpenPoliceData source table)
+        dataset_id : str
+            Dataset ID of dataset (dataset_id column of the OpenPoliceData source table). Only required if multiple datasets 
+            have the same URL, by default None
+        year : str | int
+            Year to select. Set to None for the most recent year or the dataset's year if it only contains 1 year, by default None
+        url_type : str
+            If set to 'local', the URL will be for running Streamlit locally: http://localhost:8501/, by default None
+
+        Returns
+        -------
+        str
+            URL
+    '''
 
-    if table_type:
-        df['TableTypeGeneral'],_,_ = utils.split_tables(df['TableType'].tolist())
-        df = df[df['TableTypeGeneral']==table_type]
-        url+=pre+'table'+'='+table_type
-        pre = '&'
+    explorer_url = 'https://openpolicedata.streamlit.app' if url_type!='local' else 'http://localhost:8501'
 
-    return url if len(df)>0 else None
+    query = {'url':url}
+    if dataset_id is not None and not pd.isnull(dataset_id):
+        query['id'] = str(dataset_id)
+    if year is not None:
+        query['year'] = str(year)
 
+    return explorer_url + '/?' + urlencode(query)
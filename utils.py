@@ -1,6 +1,11 @@
+import hashlib
+from packaging import version
 import re
 from urllib.parse import urlparse
 import pandas as pd
+import pyarrow as pa
+
+import zipped_csv
 
 NA_DISPLAY_VALUE = "NOT APPLICABLE"
 ALL = "---ALL---"
@@ -45,6 +50,11 @@ def split_tables(table_types):
     return table_type_general, table_type_general_sort, table_types_sub
 
 
+def join_tables(table_type_general, table_type_sub):
+    # Inverse of split_tables
+    return table_type_general if table_type_sub is None else f'{table_type_general} - {table_type_sub}'
+
+
 def get_unique_urls(urls, dataset_ids):
     if isinstance(urls, str):
         urls = [urls]
@@ -81,6 +91,42 @@ def test_partial_load(ds):
     is_csv = ds['DataType']=='CSV'
     is_zipped = ds['URL'].endswith('.zip')
 
-    load_all = not_api and (not is_csv or is_zipped)
-
-    return not load_all
\ No newline at end of file
+    # Previews of zipped CSV files only download the part of the file that is needed unless the server
+    # is known to not support range requests
+    load_all = not_api and (not is_csv or (is_zipped and zipped_csv.supports_ranges(ds['URL'])==False))
+
+    return not load_all
+
+
+def get_catalog_version(df):
+    # Hash of the contents of the data catalog. Used to identify when the catalog has changed
+    h = pd.util.hash_pandas_object(df.astype(str), index=False)
+    return hashlib.sha256(h.values.tobytes()).hexdigest()[:16]
+
+
+def prepare_catalog(df, opd_version):
+    # Remove min_version = -1 (not available in any version) or min_version > current version.
+    # Versions are only parsed once for each unique value
+    current = version.parse(opd_version)
+    min_versions = df["min_version"].astype(object)
+    allowed = {x:x.strip()!="-1" and current >= version.parse(x) for x in min_versions.dropna().unique()}
+    df = df[min_versions.isna() | min_versions.map(allowed).eq(True)]
+    df = df.sort_values(by=["State","SourceName","TableType"])
+    # attrs are kept when the catalog is filtered so the version is available wherever datasets are selected
+    df.attrs['version'] = get_catalog_version(df)
+    return df
+
+
+def get_display_table(df):
+    # Arrow table of the catalog for display with st.dataframe. Year and dataset_id contain mixed types that cause
+    # pyarrow errors so they are displayed as strings, as are any other columns that pyarrow cannot convert.
+    arrays = []
+    for c in df.columns:
+        col = df[c]
+        if c in ['Year', 'dataset_id']:
+            col = col.astype(str)
+        try:
+            arrays.append(pa.Array.from_pandas(col))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.Array.from_pandas(col.astype(str)))
+    return pa.Table.from_arrays(arrays, names=[str(c) for c in df.columns])
@@ -0,0 +1,123 @@
+'''Prefetch year and agency information for the most popular datasets so that the first users after a restart
+do not wait on slow requests to agency sites. Popularity is determined from the loads in log files (see log_analytics),
+including logs written by older versions of the app, which do not include the agency.
+
+Run in the background by opd_download_page.py on startup (using the logs in logs/ and the file set with --log-file)
+or run directly:
+    python warm_cache.py --logs "logs/*.txt" "opd.log*" --top 50
+'''
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import logging
+import os
+import threading
+
+import openpolicedata as opd
+
+import dashboard_utils
+import log_analytics
+import utils
+
+LOG_PATTERN = os.environ.get('OPD_EXPLORER_POPULARITY_LOGS', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', '*.txt'))
+TOP_N = int(os.environ.get('OPD_EXPLORER_WARM_TOP_N', 50))  # Number of datasets to prefetch. Set to 0 to disable
+MAX_WORKERS = 4
+
+def read_popularity(lines):
+    '''Count the number of loads of each dataset in log lines. Datasets are identified by
+    (SourceName, State, TableType, Agency). Agency is None for loads logged by older versions of the app.'''
+    counts = Counter()
+    for load in log_analytics.LogAnalyzer().feed(lines).loads:
+        if load.dataset[2] is not None:
+            counts[load.dataset]+=1
+    return counts
+
+
+def read_popularity_files(patterns=LOG_PATTERN):
+    '''Count loads in the log files matching a glob pattern or list of glob patterns (such as a log file and
+    its rotated files)'''
+    counts = Counter()
+    for pattern in [patterns] if isinstance(patterns, str) else patterns:
+        for path in glob.glob(pattern):
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                counts.update(read_popularity(f))
+    return counts
+
+
+def get_log_patterns(log_file=None):
+    '''Returns patterns of the log files used to determine popularity: LOG_PATTERN and log_file (the file that
+    the app writes logs to) and its rotated files'''
+    return [LOG_PATTERN] + ([glob.escape(log_file)+'*'] if log_file else [])
+
+
+def get_tasks(catalog, counts, top_n=TOP_N):
+    '''Returns the metadata lookups needed for the top_n most popular datasets in the catalog as
+    (function, arguments) in order of popularity'''
+    tasks = []
+    for (source, state, table, agency), _ in counts.most_common(top_n):
+        rows = catalog[(catalog['SourceName']==source) & (catalog['State']==state) & (catalog['TableType']==table)]
+        if agency is not None:
+            rows = rows[rows['Agency']==agency]
+        if len(rows)==0:
+            # Dataset is no longer in the catalog
+            continue
+
+        # Arguments must match the calls in 1_Download_Data.py so that the cache keys match
+        for agency in rows['Agency'].unique():
+            task = (dashboard_utils.load_years, (source, state, table, agency))
+            if task not in tasks:
+                tasks.append(task)
+        for _, row in rows.iterrows():
+            if row['Agency']==opd.defs.MULTI and row['DataType'] in utils.API_DATA_TYPES:
+                tasks.append((dashboard_utils.load_agencies, (source, state, table, row['Year'], row['Agency'], row['URL'], row['dataset_id'])))
+
+    return tasks
+
+
+def warm(catalog, counts, top_n=TOP_N, max_workers=MAX_WORKERS, logger=None):
+    '''Run the metadata lookups for the most popular datasets concurrently. Returns the number of successful lookups'''
+    logger = logger if logger else logging.getLogger('opd-app')
+    tasks = get_tasks(catalog, counts, top_n)
+    version = catalog.attrs.get('version')
+
+    def run(fcn, args):
+        try:
+            fcn(*args, catalog_version=version)
+            return True
+        except Exception as e:
+            logger.debug(f"Unable to prefetch {fcn.__name__}{args}: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        nsuccess = sum(pool.map(lambda x: run(*x), tasks))
+
+    logger.info(f"Prefetched metadata for {nsuccess} of {len(tasks)} lookups for the {top_n} most popular datasets")
+    return nsuccess
+
+
+def start(catalog, patterns=LOG_PATTERN, top_n=TOP_N, logger=None):
+    '''Warm the metadata cache in a background thread so that it does not block rendering of the page. patterns
+    are the patterns of the log files used to determine popularity (see read_popularity_files).'''
+    logger = logger if logger else logging.getLogger('opd-app')
+    def run():
+        try:
+            warm(catalog, read_popularity_files(patterns), top_n, logger=logger)
+        except Exception as e:
+            logger.exception('Cache warm-up failed', exc_info=e)
+
+    t = threading.Thread(target=run, daemon=True, name='warm_cache')
+    if top_n>0:
+        t.start()
+    return t
+
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Prefetch year and agency information for the most popular datasets')
+    parser.add_argument('--logs', nargs='+', default=[LOG_PATTERN], help='Glob patterns of log files used to determine popularity')
+    parser.add_argument('--top', type=int, default=TOP_N, help='Number of datasets to prefetch')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    catalog = utils.prepare_catalog(opd.datasets.query(), opd.__version__)
+    warm(catalog, read_popularity_files(args.logs), args.top, logger=logging.getLogger(__name__))
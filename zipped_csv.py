@@ -0,0 +1,182 @@
+import io
+import mmap
+import os
+import re
+import tempfile
+from zipfile import ZipFile
+
+import numpy as np
+from openpolicedata import data_loaders
+import pandas as pd
+import requests
+
+BLOCK_SIZE = 2**20
+TAIL_SIZE = 2**16  # Size of end of file read initially. Should contain the zip file's central directory for single-file zip files
+READ_SIZE = 2**18  # Minimum size of each range request
+TIMEOUT = 30  # Seconds to wait for the server to respond
+
+_range_support = {}  # URL -> whether its server supports range requests. Set by read_preview
+
+class RangeNotSupported(Exception):
+    pass
+
+
+class HttpRangeFile(io.RawIOBase):
+    '''Read-only, seekable file whose contents are requested from a URL with HTTP range requests
+
+    The end of the file is requested when the file is opened, which returns the file size and 
+    the zip file central directory in a single request.
+    '''
+    def __init__(self, url, session=None, timeout=TIMEOUT):
+        self.url = url
+        self.session = session if session else requests.Session()
+        self.timeout = timeout
+        self.pos = 0
+        self.nrequests = 0
+
+        data, start, self.size = self._request(f'bytes=-{TAIL_SIZE}')
+        self._tail = data
+        self._tail_start = start
+
+
+    def _request(self, byte_range):
+        self.nrequests+=1
+        # Stream response so that the body is not downloaded if the server ignores the range and returns the entire file
+        with self.session.get(self.url, headers={'Range':byte_range}, timeout=self.timeout, stream=True) as r:
+            r.raise_for_status()
+            if r.status_code!=206:
+                raise RangeNotSupported(f"Server does not support range requests for {self.url}")
+            
+            m = re.match(r'bytes (\d+)-(\d+)/(\d+)', r.headers.get('Content-Range', ''))
+            if not m:
+                raise RangeNotSupported(f"Unable to parse Content-Range header from {self.url}")
+            
+            return r.content, int(m.group(1)), int(m.group(3))
+    
+
+    def readable(self):
+        return True
+    
+
+    def seekable(self):
+        return True
+    
+
+    def tell(self):
+        return self.pos
+    
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence==io.SEEK_SET:
+            self.pos = offset
+        elif whence==io.SEEK_CUR:
+            self.pos+=offset
+        elif whence==io.SEEK_END:
+            self.pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self.pos
+
+
+    def readinto(self, b):
+        n = min(len(b), self.size - self.pos)
+        if n<=0:
+            return 0
+
+        if self.pos >= self._tail_start:
+            k = self.pos - self._tail_start
+            data = self._tail[k:k+n]
+        else:
+            data, _, _ = self._request(f'bytes={self.pos}-{self.pos+n-1}')
+
+        b[:len(data)] = data
+        self.pos+=len(data)
+        return len(data)
+
+
+def read_preview(url, nrows, session=None):
+    '''Read the first nrows rows of the only CSV file in a zipped CSV file at url with HTTP range requests. 
+    Only the zip file's central directory and enough of the CSV file to read nrows rows are downloaded.
+
+    Raises RangeNotSupported if the server does not support range requests
+    '''
+    try:
+        raw = HttpRangeFile(url, session=session)
+        with io.BufferedReader(raw, buffer_size=READ_SIZE) as f, ZipFile(f, 'r') as z:
+            names = z.namelist()
+            if len(names)>1:
+                raise ValueError(f"More than 1 file found in zip file: {names}")
+            
+            with z.open(names[0]) as member:
+                df = pd.read_csv(member, encoding_errors='surrogateescape', nrows=nrows)
+    except RangeNotSupported:
+        _range_support[url] = False
+        raise
+
+    _range_support[url] = True
+    return df
+
+
+def supports_ranges(url):
+    '''Returns whether previews of the zipped CSV file at url can be loaded with range requests (see read_preview)
+    or None if it is not known because no preview has been loaded'''
+    return _range_support.get(url)
+
+
+def download(url, block_size=BLOCK_SIZE, timeout=TIMEOUT):
+    '''Download a zip file to a temporary file instead of memory. Returns the open temporary file'''
+    f = tempfile.TemporaryFile()
+    try:
+        with requests.get(url, stream=True, timeout=timeout) as r:
+            r.raise_for_status()
+            for data in r.iter_content(block_size):
+                f.write(data)
+    except:
+        f.close()
+        raise
+
+    f.seek(0)
+    return f
+
+
+def iter_member(zip_file, block_size=BLOCK_SIZE):
+    '''Yield the decompressed contents of the only file in a zip file in blocks'''
+    with ZipFile(zip_file, 'r') as z:
+        names = z.namelist()
+        if len(names)>1:
+            raise ValueError(f"More than 1 file found in zip file: {names}")
+
+        with z.open(names[0]) as f:
+            while (data:=f.read(block_size)):
+                yield data
+
+
+def count_csv_rows(path, block_size=2**26):
+    '''Count the number of data rows in a CSV file without reading the whole file into memory
+
+    The file is memory-mapped and newlines are counted with numpy. If the file contains quotes,
+    which may contain newlines, OpenPoliceData's quote-aware row counting is used instead.
+    '''
+    if os.path.getsize(path)==0:
+        return 0
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        blocks = range(0, len(m), block_size)
+        data = np.frombuffer(m, dtype=np.uint8)
+        try:
+            has_quotes = any(np.count_nonzero(data[k:k+block_size]==ord('"')) for k in blocks)
+            if not has_quotes:
+                count = sum(np.count_nonzero(data[k:k+block_size]==ord('\n')) for k in blocks)
+                # Subtract off trailing newlines in last row
+                k = len(data)-1
+                while k>=0 and data[k]==ord('\n'):
+                    count-=1
+                    k-=1
+        finally:
+            # Buffer must be released before the memory map can be closed
+            del data
+
+        if has_quotes:
+            count = data_loaders.csv_class.count_csv_rows(m[k:k+block_size] for k in blocks)
+
+    return int(count)